@@ -0,0 +1,241 @@
+import os
+import glob
+import numpy as np
+import pandas as pd
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyproj import Transformer
+
+from spatial_index import project
+
+
+ACCIDENTS_PATH = '../data/road_accident.csv'
+
+# Accident rows read, converted and snapped at a time
+ACCIDENT_CHUNK_SIZE = 250_000
+
+# Accident score per casualty, as in set_network_attr.ipynb
+SEVERITY_SCORES = {'Slight': 0.1, 'Serious': 0.5, 'Fatal': 1.0}
+# STATS19 severity codes
+SEVERITY_CODES = {1: 'Fatal', 2: 'Serious', 3: 'Slight'}
+
+# Source column names of each canonical column: the London extract first, then the DfT STATS19
+# collision files (old and new naming), then the canonical names written by this module
+ACCIDENT_COLUMNS = {
+    'lat': ['Latitude', 'latitude', 'lat'],
+    'lon': ['Longitude', 'longitude', 'lon'],
+    'easting': ['Easting', 'location_easting_osgr', 'Location_Easting_OSGR'],
+    'northing': ['Northing', 'location_northing_osgr', 'Location_Northing_OSGR'],
+    'casualty_count': ['_Casualty Count', 'number_of_casualties', 'Number_of_Casualties', 'casualty_count'],
+    'severity': ['_Casualty Severity', 'accident_severity', 'collision_severity', 'Accident_Severity', 'severity'],
+    'date': ['Date', 'date', 'accident_date'],
+}
+
+NUMBER_COLUMNS = ('lat', 'lon', 'easting', 'northing', 'casualty_count')
+
+# Accidents further than this outside the network's bounding box are not snapped, so national
+# extracts only keep the accidents of the mapped area
+BOUNDS_MARGIN_M = 500.0
+
+_bng_transformer = None
+
+
+def bng_to_wgs84(eastings, northings):
+    """
+    Convert British National Grid (EPSG:27700) arrays to (lat, lon) arrays in one call
+    """
+    global _bng_transformer
+    if _bng_transformer is None:
+        _bng_transformer = Transformer.from_crs("EPSG:27700", "EPSG:4326", always_xy=True)
+    lons, lats = _bng_transformer.transform(np.asarray(eastings, dtype=np.float64),
+                                            np.asarray(northings, dtype=np.float64))
+    return lats, lons
+
+
+def resolve_columns(header):
+    """
+    Map each canonical accident column to the matching column of a file header. A file needs
+    Latitude/Longitude or Easting/Northing columns.
+    """
+    columns = {}
+    for name, aliases in ACCIDENT_COLUMNS.items():
+        for alias in aliases:
+            if alias in header:
+                columns[name] = alias
+                break
+    if not ({'lat', 'lon'} <= set(columns) or {'easting', 'northing'} <= set(columns)):
+        raise ValueError(f"No coordinate columns (latitude/longitude or easting/northing) in {list(header)}")
+    return columns
+
+
+def _number_column(chunk, columns, name):
+    if name not in columns:
+        return np.full(len(chunk), np.nan)
+    return pd.to_numeric(chunk[columns[name]], errors='coerce').values.astype(np.float64)
+
+
+def normalize_accidents(chunk, columns):
+    """
+    Canonical accident rows of one chunk: lat, lon (converted from easting/northing where missing),
+    casualty_count (a missing count is 0), severity, accident_score (-count * SEVERITY_SCORES[severity],
+    like set_network_attr.ipynb) and date (NaT when the file has none)
+    """
+    lats, lons = _number_column(chunk, columns, 'lat'), _number_column(chunk, columns, 'lon')
+    missing = np.isnan(lats) | np.isnan(lons)
+    if missing.any() and 'easting' in columns:
+        eastings = _number_column(chunk, columns, 'easting')[missing]
+        northings = _number_column(chunk, columns, 'northing')[missing]
+        lats[missing], lons[missing] = bng_to_wgs84(eastings, northings)
+
+    counts = np.nan_to_num(_number_column(chunk, columns, 'casualty_count'), nan=0.0).astype(np.int64)
+    if 'severity' in columns:
+        severity = chunk[columns['severity']]
+        codes = pd.to_numeric(severity, errors='coerce')
+        severity = severity.astype(object).where(codes.isna(), codes.map(SEVERITY_CODES))
+    else:
+        severity = pd.Series(None, index=chunk.index, dtype=object)
+    if 'date' in columns:
+        # STATS19 dates are dd/mm/yyyy, canonical files are ISO; each distinct date is parsed once
+        codes, raw = pd.factorize(chunk[columns['date']])
+        raw = pd.Series(raw, dtype=object)
+        dates = pd.to_datetime(raw, format='%d/%m/%Y', errors='coerce')
+        unparsed = dates.isna().values
+        if unparsed.any():
+            dates[unparsed] = pd.to_datetime(raw[unparsed], format='ISO8601', errors='coerce')
+        dates = pd.Series(np.append(dates.values.astype('datetime64[ns]'), np.datetime64('NaT', 'ns'))[codes],
+                          index=chunk.index)
+    else:
+        dates = pd.Series(pd.NaT, index=chunk.index, dtype='datetime64[ns]')
+
+    return pd.DataFrame({
+        'lat': lats,
+        'lon': lons,
+        'casualty_count': counts,
+        'severity': severity.values.astype(object),
+        'accident_score': -counts * severity.map(SEVERITY_SCORES).fillna(0.0).values.astype(np.float64),
+        'date': dates.values.astype('datetime64[ns]'),
+    })
+
+
+def read_accident_chunks(source, chunk_size=ACCIDENT_CHUNK_SIZE, names=None):
+    """
+    Yield canonical accident rows of a CSV file (path or open binary file) chunk by chunk. names gives
+    the header when reading from the middle of a file.
+    """
+    header = names if names is not None else list(pd.read_csv(source, nrows=0).columns)
+    columns = resolve_columns(header)
+    # numbers are parsed by the CSV reader; STATS19 marks missing values as NULL
+    dtypes = {column: np.float64 if name in NUMBER_COLUMNS else object for name, column in columns.items()}
+    options = {'header': None, 'names': names} if names is not None else {}
+    reader = pd.read_csv(source, usecols=list(columns.values()), dtype=dtypes, na_values=['NULL'],
+                         chunksize=chunk_size, **options)
+    for chunk in reader:
+        yield normalize_accidents(chunk, columns)
+
+
+class EdgeSnapper:
+    """
+    Nearest-edge lookups against the edge rows of a GraphTables (STR-tree over projected geometries)
+    """
+
+    def __init__(self, tables):
+        self.lat0 = float(np.mean(tables.numeric('nodes', 'y'))) if len(tables.nodes) else 0.0
+        geoms = shapely.transform(tables.edge_geometries(),
+                                  lambda coords: np.column_stack(project(coords[:, 1], coords[:, 0], self.lat0)))
+        self.tree = shapely.STRtree(geoms)
+        self.n_edges = len(geoms)
+        self.bounds = shapely.total_bounds(geoms) if self.n_edges else None
+
+    def nearest_edges(self, lats, lons, margin=BOUNDS_MARGIN_M):
+        """
+        Return (edge rows, distances in metres) of the nearest edge to each coordinate; -1 for
+        coordinates that are missing or further than margin outside the network's bounding box
+        """
+        x, y = project(lats, lons, self.lat0)
+        edges = np.full(len(x), -1, dtype=np.int64)
+        distances = np.full(len(x), np.inf)
+        if not self.n_edges:
+            return edges, distances
+        inside = ~(np.isnan(x) | np.isnan(y))
+        if margin is not None:
+            min_x, min_y, max_x, max_y = self.bounds
+            inside &= (x >= min_x - margin) & (x <= max_x + margin) & (y >= min_y - margin) & (y <= max_y + margin)
+        candidates = np.flatnonzero(inside)
+        (point_idx, edge_idx), dists = self.tree.query_nearest(shapely.points(x[candidates], y[candidates]),
+                                                               return_distance=True, all_matches=False)
+        edges[candidates[point_idx]] = edge_idx
+        distances[candidates[point_idx]] = dists
+        return edges, distances
+
+
+SNAPPED_SCHEMA = pa.schema([
+    ('edge', pa.int64()),
+    ('distance', pa.float64()),
+    ('casualty_count', pa.int64()),
+    ('severity', pa.string()),
+    ('accident_score', pa.float64()),
+    ('date', pa.timestamp('ns')),
+])
+
+
+def ingest_accidents(source, snapper, out_path, chunk_size=ACCIDENT_CHUNK_SIZE, names=None, margin=BOUNDS_MARGIN_M):
+    """
+    Stream accident rows from source, snap each chunk to the nearest edges and write the snapped rows
+    to the parquet file out_path, one row group per chunk. Return (rows read, rows snapped).
+    """
+    n_rows = n_snapped = 0
+    with pq.ParquetWriter(out_path, SNAPPED_SCHEMA) as writer:
+        for accidents in read_accident_chunks(source, chunk_size, names):
+            edges, distances = snapper.nearest_edges(accidents['lat'].values, accidents['lon'].values, margin)
+            snapped = edges >= 0
+            table = pd.DataFrame({'edge': edges[snapped], 'distance': distances[snapped]})
+            for name in ('casualty_count', 'severity', 'accident_score', 'date'):
+                table[name] = accidents[name].values[snapped]
+            writer.write_table(pa.Table.from_pandas(table, schema=SNAPPED_SCHEMA, preserve_index=False))
+            n_rows += len(accidents)
+            n_snapped += int(snapped.sum())
+    return n_rows, n_snapped
+
+
+def snapped_parts(path):
+    """
+    Snapped accident files of a directory, in the order they were ingested
+    """
+    return sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+
+
+def edge_accident_totals(paths, n_edges):
+    """
+    accident_score and casualty_count summed per edge over snapped accident files, one row group at a time.
+    Accidents are added in file order (np.add.at), so the totals do not depend on how the rows were chunked.
+    """
+    accident_score = np.zeros(n_edges)
+    casualty_count = np.zeros(n_edges, dtype=np.int64)
+    for path in paths:
+        parquet = pq.ParquetFile(path)
+        for group in range(parquet.num_row_groups):
+            table = parquet.read_row_group(group, columns=['edge', 'casualty_count', 'accident_score'])
+            edges = table.column('edge').to_numpy()
+            np.add.at(accident_score, edges, table.column('accident_score').to_numpy())
+            np.add.at(casualty_count, edges, table.column('casualty_count').to_numpy())
+    return accident_score, casualty_count
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert an accident file (London extract or STATS19) to "
+                                                 "canonical WGS84 rows, streaming in chunks")
+    parser.add_argument('source')
+    parser.add_argument('out')
+    parser.add_argument('--chunk-size', type=int, default=ACCIDENT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    n_rows = 0
+    for i, accidents in enumerate(read_accident_chunks(args.source, args.chunk_size)):
+        accidents.to_csv(args.out, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        n_rows += len(accidents)
+    print(f"Converted {n_rows} accidents to {args.out} in {time.time() - start_time:.2f} sec")
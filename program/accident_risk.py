@@ -0,0 +1,241 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pyarrow.parquet as pq
+
+from accident_ingest import SEVERITY_SCORES, SEVERITY_CODES
+from graph_snapshot import snapshot_edge_order
+
+
+ACCIDENT_SERIES_FILE = 'accident_series.npz'
+
+# Day number of accidents without a date; they sort first within their edge
+NO_DATE = np.iinfo(np.int32).min
+# Severity code of every stored accident: 0 unknown, then the STATS19 codes
+SEVERITY_NAMES = {name: code for code, name in SEVERITY_CODES.items()}
+
+# Risk and edge safety arrays kept per (window, half-life, as-of day, severity scores)
+RISK_CACHE_SIZE = 8
+
+
+def _days(dates):
+    """
+    datetime64 array -> int32 days since 1970-01-01, NO_DATE for NaT
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    days[np.isnat(dates)] = NO_DATE
+    return days.astype(np.int32)
+
+
+def build_accident_series(snapshot, tables, snapped_paths):
+    """
+    Store the snapped accidents (accident_ingest parquet parts, edge rows of tables) per snapshot edge
+    as (day, severity, casualties) arrays sorted by edge then day, with a CSR pointer per edge, in the
+    snapshot directory
+    """
+    row_edge = np.empty(len(tables.edges), dtype=np.int64)
+    row_edge[snapshot_edge_order(tables)] = np.arange(len(tables.edges))
+
+    edges, days, severity, casualties = [], [], [], []
+    for path in snapped_paths:
+        table = pq.read_table(path, columns=['edge', 'date', 'severity', 'casualty_count'])
+        edges.append(row_edge[table.column('edge').to_numpy()])
+        days.append(_days(table.column('date').to_numpy()))
+        codes = table.column('severity').to_pandas().map(SEVERITY_NAMES).fillna(0).values
+        severity.append(codes.astype(np.uint8))
+        casualties.append(table.column('casualty_count').to_numpy().astype(np.int32))
+
+    if edges:
+        edges, days = np.concatenate(edges), np.concatenate(days)
+        severity, casualties = np.concatenate(severity), np.concatenate(casualties)
+    else:
+        edges, days = np.zeros(0, np.int64), np.zeros(0, np.int32)
+        severity, casualties = np.zeros(0, np.uint8), np.zeros(0, np.int32)
+    order = np.lexsort((days, edges))
+    indptr = np.zeros(snapshot.n_edges + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges, minlength=snapshot.n_edges), out=indptr[1:])
+    np.savez(os.path.join(snapshot.path, ACCIDENT_SERIES_FILE), version=snapshot.version, indptr=indptr,
+             days=days[order], severity=severity[order], casualties=casualties[order])
+    return AccidentRisk(snapshot, indptr, days[order], severity[order], casualties[order])
+
+
+class AccidentRisk:
+    """
+    Per-edge accident time series of a GraphSnapshot and the accident risk computed from it at query time.
+
+    The risk of an edge is the sum over its accidents of casualties * severity score * decay, where decay
+    is 1 inside a window of window_days before the as-of date (0 outside) and/or halves every half_life_days.
+    Accidents after the as-of date are ignored; accidents without a date always count in full. Risks are
+    differences of prefix sums over the accidents sorted by (edge, day), so a whole risk array costs
+    one binary search per edge, and the arrays of recent queries are cached.
+    """
+
+    def __init__(self, snapshot, indptr, days, severity, casualties):
+        self.snapshot = snapshot
+        self.indptr = indptr
+        self.days = days
+        self.severity = severity
+        self.casualties = casualties
+        self.n_edges = len(indptr) - 1
+
+        edge_of = np.repeat(np.arange(self.n_edges, dtype=np.int64), np.diff(indptr))
+        # (edge, day) as one sorted int64 key, for searching every edge's slice at once
+        self._keys = (edge_of << 32) + (days.astype(np.int64) - NO_DATE)
+        self._edge_starts = np.arange(self.n_edges, dtype=np.int64) << 32
+        self._edge_of = edge_of
+        self._dated = days != NO_DATE
+        self._latest_day = int(days[self._dated].max()) if self._dated.any() else 0
+        self._prefix_sums = {}
+        self._risks = OrderedDict()
+        self._safeties = OrderedDict()
+        self._lock = threading.Lock()  # guards the caches, risks are computed by concurrent requests
+
+        # the static accident_score folded into the snapshot's edge safety (all accidents, no decay)
+        self.static_risk = np.bincount(edge_of, weights=self.weights(), minlength=self.n_edges)
+        self._static_safety = None
+
+    @classmethod
+    def load(cls, snapshot):
+        """
+        Load the accident series saved with the snapshot; None if it is missing or stale
+        """
+        path = os.path.join(snapshot.path, ACCIDENT_SERIES_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as saved:
+            if str(saved['version']) != snapshot.version:
+                return None
+            return cls(snapshot, saved['indptr'], saved['days'], saved['severity'], saved['casualties'])
+
+    def weights(self, severity_scores=None):
+        """
+        casualties * severity score of every accident
+        """
+        severity_scores = severity_scores or SEVERITY_SCORES
+        by_code = np.zeros(max(SEVERITY_CODES) + 1)
+        for code, name in SEVERITY_CODES.items():
+            by_code[code] = severity_scores.get(name, 0.0)
+        return self.casualties * by_code[self.severity]
+
+    def _prefix_sum(self, severity_scores, half_life_days, reference_day):
+        """
+        Prefix sums of the weights of the accidents dated up to reference_day, decayed to reference_day
+        when a half-life is given
+        """
+        key = (tuple(sorted(severity_scores.items())), half_life_days, reference_day)
+        if key not in self._prefix_sums:
+            # later accidents are never summed for this reference day, and decayed to it they would
+            # swamp the earlier terms of the cumulative sum
+            weights = np.where(self._dated & (self.days <= reference_day), self.weights(severity_scores), 0.0)
+            if half_life_days:
+                weights *= np.exp2(np.minimum(self.days.astype(np.float64) - reference_day, 0) / half_life_days)
+            self._prefix_sums[key] = np.concatenate([[0.0], np.cumsum(weights)])
+            if len(self._prefix_sums) > RISK_CACHE_SIZE:
+                self._prefix_sums.pop(next(iter(self._prefix_sums)))
+        return self._prefix_sums[key]
+
+    def _positions(self, day):
+        """
+        Index of the first accident after day in every edge's slice
+        """
+        return np.searchsorted(self._keys, self._edge_starts + (int(day) - NO_DATE), side='right')
+
+    @staticmethod
+    def _key(window_days, half_life_days, as_of, severity_scores):
+        """
+        (cache key, as-of day number, severity scores) of a risk query
+        """
+        as_of_day = int(np.datetime64(as_of or 'today', 'D').astype(np.int64))
+        severity_scores = dict(severity_scores or SEVERITY_SCORES)
+        key = (window_days, half_life_days, as_of_day, tuple(sorted(severity_scores.items())))
+        return key, as_of_day, severity_scores
+
+    def edge_risk(self, window_days=None, half_life_days=None, as_of=None, severity_scores=None):
+        """
+        Accident risk of every edge (positive, larger is more dangerous) as of a date (default today)
+        """
+        key, as_of_day, severity_scores = self._key(window_days, half_life_days, as_of, severity_scores)
+        with self._lock:
+            if key in self._risks:
+                self._risks.move_to_end(key)
+                return self._risks[key]
+            return self._compute_risk(key, window_days, half_life_days, as_of_day, severity_scores)
+
+    def _compute_risk(self, key, window_days, half_life_days, as_of_day, severity_scores):
+        """
+        Compute and cache a risk array, called with the lock held
+        """
+        # prefix sums are referenced to the as-of day, or to the latest accident so that all current
+        # queries share one; every summed term is then at most its weight
+        reference_day = min(as_of_day, self._latest_day)
+        prefix = self._prefix_sum(severity_scores, half_life_days, reference_day)
+        hi = self._positions(as_of_day)
+        lo = self._positions(as_of_day - window_days) if window_days else self._positions(NO_DATE)
+        risk = prefix[hi] - prefix[np.minimum(lo, hi)]
+        if half_life_days:
+            risk *= np.exp2(-(as_of_day - reference_day) / half_life_days)
+        undated = ~self._dated
+        if undated.any():
+            weights = self.weights(severity_scores)
+            risk += np.bincount(self._edge_of[undated], weights=weights[undated], minlength=self.n_edges)
+
+        self._risks[key] = risk
+        if len(self._risks) > RISK_CACHE_SIZE:
+            self._risks.popitem(last=False)
+        return risk
+
+    def edge_safety(self, window_days=None, half_life_days=None, as_of=None, severity_scores=None):
+        """
+        Edge safety scores with the static accident score replaced by the current accident risk. The
+        arrays are cached (read-only) like the risks, so repeated queries get the same array and
+        RouteEngine.costs can reuse the costs built from it.
+        """
+        key, _, _ = self._key(window_days, half_life_days, as_of, severity_scores)
+        with self._lock:
+            if key in self._safeties:
+                self._safeties.move_to_end(key)
+                return self._safeties[key]
+            if self._static_safety is None:
+                self._static_safety = np.asarray(self.snapshot.safety_score, dtype=np.float64) + self.static_risk
+        safety = self._static_safety - self.edge_risk(window_days, half_life_days, as_of, severity_scores)
+        safety.flags.writeable = False
+        with self._lock:
+            # a concurrent request may have stored it first, every caller gets the stored array
+            safety = self._safeties.setdefault(key, safety)
+            if len(self._safeties) > RISK_CACHE_SIZE:
+                self._safeties.popitem(last=False)
+        return safety
+
+    def edge_accidents(self, edge):
+        """
+        (dates, severities, casualties) of one edge's accidents, oldest first
+        """
+        start, end = self.indptr[edge], self.indptr[edge + 1]
+        days = self.days[start:end].astype(np.int64)
+        dates = np.where(days == NO_DATE, np.datetime64('NaT'), days.astype('datetime64[D]'))
+        severities = [SEVERITY_CODES.get(int(code)) for code in self.severity[start:end]]
+        return dates, severities, self.casualties[start:end]
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    from graph_tables import GraphTables
+    from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+    from accident_ingest import snapped_parts
+    from build_pipeline import BUILD_PATH
+
+    parser = argparse.ArgumentParser(description="Store the snapped accidents of a build as per-edge time series "
+                                                 "next to the snapshot")
+    parser.add_argument('--build-dir', default=BUILD_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    snapshot = GraphSnapshot.load(args.snapshot)
+    tables = GraphTables.load(os.path.join(args.build_dir, 'network'))
+    risk = build_accident_series(snapshot, tables, snapped_parts(os.path.join(args.build_dir, 'accidents')))
+    print(f"Stored {len(risk.days)} accidents on {int(np.sum(np.diff(risk.indptr) > 0))} edges "
+          f"in {time.time() - start_time:.2f} sec")
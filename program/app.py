@@ -1,14 +1,64 @@
-from flask import Flask, request, jsonify
+import os
+import json
+import time
+import logging
+import itertools
+import numpy as np
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
-from route_network import RouteNetwork
-import osmnx as ox
+from route_network import RouteNetwork, DEFAULT_ROUTING_MODE, BIKE_TYPES, PARETO_ROUTES
+from graph_snapshot import GRAPHML_PATH, SNAPSHOT_PATH
+from tfl_feed import TFL_FEED_URL
+from route_geometry import ROUTE_FORMATS, DEFAULT_ROUTE_FORMAT, encode_polyline, pack_routes
+from station_search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, bike_count
+from batch_routing import BATCH_FORMATS, DEFAULT_BATCH_FORMAT, MAX_BATCH_PAIRS, stream_results
+from serving import RouteExecutor, ServerBusy, RouteTimeout, RETRY_AFTER
+import instrumentation
+from instrumentation import span
+
+logger = logging.getLogger(__name__)
 
 # from network import get_all_shortest_route
 
+# Route dumps (node lists, option listings) are logged at DEBUG, so LOG_LEVEL=DEBUG brings them back
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 app = Flask(__name__)
 CORS(app)
 
-route_network = RouteNetwork()
+# Data locations can be overridden from the environment, e.g. to serve the benchmark fixtures offline
+route_network = RouteNetwork(
+    graphml_path=os.environ.get('GRAPHML_PATH', GRAPHML_PATH),
+    snapshot_path=os.environ.get('SNAPSHOT_PATH', SNAPSHOT_PATH),
+    station_feed_url=os.environ.get('STATION_FEED_URL', TFL_FEED_URL)
+)
+# Answer to risk_window / risk_half_life when the snapshot has no accident series to compute them from
+RISK_UNAVAILABLE = "Time-decayed accident risk is not available for this graph snapshot"
+
+# Route computations run on a bounded pool of threads so /search is never queued behind /route
+route_executor = RouteExecutor()
+
+instrumentation.registry.register_collector('station_feed', route_network.station_feed.metrics)
+instrumentation.registry.register_collector('candidate_cache', route_network.candidate_cache.stats)
+instrumentation.registry.register_collector('result_cache', route_network.result_cache.stats)
+instrumentation.registry.register_collector('route_executor', route_executor.stats)
+if route_network.tiled_engine is not None:
+    instrumentation.registry.register_collector('graph_tiles', route_network.tiled_engine.stats)
+
+
+@app.before_request
+def start_timer():
+    g.start_time = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # streamed responses (/route/batch) are timed up to their first byte
+    if instrumentation.enabled and 'start_time' in g:
+        endpoint = request.endpoint or 'unknown'
+        instrumentation.REQUEST_SECONDS.observe(time.perf_counter() - g.start_time, endpoint)
+        instrumentation.REQUESTS.inc(endpoint, str(response.status_code))
+    return response
 
 
 @app.route('/search', methods=['GET'])
@@ -17,24 +67,50 @@ def search_station():
     if not query:
         return jsonify([])
     
-    station_df = route_network.station_df
-    matches = station_df[station_df['name'].str.contains(query, case=False)]
+    # type=int turns an invalid limit into None (the default only applies when limit is absent)
+    limit = request.args.get('limit', None if 'limit' in request.args else DEFAULT_SEARCH_LIMIT, type=int)
+    if limit is None or limit < 1:
+        return jsonify({"error": "limit must be a positive number"}), 400
+    matches = route_network.station_index.search(query, limit=min(limit, MAX_SEARCH_LIMIT))
 
     result = [
-        {"name": row['name'], "lat": row['lat'], "lon": row['lon'], "bikes": row["bikes"]}
-        for _, row in matches.iterrows()
+        {"name": row['name'], "lat": float(row['lat']), "lon": float(row['lon']), "bikes": bike_count(row)}
+        for row in matches
     ]
 
     return jsonify(result)
 
 
+def route_response(routes, metrics, route_format):
+    """
+    Serialize route point arrays: lists of {"lat", "lon"} dicts (default), encoded polylines,
+    or packed float32 points with the metrics in the X-Route-Metrics header
+    """
+    if route_format == 'binary':
+        return Response(pack_routes(routes), mimetype='application/octet-stream',
+                        headers={'X-Route-Metrics': app.json.dumps(metrics)})
+    if route_format == 'polyline':
+        encoded = [encode_polyline(points) for points in routes]
+        return jsonify({"routes": encoded, "metrics": metrics, "format": "polyline"})
+    coordinates = [[{"lat": lat, "lon": lon} for lat, lon in points.tolist()] for points in routes]
+    return jsonify({"routes": coordinates, "metrics": metrics})
+
+
 @app.route('/route', methods=['GET'])
-def get_route():
+def get_route(mode=None, k=5):
     start_name = request.args.get('start')
     end_name = request.args.get('end')
     distance_coeff = float(request.args.get('distance', '0.0'))
     safety_coeff = float(request.args.get('safety', '0.0'))
     comfort_coeff = float(request.args.get('comfort', '0.0'))
+    mode = mode or request.args.get('mode', DEFAULT_ROUTING_MODE)
+    route_format = request.args.get('format', DEFAULT_ROUTE_FORMAT)
+    # Optional accident risk in place of the static accident score: window and/or half-life in days
+    risk_window_days = request.args.get('risk_window', type=float)
+    risk_half_life_days = request.args.get('risk_half_life', type=float)
+    # Optional live availability: stations weighed at each end, and the kind of bike needed at the start
+    candidates = request.args.get('candidates', type=int)
+    bike_type = request.args.get('bike_type', 'any')
     total_coeff = distance_coeff + safety_coeff + comfort_coeff 
     if total_coeff == 0:
         distance_weight, safety_weight, comfort_weight = 1, 0, 0
@@ -45,14 +121,31 @@ def get_route():
 
     if not start_name or not end_name:
         return jsonify({"error": "Missing compulsory arguments start or end."}), 400
+    if route_format not in ROUTE_FORMATS:
+        return jsonify({"error": f"Unknown format {route_format}, expected one of {', '.join(ROUTE_FORMATS)}"}), 400
+    if any(days is not None and days <= 0 for days in (risk_window_days, risk_half_life_days)):
+        return jsonify({"error": "risk_window and risk_half_life must be positive numbers of days"}), 400
+    if (risk_window_days is not None or risk_half_life_days is not None) and route_network.accident_risk is None:
+        return jsonify({"error": RISK_UNAVAILABLE}), 400
+    if bike_type not in BIKE_TYPES:
+        return jsonify({"error": f"Unknown bike_type {bike_type}, expected one of {', '.join(BIKE_TYPES)}"}), 400
+    if candidates is not None and candidates < 1:
+        return jsonify({"error": "candidates must be a positive number of stations"}), 400
 
     try:
-        result = route_network.plan_cycle_route(
+        result = route_executor.run(
+            route_network.plan_cycle_route,
             start_name=start_name,
             end_name=end_name,
             distance_weight=distance_weight,
             safety_weight=safety_weight,
-            comfort_weight=comfort_weight
+            comfort_weight=comfort_weight,
+            mode=mode,
+            risk_window_days=risk_window_days,
+            risk_half_life_days=risk_half_life_days,
+            candidates=candidates,
+            bike_type=bike_type,
+            k=k
         )
 
         # Check for error responses
@@ -62,65 +155,19 @@ def get_route():
         if result is None:
             return jsonify({"error": "The path cannot be planned out"}), 500
         
-        def extract_coordinates(geom):
-            """Extract all coordinate points from the geometric object"""
-            if geom.geom_type == 'Point':
-                return [(geom.x, geom.y)]
-            elif geom.geom_type == 'LineString':
-                return list(geom.coords)
-            elif geom.geom_type == 'MultiLineString':
-                coords = []
-                for line in geom.geoms:
-                    coords.extend(list(line.coords))
-                return coords
-            return []
-        
-        # Return multiple paths in safe mode
-        if isinstance(result, list):  # multiple route situation
-            routes = []
-            metrics = []
-
-            for route_info in result:
-                node_path = route_info["route"]
-                gdf = ox.routing.route_to_gdf(route_network.G, node_path)
-                
-                coordinates = []
-                for geom in gdf.geometry:
-                    for point in extract_coordinates(geom):
-                        coordinates.append({"lat": float(point[1]), "lon": float(point[0])})
-                
-                routes.append(coordinates)
-                metrics.append({
-                    "route_length": route_info["total_length"],
-                    "safety_score": route_info["safety_factor"],
-                    "comfort_score": route_info["comfort_factor"],
-                    "combined_score": route_info["combined_score"]
-                })
-
-            return jsonify({
-                "routes": routes,
-                "metrics": metrics
-            })
-        
-        else:  # single route situation
-            if "path_nodes" not in result:
-                return jsonify({"error": "The format of the path data is incorrect"}), 500
-                
-            node_path = result["path_nodes"]
-            gdf = ox.routing.route_to_gdf(route_network.G, node_path)
-            
-            coordinates = []
-            for geom in gdf.geometry:
-                for point in extract_coordinates(geom):
-                    coordinates.append({"lat": float(point[1]), "lon": float(point[0])})
-            
-            return jsonify({
-                "routes": [coordinates],
-                "metrics": [{
-                    "route_length": result.get("total_distance", 0),
-                    "walking_distance": result.get("walking_distance", 0)
-                }]
-            })
+        # Single and multiple routes alike come back as a list of RouteResults
+        with span('geometry'):
+            routes = [route_network.route_coordinates(route) for route in result]
+        metrics = [route.metrics() for route in result]
+
+        with span('serialization'):
+            return route_response(routes, metrics, route_format)
+
+    except ServerBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(RETRY_AFTER)}
+
+    except RouteTimeout as e:
+        return jsonify({"error": str(e)}), 504
 
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
@@ -129,5 +176,119 @@ def get_route():
         return jsonify({"error": f"Internal error: {str(e)}"}), 500
 
 
+@app.route('/route/pareto', methods=['GET'])
+def get_pareto_routes():
+    """
+    /route over the Pareto front of (length, safety, comfort) between the two stations: computed once
+    per pair and cached, so requests for other weights only re-rank it. Optional "routes" caps the
+    number of routes returned.
+    """
+    n_routes = request.args.get('routes', PARETO_ROUTES, type=int)
+    if n_routes < 1:
+        return jsonify({"error": "routes must be a positive number"}), 400
+    return get_route(mode='pareto', k=n_routes)
+
+
+@app.route('/route/batch', methods=['POST'])
+def get_batch_routes():
+    """
+    Route many origin-destination pairs. JSON body: "origins" and "destinations" (lists of TfL station
+    ids or [lat, lon] pairs), "distance"/"safety"/"comfort" (numbers or per-pair lists), optional "k"
+    (alternatives per pair, default 1), "format" (jsonl or parquet), "routes" (include node ids),
+    "risk_window"/"risk_half_life" (days). Results stream back as they are computed.
+    """
+    body = request.get_json(silent=True) or {}
+    origins, destinations = body.get('origins'), body.get('destinations')
+    route_format = body.get('format', DEFAULT_BATCH_FORMAT)
+    with_routes = bool(body.get('routes', False))
+
+    if not isinstance(origins, list) or not isinstance(destinations, list):
+        return jsonify({"error": "Missing compulsory lists origins and destinations."}), 400
+    if len(origins) != len(destinations):
+        return jsonify({"error": "origins and destinations must have the same length"}), 400
+    if len(origins) > MAX_BATCH_PAIRS:
+        return jsonify({"error": f"At most {MAX_BATCH_PAIRS} pairs per batch"}), 400
+    if route_format not in BATCH_FORMATS:
+        return jsonify({"error": f"Unknown format {route_format}, expected one of {', '.join(BATCH_FORMATS)}"}), 400
+
+    try:
+        k = int(body.get('k', 1))
+        risk_window_days, risk_half_life_days = (None if body.get(name) is None else float(body[name])
+                                                 for name in ('risk_window', 'risk_half_life'))
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        if any(days is not None and days <= 0 for days in (risk_window_days, risk_half_life_days)):
+            raise ValueError("risk_window and risk_half_life must be positive numbers of days")
+        if (risk_window_days is not None or risk_half_life_days is not None) and route_network.accident_risk is None:
+            raise ValueError(RISK_UNAVAILABLE)
+        coeffs = np.broadcast_arrays(*(np.asarray(body.get(name, 0.0), dtype=np.float64)
+                                       for name in ('distance', 'safety', 'comfort')))
+        # normalized per pair like /route, distance only when all coefficients are 0
+        total = coeffs[0] + coeffs[1] + coeffs[2]
+        weights = [np.where(total == 0, default, coeff / np.where(total == 0, 1, total))
+                   for coeff, default in zip(coeffs, (1, 0, 0))]
+        results = route_network.plan_batch_routes(
+            origins, destinations, *weights, k=k,
+            risk_window_days=risk_window_days,
+            risk_half_life_days=risk_half_life_days,
+            with_routes=with_routes
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # a batch streams from the request thread (its searches run on the batch process pool) and holds
+    # one route slot until the response is closed
+    try:
+        route_executor.acquire()
+    except ServerBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': str(RETRY_AFTER)}
+    # the first frame is routed before the headers are sent, so failing batches get a proper status
+    try:
+        first = next(results, None)
+    except (TypeError, ValueError) as e:
+        route_executor.release()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        route_executor.release()
+        return jsonify({"error": f"Internal error: {str(e)}"}), 500
+    frames = results if first is None else itertools.chain([first], results)
+    mimetype = 'application/x-ndjson' if route_format == 'jsonl' else 'application/vnd.apache.parquet'
+    response = Response(batch_stream(frames, route_format, with_routes), mimetype=mimetype)
+    response.call_on_close(route_executor.release)
+    return response
+
+
+def batch_stream(frames, route_format, with_routes):
+    """
+    stream_results for a response whose status is already sent: a failure ends a JSON lines stream
+    with an {"error": ...} record, and a Parquet stream without its footer (so it does not read as complete)
+    """
+    try:
+        yield from stream_results(frames, route_format, with_routes)
+    except Exception as e:
+        logger.exception("Batch routing failed after the response started")
+        if route_format == 'jsonl':
+            yield json.dumps({"error": f"Internal error: {str(e)}"}).encode() + b'\n'
+
+
+@app.route('/status', methods=['GET'])
+def status():
+    return jsonify({
+        "station_feed": route_network.station_feed.metrics(),
+        "candidate_cache": route_network.candidate_cache.stats(),
+        "result_cache": route_network.result_cache.stats(),
+        "route_executor": route_executor.stats(),
+        "graph_tiles": route_network.tiled_engine.stats() if route_network.tiled_engine is not None else None
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Counters and latency histograms (per endpoint and per route planning stage) in the Prometheus text format
+    """
+    return Response(instrumentation.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == "__main__":
     app.run(debug=True)
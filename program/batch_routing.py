@@ -0,0 +1,267 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from multiprocessing import Pool
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer, combined_scores
+from route_cache import SEARCH_WEIGHT_STEP, quantize_weights
+from accident_risk import AccidentRisk
+from station_routes import METRIC_COLUMNS
+
+
+# Destinations of one origin routed by one worker task, each task grows one shortest-path tree
+BATCH_TASK_SIZE = 256
+# Largest number of origin-destination pairs accepted by one /route/batch request
+MAX_BATCH_PAIRS = 100_000
+
+BATCH_FORMATS = ('jsonl', 'parquet')
+DEFAULT_BATCH_FORMAT = 'jsonl'
+
+RESULT_COLUMNS = ['request', 'origin', 'destination', 'rank', 'combined_score'] + METRIC_COLUMNS
+
+RESULT_SCHEMA = pa.schema([
+    ('request', pa.int64()),           # position of the pair in the batch
+    ('origin', pa.int64()),            # OSM node ids
+    ('destination', pa.int64()),
+    ('rank', pa.int64()),              # 0 for the best route of the pair
+    ('combined_score', pa.float64()),
+    ('total_length', pa.float64()),
+    ('safety_factor', pa.float64()),
+    ('comfort_factor', pa.float64()),
+    ('accidents_count', pa.int64()),
+    ('cycleway_coverage', pa.float64()),
+    ('street_count', pa.int64()),
+])
+
+
+class BatchWorker:
+    """
+    Routes the destinations of one origin over a snapshot: one shortest-path tree gives the best route
+    to every destination, the other alternatives come from penalty searches. Routes are searched and
+    ranked like RouteNetwork.findKBestRoutes, so the metrics match a /route request for the same pair.
+    """
+
+    def __init__(self, snapshot, engine, scorer, accident_risk=None):
+        self.snapshot = snapshot
+        self.engine = engine
+        self.scorer = scorer
+        self.accident_risk = accident_risk
+
+    def route(self, source, weights, requests, targets, k=1, risk=(None, None), with_routes=False):
+        """
+        Result DataFrame (RESULT_COLUMNS, plus 'route' node ids when with_routes) for the pairs from
+        node index source to the node indices targets; requests are the pairs' positions in the batch
+        """
+        edge_safety = None
+        if self.accident_risk is not None and any(days is not None for days in risk):
+            edge_safety = self.accident_risk.edge_safety(*risk)
+
+        search_distance, search_safety, search_comfort = quantize_weights(*weights, step=SEARCH_WEIGHT_STEP)
+        costs = self.engine.costs(search_distance, search_safety, search_comfort, edge_safety)
+        _, pred = self.engine.shortest_path_tree(source, costs, targets)
+
+        pairs, paths = [], []
+        for i, target in enumerate(targets):
+            path = self.engine.tree_path(pred, source, target)
+            if path is None:
+                continue
+            if k > 1:
+                alternatives = self.engine.k_diverse_paths(source, target, k, search_distance, search_safety,
+                                                           search_comfort, costs=costs, first_path=path)
+            else:
+                alternatives = [path]
+            pairs.extend([i] * len(alternatives))
+            paths.extend(alternatives)
+
+        # scored as node sequences like findKBestRoutes, so parallel edges resolve the same way
+        pairs = np.asarray(pairs, dtype=np.int64)
+        routes = [self.engine.path_nodes(source, path) for path in paths]
+        metrics, _ = self.scorer.score_node_routes(routes, edge_safety)
+        scores = combined_scores(metrics['total_length'], metrics['safety_factor'], metrics['comfort_factor'],
+                                 *weights, groups=pairs)
+
+        # best first within each pair, ties keep the search order like rankRoutes
+        order = np.lexsort((-scores, pairs))
+        pairs = pairs[order]
+        starts = np.flatnonzero(np.r_[True, pairs[1:] != pairs[:-1]]) if len(pairs) else pairs
+        ranks = np.arange(len(pairs)) - np.repeat(starts, np.diff(np.r_[starts, len(pairs)]))
+
+        node_ids = self.snapshot.node_ids
+        frame = pd.DataFrame({
+            'request': np.asarray(requests, dtype=np.int64)[pairs],
+            'origin': np.full(len(pairs), node_ids[source], dtype=np.int64),
+            'destination': node_ids[np.asarray(targets, dtype=np.int64)[pairs]],
+            'rank': ranks,
+            'combined_score': scores[order],
+        })
+        for column in METRIC_COLUMNS:
+            frame[column] = metrics[column][order]
+        if with_routes:
+            frame['route'] = [node_ids[routes[i]].tolist() for i in order]
+        return frame
+
+
+# Per-process worker of the batch pool, the snapshot is memory-mapped so workers share its pages
+_worker = {}
+
+
+def _init_worker(snapshot_path):
+    snapshot = GraphSnapshot.load(snapshot_path)
+    _worker['batch'] = BatchWorker(snapshot, RouteEngine(snapshot), RouteScorer(snapshot), AccidentRisk.load(snapshot))
+
+
+def _route_task(task):
+    return _worker['batch'].route(*task)
+
+
+class BatchRouter:
+    """
+    Routes many origin-destination pairs at once. Pairs are grouped by origin node and (rounded)
+    weights so one shortest-path tree serves a whole group, and the groups are spread over a process
+    pool whose workers memory-map the same snapshot. Small batches run in the calling process, and so
+    do all batches with processes=1. The pool (cpu_count processes by default) is forked on the first
+    larger batch and lives until close(), so keep processes=1 inside threaded servers.
+    """
+
+    def __init__(self, snapshot, engine=None, scorer=None, accident_risk=None, processes=None):
+        self.snapshot = snapshot
+        self.processes = processes if processes is not None else os.cpu_count()
+        if accident_risk is None:
+            accident_risk = AccidentRisk.load(snapshot)
+        self._local = BatchWorker(snapshot, engine or RouteEngine(snapshot), scorer or RouteScorer(snapshot),
+                                  accident_risk)
+        self._pool = None
+
+    def tasks(self, sources, targets, distance_weight, safety_weight, comfort_weight, k=1,
+              risk_window_days=None, risk_half_life_days=None, with_routes=False):
+        """
+        Split a batch (node index arrays, scalar or per-pair weights) into worker tasks: the pairs
+        of one origin and weights, at most BATCH_TASK_SIZE at a time
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if sources.shape != targets.shape:
+            raise ValueError("Batch origins and destinations must have the same length")
+        n = len(sources)
+        weights = [quantize_weights(*w) for w in zip(*(np.broadcast_to(np.asarray(w, dtype=np.float64), n).tolist()
+                                                       for w in (distance_weight, safety_weight, comfort_weight)))]
+        risk = (risk_window_days, risk_half_life_days)
+
+        groups = {}
+        for request, key in enumerate(zip(sources.tolist(), weights)):
+            groups.setdefault(key, []).append(request)
+        tasks = []
+        for (source, group_weights), requests in groups.items():
+            for start in range(0, len(requests), BATCH_TASK_SIZE):
+                chunk = requests[start:start + BATCH_TASK_SIZE]
+                tasks.append((source, group_weights, chunk, targets[chunk].tolist(), k, risk, with_routes))
+        return tasks
+
+    def route(self, sources, targets, distance_weight, safety_weight, comfort_weight, k=1,
+              risk_window_days=None, risk_half_life_days=None, with_routes=False):
+        """
+        Return an iterator of result DataFrames (RESULT_COLUMNS) in the order the worker tasks finish.
+        Pairs without a route produce no rows; 'request' gives the position of each row's pair in the batch.
+        """
+        tasks = self.tasks(sources, targets, distance_weight, safety_weight, comfort_weight, k,
+                           risk_window_days, risk_half_life_days, with_routes)
+        return self._run(tasks)
+
+    def _run(self, tasks):
+        if self.processes <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield self._local.route(*task)
+            return
+
+        if self._pool is None:
+            self._pool = Pool(self.processes, initializer=_init_worker, initargs=(self.snapshot.path,))
+        yield from self._pool.imap_unordered(_route_task, tasks)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def result_schema(with_routes=False):
+    return RESULT_SCHEMA.append(pa.field('route', pa.list_(pa.int64()))) if with_routes else RESULT_SCHEMA
+
+
+def stream_results(frames, fmt=DEFAULT_BATCH_FORMAT, with_routes=False):
+    """
+    Serialize result DataFrames as they arrive: JSON lines, or Parquet with one row group per frame
+    """
+    if fmt == 'jsonl':
+        for frame in frames:
+            if len(frame):
+                yield frame.to_json(orient='records', lines=True).rstrip('\n').encode() + b'\n'
+        return
+
+    schema = result_schema(with_routes)
+    buffer = io.BytesIO()
+    with pq.ParquetWriter(buffer, schema) as writer:
+        for frame in frames:
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_results(frames, path, fmt=None, with_routes=False):
+    """
+    Write result DataFrames to a .parquet or .jsonl file; return the number of rows written
+    """
+    fmt = fmt or ('parquet' if path.endswith('.parquet') else 'jsonl')
+    n_rows = 0
+
+    def counted(frames):
+        nonlocal n_rows
+        for frame in frames:
+            n_rows += len(frame)
+            yield frame
+
+    with open(path, 'wb') as f:
+        for chunk in stream_results(counted(frames), fmt, with_routes):
+            f.write(chunk)
+    return n_rows
+
+
+if __name__ == "__main__":
+    import time
+    import argparse
+    from spatial_index import SpatialIndex
+
+    parser = argparse.ArgumentParser(description="Route origin-destination pairs from a CSV with origin_lat, "
+                                                 "origin_lon, destination_lat and destination_lon columns "
+                                                 "(optional per-pair distance, safety and comfort weights)")
+    parser.add_argument('pairs')
+    parser.add_argument('out', help=".parquet or .jsonl")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--distance', type=float, default=1 / 3)
+    parser.add_argument('--safety', type=float, default=1 / 3)
+    parser.add_argument('--comfort', type=float, default=1 / 3)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--routes', action='store_true', help="include the node ids of every route")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    snapshot = GraphSnapshot.load(args.snapshot)
+    spatial = SpatialIndex.load(snapshot)
+    pairs = pd.read_csv(args.pairs)
+    sources, _ = spatial.nearest_nodes(pairs['origin_lat'].values, pairs['origin_lon'].values)
+    targets, _ = spatial.nearest_nodes(pairs['destination_lat'].values, pairs['destination_lon'].values)
+    weights = [pairs[name].values if name in pairs else getattr(args, name) for name in ('distance', 'safety', 'comfort')]
+
+    router = BatchRouter(snapshot, processes=args.processes)
+    n_rows = write_results(router.route(sources, targets, *weights, k=args.k, with_routes=args.routes),
+                           args.out, with_routes=args.routes)
+    router.close()
+    print(f"Routed {len(pairs)} pairs ({n_rows} routes) in {time.time() - start_time:.2f} sec")
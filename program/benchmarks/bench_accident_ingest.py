@@ -0,0 +1,102 @@
+"""
+Accident ingestion: the row-at-a-time BNG conversion of cyclist_accidents.ipynb plus the in-memory
+snap and df_acc.at loop of set_network_attr.ipynb vs streaming accident_ingest, on a synthetic
+STATS19-style extract (easting/northing, severity codes, dd/mm/yyyy dates) with peak RSS of each path.
+
+Run from the program directory:
+    python -m benchmarks.bench_accident_ingest --rows 2000000 --sample 20000
+"""
+import os
+import time
+import resource
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import osmnx as ox
+from pyproj import Transformer
+
+from graph_tables import GraphTables
+from build_pipeline import RAW_GRAPHML_PATH
+from accident_ingest import SEVERITY_SCORES, SEVERITY_CODES, EdgeSnapper, ingest_accidents, edge_accident_totals
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_stats19(path, tables, n_rows, rng, inside_fraction=0.1, chunk_size=500_000):
+    # national extract: most collisions anywhere in Great Britain, some inside the network
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:27700", always_xy=True)
+    x, y = tables.numeric('nodes', 'x'), tables.numeric('nodes', 'y')
+    for start in range(0, n_rows, chunk_size):
+        n = min(chunk_size, n_rows - start)
+        inside = rng.random(n) < inside_fraction
+        eastings = rng.uniform(100_000, 650_000, n)
+        northings = rng.uniform(10_000, 1_200_000, n)
+        nodes = rng.integers(0, len(x), inside.sum())
+        eastings[inside], northings[inside] = transformer.transform(x[nodes] + rng.normal(0, 2e-4, len(nodes)),
+                                                                    y[nodes] + rng.normal(0, 2e-4, len(nodes)))
+        days = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 3650, n), unit='D')
+        pd.DataFrame({
+            'accident_index': np.arange(start, start + n),
+            'location_easting_osgr': eastings.round(),
+            'location_northing_osgr': northings.round(),
+            'longitude': 'NULL',
+            'latitude': 'NULL',
+            'accident_severity': rng.choice([1, 2, 3], n, p=[0.01, 0.14, 0.85]),
+            'number_of_casualties': rng.choice([1, 2, 3], n, p=[0.8, 0.15, 0.05]),
+            'date': days.strftime('%d/%m/%Y'),
+        }).to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+def notebook_path(path, G, n_rows):
+    # cyclist_accidents.ipynb + set_network_attr.ipynb on the first n_rows
+    df_acc = pd.read_csv(path, nrows=n_rows)
+    transformer = Transformer.from_crs("EPSG:27700", "EPSG:4326", always_xy=True)
+    lat_list, lon_list = [], []
+    for row in df_acc.itertuples():
+        lon, lat = transformer.transform(row.location_easting_osgr, row.location_northing_osgr)
+        lat_list.append(lat)
+        lon_list.append(lon)
+    df_acc['Latitude'], df_acc['Longitude'] = lat_list, lon_list
+    nearest_edges = ox.distance.nearest_edges(G, X=df_acc['Longitude'], Y=df_acc['Latitude'])
+    scores = {}
+    for i, edge in enumerate(nearest_edges):
+        casualty_count = int(df_acc.at[i, 'number_of_casualties'])
+        severity = SEVERITY_CODES[df_acc.at[i, 'accident_severity']]
+        scores[edge] = scores.get(edge, 0.0) - casualty_count * SEVERITY_SCORES[severity]
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=RAW_GRAPHML_PATH)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--sample', type=int, default=20_000, help="rows run through the notebook path")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    tables = GraphTables.read_graphml(args.graphml)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'stats19.csv')
+        write_stats19(path, tables, args.rows, rng)
+        print(f"{args.rows} STATS19 rows, {os.path.getsize(path) / 2 ** 20:.0f} MiB")
+
+        rss_before = peak_rss_mb()
+        start = time.perf_counter()
+        snapper = EdgeSnapper(tables)
+        n_rows, n_snapped = ingest_accidents(path, snapper, os.path.join(tmp, 'part-00000.parquet'))
+        edge_accident_totals([os.path.join(tmp, 'part-00000.parquet')], snapper.n_edges)
+        stream_sec = time.perf_counter() - start
+        print(f"  streaming ingest: {stream_sec:8.2f} sec for {n_rows} rows ({n_snapped} snapped), "
+              f"{n_rows / stream_sec:,.0f} rows/sec, peak RSS {peak_rss_mb():.0f} MiB (before ingest {rss_before:.0f} MiB)")
+
+        G = ox.load_graphml(args.graphml)
+        start = time.perf_counter()
+        notebook_path(path, G, args.sample)
+        notebook_sec = time.perf_counter() - start
+        print(f"  notebook path:    {notebook_sec:8.2f} sec for {args.sample} rows, "
+              f"{args.sample / notebook_sec:,.0f} rows/sec "
+              f"(streaming {(n_rows / stream_sec) / (args.sample / notebook_sec):.0f}x faster per row)")
@@ -0,0 +1,73 @@
+"""
+Batch routing of trip-log style origin-destination pairs (a few busy origins, many destinations each):
+one findKBestRoutes-style search and scoring per pair vs BatchRouter (one shortest-path tree per
+origin, in-process and over a process pool), checking that both give the same best routes.
+
+Run from the program directory:
+    python -m benchmarks.bench_batch_routing --origins 20 --pairs 2000 --k 1 --processes 4
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer, combined_scores
+from route_cache import SEARCH_WEIGHT_STEP, quantize_weights
+from batch_routing import BatchRouter
+
+
+def loop_routes(engine, scorer, sources, targets, weights, k):
+    # RouteNetwork.findKBestRoutes without the caches: search, score and rank every pair on its own
+    weights = quantize_weights(*weights)
+    search_weights = quantize_weights(*weights, step=SEARCH_WEIGHT_STEP)
+    best = {}
+    for request, (source, target) in enumerate(zip(sources.tolist(), targets.tolist())):
+        paths = engine.k_diverse_paths(source, target, k, *search_weights)
+        if not paths:
+            continue
+        metrics, _ = scorer.score_node_routes([engine.path_nodes(source, path) for path in paths])
+        scores = combined_scores(metrics['total_length'], metrics['safety_factor'], metrics['comfort_factor'], *weights)
+        best[request] = float(metrics['total_length'][int(np.argmax(scores))])
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--origins', type=int, default=20)
+    parser.add_argument('--pairs', type=int, default=2000)
+    parser.add_argument('--sample', type=int, default=200, help="pairs run through the per-pair loop")
+    parser.add_argument('--k', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    engine, scorer = RouteEngine(snapshot), RouteScorer(snapshot)
+    rng = np.random.default_rng(args.seed)
+    origins = rng.integers(0, snapshot.n_nodes, args.origins)
+    sources = origins[rng.integers(0, args.origins, args.pairs)]
+    targets = rng.integers(0, snapshot.n_nodes, args.pairs)
+    weights = (0.3, 0.5, 0.2)  # distance, safety, comfort
+    print(f"{args.pairs} pairs from {args.origins} origins, k={args.k}, "
+          f"{snapshot.n_nodes} nodes / {snapshot.n_edges} edges")
+
+    start = time.perf_counter()
+    best = loop_routes(engine, scorer, sources[:args.sample], targets[:args.sample], weights, args.k)
+    loop_sec = (time.perf_counter() - start) / args.sample
+    print(f"  per-pair loop:    {loop_sec * 1000:8.1f} ms/pair ({args.sample} pairs)")
+
+    for processes in (1, args.processes):
+        router = BatchRouter(snapshot, engine, scorer, processes=processes)
+        start = time.perf_counter()
+        results = pd.concat(list(router.route(sources, targets, *weights, k=args.k)))
+        batch_sec = (time.perf_counter() - start) / args.pairs
+        router.close()
+        print(f"  batch, {processes} process{'es' if processes > 1 else '  '}: {batch_sec * 1000:8.1f} ms/pair "
+              f"({loop_sec / batch_sec:.1f}x), {len(results)} routes")
+
+    top = results[results['rank'] == 0].set_index('request')['total_length']
+    differ = sum(abs(top.get(request, np.nan) - length) > 1e-6 for request, length in best.items())
+    print(f"  best routes differing from the per-pair loop: {differ} of {len(best)}")
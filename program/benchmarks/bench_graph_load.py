@@ -0,0 +1,67 @@
+"""
+Compare RouteNetwork graph start-up: GraphML parsing vs the memory-mapped snapshot, and the
+per-worker memory of a RouteEngine on top of the snapshot. private MB is the memory a process does
+not share with others mapping the same files (Private_Dirty): what every preloaded worker adds.
+
+Run from the program directory:
+    python -m benchmarks.bench_graph_load
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+from graph_snapshot import GRAPHML_PATH, SNAPSHOT_PATH
+
+
+# Each loader runs in a fresh interpreter so that load time and RSS are not polluted by the other one
+LOADER = """
+import json, time
+def memory_mb(field):
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) / 1024
+before = memory_mb('Rss'), memory_mb('Private_Dirty')
+start = time.perf_counter()
+if {mode!r} == 'graphml':
+    import osmnx as ox
+    G = ox.load_graphml({path!r})
+    size = (G.number_of_nodes(), G.number_of_edges())
+else:
+    from graph_snapshot import GraphSnapshot
+    snap = GraphSnapshot.load({path!r})
+    # touch the arrays a query would use so the pages are really mapped
+    size = (snap.n_nodes, int(snap.indptr[-1]))
+    float(snap.length.sum()); float(snap.safety_score.sum())
+    if {mode!r} == 'engine':
+        from route_engine import RouteEngine
+        engine = RouteEngine(snap)
+        # one search weight setting, as a worker serving requests would hold
+        engine.costs(0.25, 0.5, 0.25)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'load_sec': elapsed, 'rss_mb': memory_mb('Rss') - before[0],
+                  'private_mb': memory_mb('Private_Dirty') - before[1], 'nodes': size[0], 'edges': size[1]}}))
+"""
+
+
+def measure(mode, path):
+    output = subprocess.check_output([sys.executable, '-c', LOADER.format(mode=mode, path=path)])
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    results = {
+        'graphml': measure('graphml', args.graphml),
+        'snapshot': measure('snapshot', args.snapshot),
+        'engine': measure('engine', args.snapshot),
+    }
+    for mode, result in results.items():
+        print(f"{mode:>8}: {result['load_sec']:.3f} sec, +{result['rss_mb']:.1f} MB RSS, +{result['private_mb']:.1f} MB private "
+              f"({result['nodes']} nodes, {result['edges']} edges)")
+    print(f"Speed-up: {results['graphml']['load_sec'] / max(results['snapshot']['load_sec'], 1e-9):.1f}x")
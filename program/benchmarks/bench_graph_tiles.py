@@ -0,0 +1,94 @@
+"""
+Whole-graph RouteEngine vs TiledRouteEngine (graph_tiles.py): bidirectional A* latency for local
+(0.5-3 km) and long (10-25 km) trips, tiles loaded per query, resident Python memory of each engine
+(tracemalloc) and whether both find routes of the same cost.
+
+Run from the program directory:
+    python -m benchmarks.bench_graph_tiles --pairs 30 --max-tiles 64
+"""
+import time
+import tempfile
+import argparse
+import tracemalloc
+import numpy as np
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import RouteEngine, EARTH_RADIUS_M
+from graph_tiles import GraphTiles, TiledRouteEngine, TILE_SIZE_DEG, build_tiles
+
+
+TRIP_LENGTHS = {'local': (500, 3000), 'long': (10_000, 25_000)}
+
+
+def trip_pairs(snapshot, low, high, n_pairs, rng, max_tries=1_000_000):
+    lat, lon = np.radians(snapshot.y), np.radians(snapshot.x)
+    pairs = []
+    for _ in range(max_tries):
+        if len(pairs) >= n_pairs:
+            break
+        a, b = rng.integers(0, snapshot.n_nodes, 2)
+        distance = EARTH_RADIUS_M * np.hypot(lat[a] - lat[b], (lon[a] - lon[b]) * np.cos(lat[a]))
+        if low <= distance < high:
+            pairs.append((int(a), int(b)))
+    return pairs
+
+
+def traced(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size / 2 ** 20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--tiles', help="existing tile store (default: build one in a temporary directory)")
+    parser.add_argument('--tile-size', type=float, default=TILE_SIZE_DEG)
+    parser.add_argument('--max-tiles', type=int, default=64)
+    parser.add_argument('--pairs', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    tiles_path = args.tiles or tempfile.mkdtemp(prefix='graph_tiles_')
+    if not args.tiles:
+        build_tiles(snapshot, tiles_path, args.tile_size)
+    tiles = GraphTiles.load(snapshot, tiles_path)
+    meta = tiles.meta
+    print(f"{snapshot.n_nodes} nodes / {snapshot.n_edges} edges in {meta['n_tiles']} tiles, "
+          f"{meta['boundary_nodes']} boundary nodes, at most {args.max_tiles} resident")
+
+    weights = (0.25, 0.5, 0.25)  # distance, safety, comfort
+    engine, engine_mb = traced(lambda: RouteEngine(snapshot))
+    costs = engine.costs(*weights)
+    tiled = TiledRouteEngine(tiles, max_tiles=args.max_tiles)
+    rng = np.random.default_rng(args.seed)
+
+    for trip, (low, high) in TRIP_LENGTHS.items():
+        pairs = trip_pairs(snapshot, low, high, args.pairs, rng)
+        start = time.perf_counter()
+        expected = [engine.shortest_path(a, b, costs, engine.potentials(a, b, weights[0]))[0] for a, b in pairs]
+        whole_ms = (time.perf_counter() - start) / len(pairs) * 1000
+
+        loads = tiled.loads
+        start = time.perf_counter()
+        found = [tiled.shortest_path(a, b, *weights)[0] for a, b in pairs]
+        tiled_ms = (time.perf_counter() - start) / len(pairs) * 1000
+        differ = sum(abs(x - y) > 1e-6 * max(1.0, x) for x, y in zip(expected, found) if np.isfinite(x) or np.isfinite(y))
+        print(f"  {trip:>5} trips: whole graph {whole_ms:7.1f} ms, tiled {tiled_ms:7.1f} ms "
+              f"({(tiled.loads - loads) / len(pairs):.1f} tile loads/query), {differ} of {len(pairs)} costs differ")
+
+    # resident memory: the whole-graph engine's lists vs a fresh tiled engine with every tile slot filled
+    def fill_tiles():
+        fresh = TiledRouteEngine(tiles, max_tiles=args.max_tiles)
+        for tile in range(min(args.max_tiles, tiles.n_tiles)):
+            fresh.tile(tile)
+        return fresh
+
+    _, tiled_mb = traced(fill_tiles)
+    print(f"  resident Python memory: whole graph {engine_mb:.1f} MB, "
+          f"{min(args.max_tiles, tiles.n_tiles)} tiles {tiled_mb:.1f} MB")
@@ -0,0 +1,124 @@
+"""
+End-to-end scoring time of the notebook path (ox.load_graphml, the per-element missing-value and
+dict-map loops of set_network_attr.ipynb / set_network_attr_v2.ipynb, ox.save_graphml, snapshot compile)
+vs the network_scoring pipeline (GraphTables read, vectorized scoring, chunked write, snapshot compile).
+
+Run from the program directory:
+    python -m benchmarks.bench_network_scoring --processes 4
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import osmnx as ox
+
+from graph_tables import GraphTables
+from graph_snapshot import compile_snapshot, compile_snapshot_tables
+from network_scoring import (ACCIDENT_GRAPHML_PATH, EDGE_SCORES_PATH, NODE_SCORES_PATH, EDGE_SCORE_ATTRIBUTES,
+                             NODE_SCORE_ATTRIBUTES, DEFAULT_EDGE_ATTR, DEFAULT_NODE_ATTR, score_tables)
+
+
+def notebook_score_maps(path, attr_list, numeric_type, numeric_cast):
+    # load_safety_and_comfort_features_for_edge / _for_node of set_network_attr_v2.ipynb
+    df = pd.read_csv(path, dtype={"feature_value": object})
+    df.loc[df["attribute_type"] == numeric_type, "feature_value"] = \
+        df.loc[df["attribute_type"] == numeric_type, "feature_value"].astype(numeric_cast)
+    safety_score_map, comfort_score_map = {}, {}
+    for attr_type in attr_list:
+        safety_attr_map, comfort_attr_map = {}, {}
+        for _, row in df[df["attribute_type"] == attr_type].iterrows():
+            safety_attr_map[row["feature_value"]] = float(row["safety_score"])
+            comfort_attr_map[row["feature_value"]] = float(row["comfort_score"])
+        safety_score_map[attr_type] = safety_attr_map
+        comfort_score_map[attr_type] = comfort_attr_map
+    return safety_score_map, comfort_score_map
+
+
+def notebook_score(data, score_map):
+    # computeSafetyScoreFromStreetAttribute / computeComfortScoreFromStreetAttribute
+    score = 0.0
+    for attr_type in score_map:
+        attr_val = data.get(attr_type)
+        if attr_val is None:
+            continue
+        if isinstance(attr_val, list):
+            for val in attr_val:
+                if val in score_map[attr_type]:
+                    score += float(score_map[attr_type][val])
+        elif attr_val in score_map[attr_type]:
+            score += float(score_map[attr_type][attr_val])
+    return score
+
+
+def notebook_fill(items, defaults):
+    # missing-value filling of set_network_attr.ipynb; after a GraphML round-trip NaN is the string 'nan'
+    for data in items:
+        for attr, default in defaults.items():
+            if attr in data:
+                val = data[attr]
+                if val is None or val == 'nan' or (isinstance(val, float) and np.isnan(val)):
+                    data[attr] = default
+
+
+def notebook_loop(G):
+    notebook_fill((data for _, _, data in G.edges(data=True)), DEFAULT_EDGE_ATTR)
+    notebook_fill((data for _, data in G.nodes(data=True)), DEFAULT_NODE_ATTR)
+    edge_safety_map, edge_comfort_map = notebook_score_maps(EDGE_SCORES_PATH, EDGE_SCORE_ATTRIBUTES, 'lanes', float)
+    node_safety_map, node_comfort_map = notebook_score_maps(NODE_SCORES_PATH, NODE_SCORE_ATTRIBUTES, 'street_count', int)
+    for edge_key in G.edges:
+        data = G.edges[edge_key]
+        data["safety_score"] = notebook_score(data, edge_safety_map) + float(data.get("accident_score", 0.0))
+        data["comfort_score"] = notebook_score(data, edge_comfort_map)
+    for node_key in G.nodes:
+        data = G.nodes[node_key]
+        data["safety_score"] = notebook_score(data, node_safety_map)
+        data["comfort_score"] = notebook_score(data, node_comfort_map)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=ACCIDENT_GRAPHML_PATH)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        G, load_sec = timed(lambda: ox.load_graphml(args.graphml))
+        _, loop_sec = timed(lambda: notebook_loop(G))
+        _, save_sec = timed(lambda: ox.save_graphml(G, os.path.join(tmp, 'notebook.graphml')))
+        _, compile_sec = timed(lambda: compile_snapshot(G, os.path.join(tmp, 'notebook_snapshot')))
+        notebook = [load_sec, loop_sec, save_sec, compile_sec]
+        print(f"{G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+
+        pipelines = {}
+        for processes in sorted({1, args.processes}):
+            tables, read_sec = timed(lambda: GraphTables.read_graphml(args.graphml))
+            _, score_sec = timed(lambda: score_tables(tables, processes=processes))
+            _, write_sec = timed(lambda: tables.write_graphml(os.path.join(tmp, 'pipeline.graphml'), processes))
+            _, compile_sec = timed(lambda: compile_snapshot_tables(tables, os.path.join(tmp, 'pipeline_snapshot')))
+            pipelines[processes] = [read_sec, score_sec, write_sec, compile_sec]
+
+    print(f"  {'':24s} {'load':>8s} {'score':>8s} {'save':>8s} {'snapshot':>8s} {'total':>8s}")
+    print(f"  {'notebook loop':24s} " + ' '.join(f"{sec:8.2f}" for sec in notebook) + f" {sum(notebook):8.2f}")
+    for processes, stages in pipelines.items():
+        print(f"  {f'pipeline, {processes} processes':24s} " + ' '.join(f"{sec:8.2f}" for sec in stages)
+              + f" {sum(stages):8.2f} ({sum(notebook) / sum(stages):.1f}x)")
+
+    # lanes values are strings in the graph but floats in the notebook maps, so the loop never scores
+    # them; the pipeline matches them numerically, differences are expected on edges with lanes
+    edge_data = {(u, v, k): data for u, v, k, data in G.edges(keys=True, data=True)}
+    edge_items = [edge_data[edge] for edge in zip(tables.edges['u'], tables.edges['v'], tables.edges['key'])]
+    node_items = [G.nodes[node] for node in tables.nodes['node']]
+    for name, items, table in (('edge', edge_items, 'edges'), ('node', node_items, 'nodes')):
+        for attr in ('safety_score', 'comfort_score'):
+            old = np.array([data[attr] for data in items], dtype=np.float64)
+            new = tables.numeric(table, attr)
+            print(f"  {name} {attr}: {int(np.sum(~np.isclose(new, old, equal_nan=True)))} differ, max abs difference "
+                  f"{np.nanmax(np.abs(new - old)) if len(new) else 0:.4f}")
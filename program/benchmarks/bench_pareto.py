@@ -0,0 +1,68 @@
+"""
+Pareto front (RouteEngine.pareto_paths) vs one diverse search per slider setting: time of a slider
+session of --settings random weight vectors per pair (diverse: a search for every setting, pareto:
+one front then re-ranking only), front size, and how far the best front route is from the optimal
+route of each setting's combined edge cost.
+
+Run from the program directory:
+    python -m benchmarks.bench_pareto --pairs 10 --settings 20
+"""
+import time
+import argparse
+import numpy as np
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import combined_scores
+from benchmarks.bench_graph_tiles import trip_pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--pairs', type=int, default=10)
+    parser.add_argument('--settings', type=int, default=20, help="slider settings per pair")
+    parser.add_argument('--routes', type=int, default=20, help="routes kept from each front")
+    parser.add_argument('--min-length', type=float, default=1000)
+    parser.add_argument('--max-length', type=float, default=8000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    engine = RouteEngine(snapshot)
+    objectives = engine.objective_costs()
+    rng = np.random.default_rng(args.seed)
+    pairs = trip_pairs(snapshot, args.min_length, args.max_length, args.pairs, rng)
+    print(f"{snapshot.n_nodes} nodes / {snapshot.n_edges} edges, {len(pairs)} pairs of "
+          f"{args.min_length:.0f}-{args.max_length:.0f} m, {args.settings} slider settings each")
+
+    diverse_sec = pareto_sec = 0.0
+    front_sizes, gaps, incomplete = [], [], 0
+    for source, target in pairs:
+        settings = rng.dirichlet([1, 1, 1], args.settings)
+
+        start = time.perf_counter()
+        for weights in settings:
+            engine.k_diverse_paths(source, target, 5, *weights)
+        diverse_sec += time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, costs, complete = engine.pareto_paths(source, target, args.routes)
+        costs = np.array(costs)
+        for weights in settings:
+            combined_scores(costs[:, 0], -costs[:, 1], -costs[:, 2], *weights).argmax()
+        pareto_sec += time.perf_counter() - start
+        front_sizes.append(len(costs))
+        incomplete += not complete
+
+        for weights in settings:
+            edge_costs = weights[0] * objectives[0] + weights[1] * objectives[1] + weights[2] * objectives[2]
+            optimum, _ = engine.shortest_path(source, target, memoryview(edge_costs),
+                                              engine.potentials(source, target, weights[0]))
+            gaps.append((costs @ weights).min() / optimum - 1)
+
+    n = len(pairs)
+    print(f"  slider session per pair: diverse {diverse_sec / n * 1000:8.1f} ms, "
+          f"pareto {pareto_sec / n * 1000:8.1f} ms ({diverse_sec / pareto_sec:.1f}x)")
+    print(f"  front: {np.mean(front_sizes):.1f} routes on average, {incomplete} searches hit the label limit")
+    print(f"  best front route vs weighted optimum: mean {np.mean(gaps):+.3%}, max {np.max(gaps):+.3%}")
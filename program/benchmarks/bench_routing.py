@@ -0,0 +1,87 @@
+"""
+Compare Yen's k-shortest paths on length (plus rescoring) with the native diverse router.
+
+Run from the program directory:
+    python -m benchmarks.bench_routing --pairs 20 --k 5
+"""
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+import osmnx as ox
+
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH
+from route_engine import RouteEngine
+
+
+def edge_overlap(routes):
+    """
+    Mean pairwise Jaccard similarity of the edge sets of the routes (lower means more diverse)
+    """
+    edge_sets = [set(zip(route[:-1], route[1:])) for route in routes]
+    pairs = list(itertools.combinations(edge_sets, 2))
+    if not pairs:
+        return 1.0
+    return float(np.mean([len(a & b) / len(a | b) for a, b in pairs]))
+
+
+def route_cost_spread(engine, snapshot, routes, weights):
+    """
+    Relative spread (max / min - 1) of the combined cost over the candidate routes
+    """
+    costs = engine.edge_costs(*weights)
+    totals = []
+    for route in routes:
+        idx = snapshot.node_indices(route)
+        total = 0.0
+        for u, v in zip(idx[:-1], idx[1:]):
+            edges = [e for e in snapshot.out_edges(u) if snapshot.indices[e] == v]
+            total += min(costs[e] for e in edges)
+        totals.append(total)
+    return max(totals) / max(min(totals), 1e-9) - 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    G = ox.load_graphml(args.graphml)
+    snapshot = GraphSnapshot.load(args.snapshot)
+    engine = RouteEngine(snapshot)
+    weights = (0.3, 0.4, 0.3)  # distance, safety, comfort
+
+    rng = random.Random(args.seed)
+    node_ids = snapshot.node_ids.tolist()
+    results = {'yen': {'sec': [], 'overlap': [], 'spread': []},
+               'diverse': {'sec': [], 'overlap': [], 'spread': []}}
+
+    for _ in range(args.pairs):
+        source, target = rng.sample(node_ids, 2)
+
+        start = time.perf_counter()
+        try:
+            yen_routes = list(ox.routing.k_shortest_paths(G, source, target, args.k, weight="length"))
+        except Exception:
+            continue
+        results['yen']['sec'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        s, t = snapshot.node_index(source), snapshot.node_index(target)
+        edge_paths = engine.k_diverse_paths(s, t, args.k, *weights)
+        diverse_routes = [snapshot.node_ids[engine.path_nodes(s, path)].tolist() for path in edge_paths]
+        results['diverse']['sec'].append(time.perf_counter() - start)
+
+        for mode, routes in (('yen', yen_routes), ('diverse', diverse_routes)):
+            results[mode]['overlap'].append(edge_overlap(routes))
+            results[mode]['spread'].append(route_cost_spread(engine, snapshot, routes, weights))
+
+    for mode, result in results.items():
+        print(f"{mode:>8}: {np.mean(result['sec']) * 1000:8.1f} ms/query, "
+              f"edge overlap {np.mean(result['overlap']):.3f}, "
+              f"combined-cost spread {np.mean(result['spread']) * 100:.1f}%")
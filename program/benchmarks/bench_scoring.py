@@ -0,0 +1,65 @@
+"""
+Per-route scoring time: dict-based evaluateRouteScores + route_to_gdf vs the batched RouteScorer.
+
+Run from the program directory:
+    python -m benchmarks.bench_scoring --pairs 20 --k 5
+"""
+import time
+import random
+import argparse
+import numpy as np
+import osmnx as ox
+
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer
+from route_network import RouteNetwork
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    engine = RouteEngine(snapshot)
+    scorer = RouteScorer(snapshot)
+
+    # The dict-based path only needs the graph, skip the TfL download of RouteNetwork.__init__
+    legacy = RouteNetwork.__new__(RouteNetwork)
+    legacy._G = ox.load_graphml(args.graphml)
+    legacy.scorer = None
+
+    rng = random.Random(args.seed)
+    routes = []
+    while len(routes) < args.pairs * args.k:
+        s, t = rng.sample(range(snapshot.n_nodes), 2)
+        for path in engine.k_diverse_paths(s, t, args.k, 0.3, 0.4, 0.3):
+            routes.append(snapshot.node_ids[engine.path_nodes(s, path)].tolist())
+
+    start = time.perf_counter()
+    legacy_metrics = []
+    for route in routes:
+        safety, comfort, streets, coverage = legacy.evaluateRouteScores(route)
+        gdf = ox.routing.route_to_gdf(legacy.G, route, weight="length")
+        legacy_metrics.append((safety, comfort, streets, coverage, gdf["length"].sum(),
+                               sum(int(num) for num in gdf['casualty_count'])))
+    legacy_sec = (time.perf_counter() - start) / len(routes)
+
+    start = time.perf_counter()
+    metrics, _ = scorer.score_node_routes([snapshot.node_indices(route) for route in routes])
+    batched_sec = (time.perf_counter() - start) / len(routes)
+
+    new_metrics = np.column_stack([metrics[name] for name in ('safety_factor', 'comfort_factor', 'street_count',
+                                                               'cycleway_coverage', 'total_length', 'accidents_count')])
+    max_diff = np.abs(new_metrics - np.array(legacy_metrics, dtype=np.float64)).max(axis=0)
+
+    print(f"{len(routes)} routes")
+    print(f"  dict + route_to_gdf: {legacy_sec * 1e6:10.1f} us/route")
+    print(f"  batched RouteScorer: {batched_sec * 1e6:10.1f} us/route ({legacy_sec / batched_sec:.0f}x)")
+    print(f"  max abs difference (safety, comfort, streets, coverage, length, accidents): "
+          f"{np.array2string(max_diff, precision=4)}")
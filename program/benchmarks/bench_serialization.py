@@ -0,0 +1,71 @@
+"""
+Per-request route serialization: route_to_gdf + {"lat", "lon"} dicts vs snapshot geometry slices,
+and payload size / encoding time of the json, polyline and binary /route formats.
+
+Run from the program directory:
+    python -m benchmarks.bench_serialization --pairs 20 --k 5
+"""
+import json
+import time
+import random
+import argparse
+import osmnx as ox
+
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer
+from route_network import RouteNetwork
+from route_geometry import encode_polyline, pack_routes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    engine = RouteEngine(snapshot)
+
+    # Skip the TfL download of RouteNetwork.__init__, only the geometry lookups are needed
+    legacy = RouteNetwork.__new__(RouteNetwork)
+    legacy._G = ox.load_graphml(args.graphml)
+    legacy.snapshot = None
+    network = RouteNetwork.__new__(RouteNetwork)
+    network.snapshot = snapshot
+    network.scorer = RouteScorer(snapshot)
+
+    rng = random.Random(args.seed)
+    requests = []
+    while len(requests) < args.pairs:
+        s, t = rng.sample(range(snapshot.n_nodes), 2)
+        paths = engine.k_diverse_paths(s, t, args.k, 0.3, 0.4, 0.3)
+        if paths:
+            requests.append([snapshot.node_ids[engine.path_nodes(s, path)].tolist() for path in paths])
+
+    def timed(fn):
+        start = time.perf_counter()
+        results = [fn(routes) for routes in requests]
+        return results, (time.perf_counter() - start) / len(requests)
+
+    _, legacy_sec = timed(lambda routes: json.dumps(
+        [[{"lat": lat, "lon": lon} for lat, lon in legacy.route_coordinates(route).tolist()] for route in routes]))
+    points, slice_sec = timed(lambda routes: [network.route_coordinates(route) for route in routes])
+    print(f"{len(requests)} requests of up to {args.k} routes, {sum(map(len, points[0]))} points in the first")
+    print(f"  route_to_gdf + dicts + json:  {legacy_sec * 1000:8.2f} ms/request")
+    print(f"  geometry slices:              {slice_sec * 1000:8.2f} ms/request")
+
+    encoders = {
+        'json': lambda routes: json.dumps([[{"lat": lat, "lon": lon} for lat, lon in p.tolist()] for p in routes]).encode(),
+        'polyline': lambda routes: json.dumps([encode_polyline(p) for p in routes]).encode(),
+        'binary': pack_routes,
+    }
+    for name, encode in encoders.items():
+        start = time.perf_counter()
+        payloads = [encode(routes) for routes in points]
+        encode_sec = (time.perf_counter() - start) / len(points)
+        size = sum(map(len, payloads)) / len(payloads)
+        print(f"  {name:8s} encode {encode_sec * 1000:8.3f} ms/request, payload {size / 1024:8.1f} KiB/request")
@@ -0,0 +1,60 @@
+"""
+Per-request snapping latency: ox.distance.nearest_nodes on the NetworkX graph vs the persistent
+KD-tree, plus batch edge snapping of accident-sized point sets.
+
+Run from the program directory:
+    python -m benchmarks.bench_snapping --requests 200 --points 15000
+"""
+import time
+import argparse
+import numpy as np
+import osmnx as ox
+
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH
+from spatial_index import SpatialIndex
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--points', type=int, default=15000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    G = ox.load_graphml(args.graphml)
+    snapshot = GraphSnapshot.load(args.snapshot)
+    start = time.perf_counter()
+    index = SpatialIndex.load(snapshot)
+    load_sec = time.perf_counter() - start
+
+    rng = np.random.default_rng(args.seed)
+    lats = rng.uniform(np.min(snapshot.y), np.max(snapshot.y), args.requests * 2)
+    lons = rng.uniform(np.min(snapshot.x), np.max(snapshot.x), args.requests * 2)
+
+    # A request snaps a start and an end station
+    start = time.perf_counter()
+    for i in range(0, len(lats), 2):
+        ox.distance.nearest_nodes(G, X=lons[i], Y=lats[i], return_dist=True)
+        ox.distance.nearest_nodes(G, X=lons[i + 1], Y=lats[i + 1], return_dist=True)
+    osmnx_sec = (time.perf_counter() - start) / args.requests
+
+    start = time.perf_counter()
+    for i in range(0, len(lats), 2):
+        index.nearest_nodes(lats[i:i + 2], lons[i:i + 2])
+    index_sec = (time.perf_counter() - start) / args.requests
+
+    print(f"KD-tree load: {load_sec * 1000:.1f} ms")
+    print(f"node snapping per request: osmnx {osmnx_sec * 1000:.2f} ms, KD-tree {index_sec * 1000:.3f} ms")
+
+    lats = rng.uniform(np.min(snapshot.y), np.max(snapshot.y), args.points)
+    lons = rng.uniform(np.min(snapshot.x), np.max(snapshot.x), args.points)
+    start = time.perf_counter()
+    ox.distance.nearest_edges(G, X=lons, Y=lats)
+    osmnx_sec = time.perf_counter() - start
+    index.edge_tree  # STR-tree is built once per process, outside the timed batch
+    start = time.perf_counter()
+    index.nearest_edges(lats, lons)
+    index_sec = time.perf_counter() - start
+    print(f"edge snapping of {args.points} points: osmnx {osmnx_sec:.2f} sec, STR-tree {index_sec:.2f} sec")
@@ -0,0 +1,112 @@
+"""
+Offline benchmark fixtures: a synthetic scored street grid over central London (GraphML and compiled
+snapshot) and a TfL live cycle hire XML with stations placed on it. Everything is generated from a
+seed, so two runs with the same arguments benchmark exactly the same network and stations.
+"""
+import os
+import json
+import numpy as np
+import networkx as nx
+import osmnx as ox
+from xml.sax.saxutils import escape
+
+from graph_snapshot import GraphSnapshot, compile_snapshot
+
+
+# South-west corner of the grid and spacing between grid streets in degrees (about 110 m by 100 m)
+GRID_ORIGIN = (51.49, -0.16)
+GRID_SPACING = (0.001, 0.0015)
+HIGHWAY_TYPES = ['residential', 'primary', 'secondary', 'tertiary', 'cycleway']
+JUNCTION_TYPES = ['', 'traffic_signals', 'crossing']
+# Share of grid streets missing, so routes have to detour like on a real network
+MISSING_STREET_SHARE = 0.07
+STREET_NAMES = ['Street', 'Road', 'Square', 'Place', 'Lane', 'Gardens']
+
+
+def synthetic_network(size=60, seed=0):
+    """
+    Scored MultiDiGraph on a size × size grid with the node and edge attributes of the London network
+    (scores, street counts, highway types, casualties), two-way streets and a few parallel edges
+    """
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    lat0, lon0 = GRID_ORIGIN
+    node_ids = 1_000_000 + np.arange(size * size).reshape(size, size)
+    lats = lat0 + np.arange(size)[:, None] * GRID_SPACING[0] + rng.uniform(-2e-4, 2e-4, (size, size))
+    lons = lon0 + np.arange(size)[None, :] * GRID_SPACING[1] + rng.uniform(-2e-4, 2e-4, (size, size))
+    for i in range(size):
+        for j in range(size):
+            G.add_node(int(node_ids[i, j]), y=float(lats[i, j]), x=float(lons[i, j]),
+                       street_count=int(rng.integers(1, 5)), highway=JUNCTION_TYPES[rng.integers(len(JUNCTION_TYPES))],
+                       safety_score=float(rng.uniform(-1, 1)), comfort_score=float(rng.uniform(-1, 1)))
+
+    def add_street(a, b):
+        length = float(ox.distance.great_circle(lats[a], lons[a], lats[b], lons[b]))
+        osmid = int(rng.integers(1, 10 ** 9))
+        highway = HIGHWAY_TYPES[rng.integers(len(HIGHWAY_TYPES))]
+        parallel = 2 if rng.random() < 0.05 else 1
+        for u, v in ((a, b), (b, a)):
+            for key in range(parallel):
+                G.add_edge(int(node_ids[u]), int(node_ids[v]), key=key, osmid=osmid, highway=highway,
+                           length=length * (1 + 0.2 * key), casualty_count=int(rng.choice(3, p=[0.85, 0.1, 0.05])),
+                           accident_score=0.0, safety_score=float(rng.uniform(-2, 2)),
+                           comfort_score=float(rng.uniform(-2, 2)))
+
+    for i in range(size):
+        for j in range(size):
+            if j + 1 < size and rng.random() >= MISSING_STREET_SHARE:
+                add_street((i, j), (i, j + 1))
+            if i + 1 < size and rng.random() >= MISSING_STREET_SHARE:
+                add_street((i, j), (i + 1, j))
+    return G
+
+
+def station_feed_xml(snapshot, n_stations=200, seed=0):
+    """
+    TfL live cycle hire XML with n_stations stations a few metres off random snapshot nodes;
+    about one in ten stations is empty, so start station lookups skip some matches
+    """
+    rng = np.random.default_rng(seed)
+    nodes = rng.choice(snapshot.n_nodes, n_stations, replace=False)
+    parts = ['<?xml version="1.0" encoding="utf-8"?><stations lastUpdate="0" version="2.0">']
+    for station_id, node in enumerate(nodes.tolist(), start=1):
+        name = f"Station {station_id} {STREET_NAMES[station_id % len(STREET_NAMES)]}, Fixture"
+        docks = int(rng.integers(10, 40))
+        bikes = 0 if rng.random() < 0.1 else int(rng.integers(1, docks))
+        parts.append(
+            f'<station><id>{station_id}</id><name>{escape(name)}</name><terminalName>{station_id:06d}</terminalName>'
+            f'<lat>{snapshot.y[node] + rng.normal(0, 1e-4):.6f}</lat><long>{snapshot.x[node] + rng.normal(0, 1e-4):.6f}</long>'
+            f'<installed>true</installed><locked>false</locked><temporary>false</temporary>'
+            f'<nbBikes>{bikes}</nbBikes><nbStandardBikes>{bikes}</nbStandardBikes><nbEBikes>0</nbEBikes>'
+            f'<nbEmptyDocks>{docks - bikes}</nbEmptyDocks><nbDocks>{docks}</nbDocks></station>')
+    parts.append('</stations>')
+    return ''.join(parts)
+
+
+def build_fixtures(workdir, size=60, n_stations=200, seed=0):
+    """
+    Write (or reuse, when built with the same arguments) the fixture GraphML, snapshot and station XML
+    under workdir. Return their paths.
+    """
+    params = {'size': size, 'stations': n_stations, 'seed': seed}
+    paths = {
+        'graphml': os.path.join(workdir, 'network.graphml'),
+        'snapshot': os.path.join(workdir, 'snapshot'),
+        'stations': os.path.join(workdir, 'stations.xml'),
+    }
+    params_path = os.path.join(workdir, 'fixtures.json')
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            if json.load(f) == params and all(os.path.exists(path) for path in paths.values()):
+                return paths
+
+    os.makedirs(workdir, exist_ok=True)
+    G = synthetic_network(size, seed)
+    ox.save_graphml(G, paths['graphml'])
+    compile_snapshot(G, paths['snapshot'])
+    snapshot = GraphSnapshot.load(paths['snapshot'])
+    with open(paths['stations'], 'w', encoding='utf-8') as f:
+        f.write(station_feed_xml(snapshot, n_stations, seed))
+    with open(params_path, 'w') as f:
+        json.dump(params, f)
+    return paths
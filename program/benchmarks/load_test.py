@@ -0,0 +1,87 @@
+"""
+Closed-loop load test of a running server: each client sends /route and /search requests back to back
+(station names and preference weights drawn at random) for a fixed time. Reports p50/p99 latency,
+throughput and error statuses per endpoint at every concurrency level.
+
+Start the server first, then run from the program directory:
+    gunicorn -c gunicorn.conf.py app:app
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --concurrency 1 4 16 --duration 20
+"""
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+import numpy as np
+import requests
+
+
+def station_names(url, queries='aeiou', limit=100):
+    names = set()
+    for query in queries:
+        response = requests.get(f'{url}/search', params={'query': query, 'limit': limit}, timeout=30)
+        names.update(row['name'] for row in response.json())
+    return sorted(names)
+
+
+def client(url, names, route_share, deadline, rng, results):
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        if rng.random() < route_share:
+            endpoint = '/route'
+            start, end = rng.sample(names, 2)
+            params = {'start': start, 'end': end, 'distance': rng.random(), 'safety': rng.random(),
+                      'comfort': rng.random(), 'format': 'polyline'}
+        else:
+            endpoint = '/search'
+            name = rng.choice(names)
+            params = {'query': name[:rng.randint(2, max(2, len(name)))]}
+        start_time = time.perf_counter()
+        try:
+            status = session.get(url + endpoint, params=params, timeout=120).status_code
+        except requests.exceptions.RequestException:
+            status = 'error'
+        results.append((endpoint, status, time.perf_counter() - start_time))
+
+
+def run_level(url, names, concurrency, duration, route_share, seed):
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(url, names, route_share, deadline,
+                                                     random.Random(seed + i), results))
+               for i in range(concurrency)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=20, help="seconds per concurrency level")
+    parser.add_argument('--route-share', type=float, default=0.5, help="fraction of requests that are /route")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = station_names(args.url)
+    print(f"{len(names)} stations, {args.duration:.0f} sec per level, {args.route_share:.0%} /route")
+    for concurrency in args.concurrency:
+        results, elapsed = run_level(args.url, names, concurrency, args.duration, args.route_share, args.seed)
+        by_endpoint = defaultdict(list)
+        for endpoint, status, latency in results:
+            by_endpoint[endpoint].append((status, latency))
+        for endpoint, rows in sorted(by_endpoint.items()):
+            ok = [latency for status, latency in rows if status == 200]
+            statuses = defaultdict(int)
+            for status, _ in rows:
+                if status != 200:
+                    statuses[status] += 1
+            latency = (f"p50 {np.percentile(ok, 50) * 1000:8.1f} ms, p99 {np.percentile(ok, 99) * 1000:8.1f} ms"
+                       if ok else "no successful requests")
+            errors = ', '.join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str))
+            print(f"  {concurrency:3d} clients {endpoint:>7}: {len(rows) / elapsed:7.1f} req/sec, {latency}"
+                  + (f", errors {errors}" if errors else ""))
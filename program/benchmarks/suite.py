@@ -0,0 +1,244 @@
+"""
+Reproducible benchmark suite for the routing and scoring hot paths, offline on the synthetic fixtures
+(benchmarks/fixtures.py): graph load, get_nearest_road_node, findKBestRoutes, evaluateRouteScores,
+/search and /route end to end over a fixed set of station pairs and weight settings. Every case
+reports latency percentiles and the peak Python allocation (tracemalloc, measured in a separate pass
+so it does not slow down the timed one). Results are written as JSON; --compare prints the change
+against an earlier run and exits with status 1 when a case got slower than the threshold.
+
+Run from the program directory:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --output bench-new.json --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import numpy as np
+import osmnx as ox
+
+from benchmarks.fixtures import build_fixtures
+from graph_snapshot import GraphSnapshot
+
+
+# name -> (distance, safety, comfort) slider values, as sent to /route
+WEIGHT_SETTINGS = {
+    'distance': (1.0, 0.0, 0.0),
+    'balanced': (0.4, 0.4, 0.2),
+    'safety': (0.1, 0.7, 0.2),
+    'comfort': (0.1, 0.2, 0.7),
+}
+# Relative p50 slow-down reported as a regression by --compare
+REGRESSION_THRESHOLD = 0.2
+
+
+def run_case(calls, repeat=1, setup=None):
+    """
+    Time every call (repeat passes over calls), then run one more pass under tracemalloc for the
+    peak allocation. setup runs before every pass, e.g. to clear caches.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        for call in calls:
+            call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = np.array(times) * 1000
+    return {
+        'calls': len(times),
+        'mean_ms': float(times.mean()),
+        'p50_ms': float(np.percentile(times, 50)),
+        'p95_ms': float(np.percentile(times, 95)),
+        'max_ms': float(times.max()),
+        'total_sec': float(times.sum() / 1000),
+        'peak_alloc_mb': peak / 2 ** 20,
+    }
+
+
+def od_pairs(station_df, n_pairs, seed):
+    """
+    Fixed origin-destination station names, between stations with bikes (station lookups skip empty ones)
+    """
+    rng = random.Random(seed)
+    names = sorted(station_df.loc[station_df['valid'], 'name'])
+    pairs = []
+    while len(pairs) < n_pairs:
+        start, end = rng.choice(names), rng.choice(names)
+        if start != end:
+            pairs.append((start, end))
+    return pairs
+
+
+def search_queries(station_df, n_queries, seed):
+    rng = random.Random(seed)
+    names = sorted(station_df['name'])
+    queries = []
+    for _ in range(n_queries):
+        name = rng.choice(names)
+        queries.append(name[:rng.randint(3, len(name))] if rng.random() < 0.7 else rng.choice(name.split()))
+    return queries
+
+
+def normalized(weights):
+    total = sum(weights)
+    return tuple(w / total for w in weights)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(paths, n_pairs, repeat, seed):
+    # imported here: app builds its RouteNetwork from the environment at import time
+    os.environ['GRAPHML_PATH'] = paths['graphml']
+    os.environ['SNAPSHOT_PATH'] = paths['snapshot']
+    os.environ['STATION_FEED_URL'] = paths['stations']
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from route_network import RouteNetwork
+
+    def load_snapshot():
+        snapshot = GraphSnapshot.load(paths['snapshot'])
+        # touch the arrays a query would use so the pages are really mapped
+        float(snapshot.length.sum()), float(snapshot.safety_score.sum())
+
+    results = {
+        'graph_load_graphml': run_case([lambda: ox.load_graphml(paths['graphml'])], repeat),
+        'graph_load_snapshot': run_case([load_snapshot], repeat),
+    }
+
+    # without route caches, so every findKBestRoutes call searches and scores
+    network = RouteNetwork(graphml_path=paths['graphml'], snapshot_path=paths['snapshot'],
+                           station_feed_url=paths['stations'], station_refresh_interval=0, route_cache_size=0)
+    stations = network.station_df
+    pairs = od_pairs(stations, n_pairs, seed)
+    results['nearest_road_node'] = run_case(
+        [lambda lat=lat, lon=lon: network.get_nearest_road_node(lat, lon)
+         for lat, lon in zip(stations['lat'].tolist(), stations['lon'].tolist())], repeat)
+
+    nodes = dict(zip(stations['name'], stations['node'].astype(int).tolist()))
+    routes = []
+
+    def find_k_best(start, end, weights):
+        distance_weight, safety_weight, comfort_weight = normalized(weights)
+        ranked = network.findKBestRoutes(nodes[start], nodes[end], 5, safety_weight=safety_weight,
+                                         comfort_weight=comfort_weight, distance_weight=distance_weight)
+        routes.extend(detail.node_ids(network.snapshot) for detail in ranked)
+
+    for name, weights in WEIGHT_SETTINGS.items():
+        results[f'find_k_best_routes_{name}'] = run_case(
+            [lambda start=start, end=end: find_k_best(start, end, weights) for start, end in pairs], repeat)
+    routes = routes[:n_pairs * 5]
+    results['evaluate_route_scores'] = run_case([lambda route=route: network.evaluateRouteScores(route)
+                                                 for route in routes], repeat)
+
+    import app as app_module
+    client = app_module.app.test_client()
+    server_network = app_module.route_network
+
+    def request(path, params):
+        response = client.get(path, query_string=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} {params} answered {response.status_code}: {response.get_data(as_text=True)[:200]}")
+
+    results['search'] = run_case([lambda query=query: request('/search', {'query': query})
+                                  for query in search_queries(stations, n_pairs * 5, seed)], repeat)
+
+    route_calls = [lambda start=start, end=end, weights=weights: request('/route', {
+        'start': start, 'end': end, 'distance': weights[0], 'safety': weights[1], 'comfort': weights[2]})
+        for start, end in pairs for weights in WEIGHT_SETTINGS.values()]
+
+    def clear_route_caches():
+        server_network.candidate_cache.clear()
+        server_network.result_cache.clear()
+
+    results['route_cold'] = run_case(route_calls, repeat, setup=clear_route_caches)
+    results['route_warm'] = run_case(route_calls, repeat)
+    server_network.stop_station_refresh()
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Print the p50 change of every case against a baseline run; return the names of regressed cases
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"  {name:<36} new")
+            continue
+        change = result['p50_ms'] / max(before['p50_ms'], 1e-9) - 1
+        memory = result['peak_alloc_mb'] - before['peak_alloc_mb']
+        flag = "  REGRESSION" if change > threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"  {name:<36} p50 {before['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} ms ({change:+7.1%}), "
+              f"peak alloc {memory:+8.2f} MB{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'bike_route_bench'),
+                        help="where the fixtures are generated (reused between runs)")
+    parser.add_argument('--grid', type=int, default=60, help="synthetic street grid size (grid × grid nodes)")
+    parser.add_argument('--stations', type=int, default=200)
+    parser.add_argument('--pairs', type=int, default=20, help="origin-destination station pairs")
+    parser.add_argument('--repeat', type=int, default=3, help="timed passes per case")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    paths = build_fixtures(args.workdir, args.grid, args.stations, args.seed)
+    results = run_suite(paths, args.pairs, args.repeat, args.seed)
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'fixtures': {'grid': args.grid, 'stations': args.stations, 'seed': args.seed},
+        'pairs': args.pairs,
+        'repeat': args.repeat,
+        'weights': WEIGHT_SETTINGS,
+        'results': results,
+    }
+
+    for name, result in results.items():
+        print(f"  {name:<36} {result['calls']:5d} calls, p50 {result['p50_ms']:9.3f} ms, "
+              f"p95 {result['p95_ms']:9.3f} ms, peak alloc {result['peak_alloc_mb']:8.2f} MB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.compare} (commit {str(baseline.get('commit'))[:12]}):")
+        if any(baseline.get(key) != report[key] for key in ('fixtures', 'pairs', 'weights')):
+            print("  note: the baseline ran with other fixtures, pairs or weights, so timings are not comparable")
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
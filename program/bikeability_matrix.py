@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+import shapely
+from multiprocessing import Pool
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer
+from spatial_index import SpatialIndex
+from station_routes import PRECOMPUTE_WEIGHTS
+
+
+BIKEABILITY_PATH = '../data/bikeability'
+
+# matrix name -> RouteScorer metric, each stored as a stations x stations float32 .npy (NaN: no route)
+MATRIX_METRICS = {
+    'distance': 'total_length',
+    'safety': 'safety_factor',
+    'comfort': 'comfort_factor',
+    'cycleway_coverage': 'cycleway_coverage',
+    'accidents': 'accidents_count',
+}
+
+# Network distances (metres) of the isochrones computed around every station
+ISOCHRONE_DISTANCES = (1000, 2500, 5000)
+# shapely.concave_hull ratio of the isochrone polygons (0 follows the reached nodes closely, 1 is the convex hull)
+ISOCHRONE_HULL_RATIO = 0.3
+
+# Stations completed between two saves of the matrices, isochrones and manifest
+CHECKPOINT_INTERVAL = 50
+
+
+# Per-process state of the matrix pool, the snapshot is memory-mapped so workers share its pages
+_worker = {}
+
+
+def _init_worker(snapshot_path, weights):
+    snapshot = GraphSnapshot.load(snapshot_path)
+    engine = RouteEngine(snapshot)
+    _worker['snapshot'] = snapshot
+    _worker['engine'] = engine
+    _worker['scorer'] = RouteScorer(snapshot)
+    _worker['costs'] = engine.costs(*weights)
+    _worker['lengths'] = engine.costs(1.0, 0.0, 0.0)
+
+
+def _tree_metrics(source, targets, reverse):
+    """
+    Matrix metrics of the routes from source to every target (to source from every target when
+    reverse) as a (len(MATRIX_METRICS), len(targets)) float32 array
+    """
+    engine, scorer = _worker['engine'], _worker['scorer']
+    _, pred = engine.shortest_path_tree(source, _worker['costs'], targets, reverse=reverse)
+    metrics = scorer.score_tree(source, pred, reverse)
+    return np.array([metrics[name][targets] for name in MATRIX_METRICS.values()], dtype=np.float32)
+
+
+def _isochrones(source, distances):
+    """
+    (max distance, reached nodes, polygon WKB) of every isochrone around a node index
+    """
+    snapshot, engine = _worker['snapshot'], _worker['engine']
+    dist, _ = engine.shortest_path_tree(source, _worker['lengths'], max_cost=max(distances))
+    dist = np.asarray(dist)
+    rows = []
+    for max_distance in distances:
+        reached = np.flatnonzero(dist <= max_distance)
+        points = shapely.multipoints(np.column_stack([np.asarray(snapshot.x)[reached], np.asarray(snapshot.y)[reached]]))
+        rows.append((max_distance, len(reached), shapely.to_wkb(shapely.concave_hull(points, ratio=ISOCHRONE_HULL_RATIO))))
+    return rows
+
+
+def _station_task(task):
+    kind, station, source, targets, distances = task
+    start_time = time.time()
+    values = _tree_metrics(source, targets, reverse=kind == 'column')
+    isochrones = _isochrones(source, distances) if kind == 'row' else []
+    return kind, station, values, isochrones, time.time() - start_time
+
+
+class BikeabilityMatrix:
+    """
+    Dense station-to-station bikeability matrices (distance, safety, comfort, cycleway coverage and
+    accidents of the route between every pair of TfL stations) stored as memory-mapped float32 .npy
+    files, plus reachable-within-distance isochrones per station.
+
+    Every row comes from one one-to-all multi-criteria search from its station (combined cost with
+    fixed weights) scored for all stations at once. Updates are incremental: an interrupted build
+    resumes with the unfinished rows, and when stations are added the kept rows only get the new
+    columns, each filled by one reverse search from the new station.
+    """
+
+    def __init__(self, path=BIKEABILITY_PATH):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.isochrones_path = os.path.join(path, 'isochrones.parquet')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        self.matrices = {}
+
+    @classmethod
+    def open(cls, path=BIKEABILITY_PATH, snapshot=None):
+        """
+        Open complete matrices read-only, or return None if they are missing, unfinished or were
+        built for another snapshot than the given one
+        """
+        store = cls(path)
+        manifest = store.manifest
+        if not manifest or manifest.get('pending_columns') or len(manifest.get('completed', [])) < len(manifest.get('stations', [])):
+            return None
+        if snapshot is not None and manifest.get('snapshot_version') != snapshot.version:
+            return None
+        store._open_matrices(len(manifest['stations']), mode='r')
+        return store
+
+    @property
+    def station_ids(self):
+        return [station_id for station_id, _ in self.manifest.get('stations', [])]
+
+    def _matrix_path(self, name):
+        return os.path.join(self.path, f'{name}.npy')
+
+    def _open_matrices(self, n, mode):
+        self.matrices = {name: np.load(self._matrix_path(name), mmap_mode=mode) for name in MATRIX_METRICS}
+        if any(matrix.shape != (n, n) for matrix in self.matrices.values()):
+            raise ValueError(f"Bikeability matrices in {self.path} do not match the manifest")
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def isochrones(self):
+        """
+        Isochrones as a DataFrame: station_id, max_distance (metres), n_nodes, geometry (shapely polygon)
+        """
+        if not os.path.exists(self.isochrones_path):
+            return pd.DataFrame(columns=['station_id', 'max_distance', 'n_nodes', 'geometry'])
+        df = pd.read_parquet(self.isochrones_path)
+        df['geometry'] = shapely.from_wkb(df['geometry'].values)
+        return df
+
+    def lookup(self, origin_id, dest_id):
+        """
+        {metric: value} of the route between two stations, None if a station is not in the matrices
+        """
+        index = {station_id: i for i, station_id in enumerate(self.station_ids)}
+        if origin_id not in index or dest_id not in index:
+            return None
+        i, j = index[origin_id], index[dest_id]
+        return {name: float(matrix[i, j]) for name, matrix in self.matrices.items()}
+
+    def _resize(self, old_stations, stations):
+        """
+        Move the values of the kept stations into new matrices for the station list stations (others NaN)
+        """
+        n = len(stations)
+        old_index = {tuple(station): i for i, station in enumerate(old_stations)}
+        kept = [(old_index[tuple(station)], i) for i, station in enumerate(stations) if tuple(station) in old_index]
+        old_rows = np.array([old for old, _ in kept], dtype=np.int64)
+        new_rows = np.array([new for _, new in kept], dtype=np.int64)
+        for name in MATRIX_METRICS:
+            tmp_path = self._matrix_path(name) + '.tmp'
+            matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(n, n))
+            matrix[:] = np.nan
+            if len(kept) and os.path.exists(self._matrix_path(name)):
+                old = np.load(self._matrix_path(name), mmap_mode='r')
+                matrix[np.ix_(new_rows, new_rows)] = old[np.ix_(old_rows, old_rows)]
+            matrix.flush()
+            del matrix
+            os.replace(tmp_path, self._matrix_path(name))
+
+    def _checkpoint(self, isochrones):
+        for matrix in self.matrices.values():
+            matrix.flush()
+        rows = [(station_id, *row) for station_id, station_rows in sorted(isochrones.items()) for row in station_rows]
+        df = pd.DataFrame(rows, columns=['station_id', 'max_distance', 'n_nodes', 'geometry'])
+        tmp_path = self.isochrones_path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.isochrones_path)
+        self._save_manifest()
+
+    def update(self, station_df, snapshot_path=SNAPSHOT_PATH, weights=PRECOMPUTE_WEIGHTS,
+               isochrone_distances=ISOCHRONE_DISTANCES, processes=None):
+        """
+        Build the matrices and isochrones for the stations of station_df, or bring them up to date.
+        Everything is recomputed when the snapshot, weights or isochrone distances changed.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        snapshot = GraphSnapshot.load(snapshot_path)
+        weights = [float(w) for w in weights]
+        isochrone_distances = [float(d) for d in isochrone_distances]
+
+        nodes, _ = SpatialIndex.load(snapshot).nearest_nodes(station_df['lat'].values, station_df['lon'].values)
+        stations = sorted(zip(station_df['id'].astype(int).tolist(), nodes.tolist()))
+        stations = [[station_id, node] for station_id, node in stations]
+
+        previous = self.manifest
+        same_setup = (previous.get('snapshot_version') == snapshot.version and previous.get('weights') == weights
+                      and previous.get('isochrone_distances') == isochrone_distances
+                      and all(os.path.exists(self._matrix_path(name)) for name in MATRIX_METRICS))
+        old_stations = previous.get('stations', []) if same_setup else []
+        completed = set(previous.get('completed', [])) if same_setup else set()
+        pending = set(previous.get('pending_columns', [])) if same_setup else set()
+
+        # stations that are new or moved to another node: their rows are searched, and the columns of
+        # the rows that are already complete are filled from one reverse search each
+        old_set = {tuple(station) for station in old_stations}
+        added = {station_id for station_id, node in stations if (station_id, node) not in old_set}
+        current = {station_id for station_id, _ in stations}
+        completed = (completed - added) & current
+        pending = ((pending | added) & current) if completed else set()
+
+        if old_stations != stations or not same_setup:
+            self._resize(old_stations, stations)
+
+        isochrones = {}
+        if completed and os.path.exists(self.isochrones_path):
+            df = pd.read_parquet(self.isochrones_path)
+            df = df[df['station_id'].isin(completed)]
+            for station_id, group in df.groupby('station_id'):
+                isochrones[int(station_id)] = list(group[['max_distance', 'n_nodes', 'geometry']].itertuples(index=False, name=None))
+
+        self.manifest = {
+            'snapshot_version': snapshot.version,
+            'weights': weights,
+            'isochrone_distances': isochrone_distances,
+            'stations': stations,
+            'completed': sorted(completed),
+            'pending_columns': sorted(pending),
+        }
+        self._open_matrices(len(stations), mode='r+')
+        self._checkpoint(isochrones)
+
+        index = {station_id: i for i, (station_id, _) in enumerate(stations)}
+        targets = [node for _, node in stations]
+        tasks = [('row', station_id, node, targets, isochrone_distances)
+                 for station_id, node in stations if station_id not in completed]
+        tasks += [('column', station_id, node, targets, []) for station_id, node in stations if station_id in pending]
+        # the rows complete before this update, the only ones a column search has to fill
+        column_rows = np.array(sorted(index[station_id] for station_id in completed), dtype=np.int64)
+
+        print(f"{len(stations)} stations: {sum(kind == 'row' for kind, *_ in tasks)} rows and "
+              f"{len(pending)} columns to compute")
+        start_time = time.time()
+        with Pool(processes, initializer=_init_worker, initargs=(snapshot_path, weights)) as pool:
+            for i, (kind, station_id, values, station_isochrones, elapsed) in enumerate(pool.imap_unordered(_station_task, tasks)):
+                for name, metric_values in zip(MATRIX_METRICS, values):
+                    if kind == 'row':
+                        self.matrices[name][index[station_id]] = metric_values
+                    else:
+                        self.matrices[name][column_rows, index[station_id]] = metric_values[column_rows]
+                if kind == 'row':
+                    isochrones[station_id] = station_isochrones
+                    self.manifest['completed'].append(station_id)
+                else:
+                    self.manifest['pending_columns'].remove(station_id)
+                if (i + 1) % CHECKPOINT_INTERVAL == 0 or i + 1 == len(tasks):
+                    self._checkpoint(isochrones)
+                    rate = (i + 1) / max(time.time() - start_time, 1e-9)
+                    print(f"[{i + 1}/{len(tasks)}] {rate:.2f} stations/sec")
+
+        elapsed = time.time() - start_time
+        print(f"Bikeability matrices up to date in {elapsed:.1f} sec "
+              f"({len(tasks) / max(elapsed, 1e-9):.2f} stations/sec)")
+
+
+if __name__ == "__main__":
+    import argparse
+    from tfl_feed import StationFeed, TFL_FEED_URL
+
+    parser = argparse.ArgumentParser(description="Compute station-to-station bikeability matrices and "
+                                                 "isochrones for all TfL stations")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--feed', default=TFL_FEED_URL, help="station feed URL or local XML file")
+    parser.add_argument('--out', default=BIKEABILITY_PATH)
+    parser.add_argument('--isochrones', type=float, nargs='+', default=list(ISOCHRONE_DISTANCES),
+                        help="isochrone distances in metres")
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    feed = StationFeed(args.feed)
+    feed.refresh()
+    BikeabilityMatrix(args.out).update(feed.table, snapshot_path=args.snapshot,
+                                       isochrone_distances=args.isochrones, processes=args.processes)
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+
+from graph_tables import GraphTables
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH, compile_snapshot_tables
+from accident_risk import build_accident_series
+from accident_ingest import ACCIDENTS_PATH, EdgeSnapper, ingest_accidents, snapped_parts, edge_accident_totals
+from network_scoring import (EDGE_SCORES_PATH, NODE_SCORES_PATH, EDGE_SCORE_ATTRIBUTES, NODE_SCORE_ATTRIBUTES,
+                             DEFAULT_EDGE_ATTR, DEFAULT_NODE_ATTR, fill_missing_attributes, read_attribute_scores,
+                             attribute_scores)
+
+
+RAW_GRAPHML_PATH = '../data/london_bike_network.graphml'
+BUILD_PATH = '../data/build'
+
+# Bump to invalidate every cached artifact when a stage's logic changes
+BUILD_VERSION = 2
+
+STAGES = ('network', 'accidents', 'scores', 'graph')
+
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def _key(*parts):
+    return hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def file_digests(path, prefix_size=None):
+    """
+    Return (sha1 of the first prefix_size bytes, sha1 of the whole file), reading the file once.
+    The prefix digest is None when no prefix size is given or the file is shorter.
+    """
+    digest = hashlib.sha1()
+    prefix_digest = None
+    position = 0
+    with open(path, 'rb') as f:
+        while True:
+            size = HASH_BLOCK_SIZE
+            if prefix_size is not None and position < prefix_size:
+                size = min(size, prefix_size - position)
+            block = f.read(size)
+            if not block:
+                break
+            digest.update(block)
+            position += len(block)
+            if position == prefix_size:
+                prefix_digest = digest.hexdigest()
+    return prefix_digest, digest.hexdigest()
+
+
+class BuildPipeline:
+    """
+    Content-hashed build of the scored network, from the raw GraphML, the accident CSV and the attribute
+    score CSVs to the scored GraphML and the binary snapshot. Each stage's artifacts live in their own
+    directory under build_path; the manifest records the key each stage was built with (a hash of its
+    input files and upstream keys), so a stage only reruns when one of its inputs changed:
+
+    - network: raw GraphML -> node/edge tables with missing values filled
+    - accidents: accident rows snapped to edges; rows appended to the CSV are snapped on their own
+    - scores: per-attribute score contributions of every edge and node; changed score rows only
+      rescore the elements carrying the changed attribute values
+    - graph: scored GraphML and snapshot
+    """
+
+    def __init__(self, build_path=BUILD_PATH, graphml_path=RAW_GRAPHML_PATH, accidents_path=ACCIDENTS_PATH,
+                 edge_scores_path=EDGE_SCORES_PATH, node_scores_path=NODE_SCORES_PATH,
+                 out_path=GRAPHML_PATH, snapshot_path=SNAPSHOT_PATH, processes=1):
+        self.build_path = build_path
+        self.inputs = {'graphml': graphml_path, 'accidents': accidents_path,
+                       'edge_scores': edge_scores_path, 'node_scores': node_scores_path}
+        self.out_path = out_path
+        self.snapshot_path = snapshot_path
+        self.processes = processes
+        self.manifest_path = os.path.join(build_path, 'manifest.json')
+        self.manifest = {'build_version': BUILD_VERSION, 'files': {}, 'stages': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('build_version') == BUILD_VERSION:
+                self.manifest = manifest
+        self._tables = None
+
+    def _save_manifest(self):
+        os.makedirs(self.build_path, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def stage_path(self, stage, name=''):
+        return os.path.join(self.build_path, stage, name)
+
+    def file_hash(self, name, prefix_size=None):
+        """
+        sha1 of an input file, reused from the manifest while its size and mtime are unchanged.
+        With prefix_size, return (prefix sha1, sha1).
+        """
+        path = self.inputs[name]
+        stat = os.stat(path)
+        known = self.manifest['files'].get(name, {})
+        if (prefix_size is None and known.get('path') == path and known.get('size') == stat.st_size
+                and known.get('mtime_ns') == stat.st_mtime_ns):
+            return known['sha1']
+        prefix_digest, digest = file_digests(path, prefix_size)
+        self.manifest['files'][name] = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                        'sha1': digest}
+        return digest if prefix_size is None else (prefix_digest, digest)
+
+    def stage_keys(self):
+        keys = {'network': _key('network', BUILD_VERSION, self.file_hash('graphml'))}
+        keys['accidents'] = _key('accidents', keys['network'], self.file_hash('accidents'))
+        keys['scores'] = _key('scores', keys['network'], self.file_hash('edge_scores'), self.file_hash('node_scores'))
+        keys['graph'] = _key('graph', keys['accidents'], keys['scores'], self.out_path, self.snapshot_path)
+        return keys
+
+    def tables(self):
+        if self._tables is None:
+            self._tables = GraphTables.load(self.stage_path('network'))
+        return self._tables
+
+    def run(self, force=()):
+        """
+        Bring every stage up to date; stages listed in force are rebuilt from scratch
+        """
+        keys = self.stage_keys()
+        for stage in STAGES:
+            record = self.manifest['stages'].get(stage)
+            if stage not in force and record is not None and record['key'] == keys[stage]:
+                print(f"{stage}: up to date")
+                continue
+            start_time = time.time()
+            previous = None if stage in force else record
+            info = getattr(self, f'build_{stage}')(keys, previous)
+            self.manifest['stages'][stage] = {'key': keys[stage], 'built': time.time(), **info}
+            self._save_manifest()
+            print(f"{stage}: {info.get('mode', 'built')} in {time.time() - start_time:.2f} sec")
+        self._save_manifest()
+
+    def build_network(self, keys, previous):
+        tables = GraphTables.read_graphml(self.inputs['graphml'])
+        fill_missing_attributes(tables.edges, DEFAULT_EDGE_ATTR)
+        fill_missing_attributes(tables.nodes, DEFAULT_NODE_ATTR)
+        tables.save(self.stage_path('network'))
+        self._tables = tables
+        return {'n_nodes': len(tables.nodes), 'n_edges': len(tables.edges)}
+
+    def build_accidents(self, keys, previous):
+        """
+        Stream accident rows into snapped parquet parts. If the network is unchanged and the CSV still
+        starts with the bytes snapped last time, only the appended rows are read and snapped, into a new part.
+        """
+        path = self.inputs['accidents']
+        parts_path = self.stage_path('accidents')
+        parts = snapped_parts(parts_path)
+        incremental = (previous is not None and previous.get('network') == keys['network'] and parts
+                       and previous.get('ends_with_newline'))
+        if incremental:
+            prefix_digest, _ = self.file_hash('accidents', previous['bytes'])
+            incremental = prefix_digest == previous['prefix_sha1']
+        if not incremental:
+            for part in parts:
+                os.remove(part)
+            parts = []
+
+        os.makedirs(parts_path, exist_ok=True)
+        part_path = os.path.join(parts_path, f'part-{len(parts):05d}.parquet')
+        snapper = EdgeSnapper(self.tables())
+        if incremental:
+            with open(path, 'rb') as f:
+                f.seek(previous['bytes'])
+                n_rows, n_snapped = ingest_accidents(f, snapper, part_path, names=previous['columns'])
+        else:
+            n_rows, n_snapped = ingest_accidents(path, snapper, part_path)
+
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            f.seek(max(size - 1, 0))
+            ends_with_newline = f.read(1) == b'\n'
+        return {'mode': f"snapped {n_snapped} of {n_rows} {'appended ' if incremental else ''}rows",
+                'network': keys['network'], 'rows': (previous['rows'] if incremental else 0) + n_rows,
+                'bytes': size, 'prefix_sha1': self.manifest['files']['accidents']['sha1'],
+                'ends_with_newline': ends_with_newline, 'columns': list(pd.read_csv(path, nrows=0).columns)}
+
+    def build_scores(self, keys, previous):
+        """
+        Score every edge and node per attribute. If the network is unchanged, only the attribute values
+        whose score rows changed are joined again, for the elements carrying them.
+        """
+        tables = self.tables()
+        incremental = previous is not None and previous.get('network') == keys['network']
+        changed_rows = {}
+        for table, attributes, scores_name in (('edges', EDGE_SCORE_ATTRIBUTES, 'edge_scores'),
+                                               ('nodes', NODE_SCORE_ATTRIBUTES, 'node_scores')):
+            frame = tables.edges if table == 'edges' else tables.nodes
+            scores = read_attribute_scores(self.inputs[scores_name], attributes)
+            contributions_path = self.stage_path('scores', f'{table}_contributions.parquet')
+            scores_path = self.stage_path('scores', f'{scores_name}.parquet')
+            attributes = [attr for attr in attributes if attr in frame]
+
+            if incremental and os.path.exists(contributions_path) and os.path.exists(scores_path):
+                contributions = pd.read_parquet(contributions_path)
+                old_scores = pd.read_parquet(scores_path)
+                rows = []
+                for attr, changed_keys in changed_score_keys(old_scores, scores, attributes).items():
+                    attr_rows, safety, comfort = attribute_scores(frame[attr], attr, scores, changed_keys)
+                    for column, values in ((f'{attr}.safety', safety), (f'{attr}.comfort', comfort)):
+                        column_values = contributions[column].values.copy()
+                        column_values[attr_rows] = values
+                        contributions[column] = column_values
+                    rows.append(attr_rows)
+                rows = np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+            else:
+                contributions = pd.DataFrame(index=frame.index)
+                for attr in attributes:
+                    _, contributions[f'{attr}.safety'], contributions[f'{attr}.comfort'] = \
+                        attribute_scores(frame[attr], attr, scores)
+                rows = np.arange(len(frame))
+
+            # attribute totals, summed in attribute order like network_scoring.score_table
+            for score in ('safety', 'comfort'):
+                total = np.zeros(len(rows))
+                for attr in attributes:
+                    total += contributions[f'{attr}.{score}'].values[rows]
+                totals = contributions[score].values.copy() if score in contributions else np.zeros(len(frame))
+                totals[rows] = total
+                contributions[score] = totals
+
+            os.makedirs(self.stage_path('scores'), exist_ok=True)
+            contributions.to_parquet(contributions_path, index=False)
+            scores.to_parquet(scores_path, index=False)
+            changed_rows[table] = len(rows)
+
+        return {'mode': f"rescored {changed_rows['edges']} edges and {changed_rows['nodes']} nodes",
+                'network': keys['network']}
+
+    def build_graph(self, keys, previous):
+        """
+        Write the scored GraphML and compile the snapshot: attribute totals plus, for edges, the
+        accident score and casualty count aggregated from the snapped accidents. The snapped accidents
+        are also stored per snapshot edge as a time series for query-time risk.
+        """
+        tables = self.tables()
+        accident_score, casualty_count = edge_accident_totals(snapped_parts(self.stage_path('accidents')),
+                                                              len(tables.edges))
+
+        edge_scores = pd.read_parquet(self.stage_path('scores', 'edges_contributions.parquet'))
+        node_scores = pd.read_parquet(self.stage_path('scores', 'nodes_contributions.parquet'))
+        tables.set_numeric('edges', 'accident_score', accident_score)
+        tables.edges['casualty_count'] = pd.Series(casualty_count.astype(str), index=tables.edges.index, dtype=object)
+        tables.set_numeric('edges', 'safety_score', edge_scores['safety'].values + accident_score)
+        tables.set_numeric('edges', 'comfort_score', edge_scores['comfort'].values)
+        tables.set_numeric('nodes', 'safety_score', node_scores['safety'].values)
+        tables.set_numeric('nodes', 'comfort_score', node_scores['comfort'].values)
+
+        tables.write_graphml(self.out_path, self.processes)
+        meta = compile_snapshot_tables(tables, self.snapshot_path)
+        build_accident_series(GraphSnapshot.load(self.snapshot_path), tables, snapped_parts(self.stage_path('accidents')))
+        return {'snapshot_version': meta['version']}
+
+
+def changed_score_keys(old_scores, new_scores, attributes):
+    """
+    Canonical feature keys per attribute whose safety or comfort score differs between two score
+    tables (read_attribute_scores); a value missing from one table scores 0
+    """
+    merged = old_scores.merge(new_scores, on=['attribute_type', 'feature_value'], how='outer',
+                              suffixes=('_old', '_new')).fillna({'safety_score_old': 0.0, 'comfort_score_old': 0.0,
+                                                                 'safety_score_new': 0.0, 'comfort_score_new': 0.0})
+    changed = ((merged['safety_score_old'] != merged['safety_score_new'])
+               | (merged['comfort_score_old'] != merged['comfort_score_new']))
+    merged = merged[changed.values & merged['attribute_type'].isin(attributes).values]
+    return {attr: group['feature_value'].tolist() for attr, group in merged.groupby('attribute_type')}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incrementally build the scored network and its snapshot")
+    parser.add_argument('--build-dir', default=BUILD_PATH)
+    parser.add_argument('--graphml', default=RAW_GRAPHML_PATH)
+    parser.add_argument('--accidents', default=ACCIDENTS_PATH)
+    parser.add_argument('--edge-scores', default=EDGE_SCORES_PATH)
+    parser.add_argument('--node-scores', default=NODE_SCORES_PATH)
+    parser.add_argument('--out', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--force', nargs='*', default=[], choices=STAGES, help="stages to rebuild from scratch")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    pipeline = BuildPipeline(args.build_dir, args.graphml, args.accidents, args.edge_scores, args.node_scores,
+                             args.out, args.snapshot, args.processes)
+    pipeline.run(force=args.force)
+    print(f"Total: {time.time() - start_time:.2f} sec")
@@ -0,0 +1,301 @@
+import os
+import time
+import logging
+import heapq
+import numpy as np
+
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH
+
+
+logger = logging.getLogger(__name__)
+
+CH_PATH = '../data/london_bike_network_ch.npz'
+
+# Witness searches give up after settling this many nodes; a missed witness only adds a redundant shortcut
+WITNESS_SETTLE_LIMIT = 60
+
+
+def _witness_distance(out_adj, contracted, source, skip, target_costs, max_cost):
+    """
+    Dijkstra from source that avoids the node being contracted, stopping once every target is settled,
+    max_cost is exceeded or the settle limit is reached. Return the distances found.
+    """
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    remaining = set(target_costs)
+    settled = 0
+    while heap and remaining and settled < WITNESS_SETTLE_LIMIT:
+        d, u = heapq.heappop(heap)
+        if d > dist.get(u, float('inf')):
+            continue
+        if d > max_cost:
+            break
+        settled += 1
+        remaining.discard(u)
+        for v, (w, _) in out_adj[u].items():
+            if v == skip or v in contracted:
+                continue
+            nd = d + w
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _contract(out_adj, in_adj, contracted, v, apply):
+    """
+    Find (and, if apply is set, insert) the shortcuts needed to contract v.
+    Return the number of shortcuts.
+    """
+    in_nodes = [(u, w) for u, (w, _) in in_adj[v].items() if u not in contracted]
+    out_nodes = [(x, w) for x, (w, _) in out_adj[v].items() if x not in contracted]
+    shortcuts = 0
+    for u, w_in in in_nodes:
+        targets = {x: w_in + w_out for x, w_out in out_nodes if x != u}
+        if not targets:
+            continue
+        dist = _witness_distance(out_adj, contracted, u, v, targets, max(targets.values()))
+        for x, cost in targets.items():
+            if dist.get(x, float('inf')) <= cost:
+                continue
+            shortcuts += 1
+            if apply and cost < out_adj[u].get(x, (float('inf'), -1))[0]:
+                out_adj[u][x] = (cost, v)
+                in_adj[x][u] = (cost, v)
+    return shortcuts
+
+
+def build_contraction_hierarchy(snapshot, weights=None):
+    """
+    Contract every node of the snapshot graph in edge-difference order.
+    Pure Python and meant to run offline; the result is saved with save_hierarchy.
+    """
+    n = snapshot.n_nodes
+    weights = np.asarray(snapshot.length if weights is None else weights, dtype=np.float64)
+
+    # Collapse parallel edges to the cheapest one; value = (weight, middle node or -1 for a real edge)
+    out_adj = [dict() for _ in range(n)]
+    in_adj = [dict() for _ in range(n)]
+    for u, v, w in zip(snapshot.edge_src.tolist(), snapshot.indices.tolist(), weights.tolist()):
+        if u != v and w < out_adj[u].get(v, (float('inf'), -1))[0]:
+            out_adj[u][v] = (w, -1)
+            in_adj[v][u] = (w, -1)
+
+    contracted = set()
+    deleted_neighbours = [0] * n
+
+    def priority(v):
+        degree = len(in_adj[v]) + len(out_adj[v])
+        return _contract(out_adj, in_adj, contracted, v, apply=False) - degree + deleted_neighbours[v]
+
+    heap = [(priority(v), v) for v in range(n)]
+    heapq.heapify(heap)
+    rank = np.zeros(n, dtype=np.int32)
+    level = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        if v in contracted:
+            continue
+        # Lazy update: re-evaluate and push back if v is no longer the cheapest node
+        new_priority = priority(v)
+        if heap and new_priority > heap[0][0]:
+            heapq.heappush(heap, (new_priority, v))
+            continue
+
+        _contract(out_adj, in_adj, contracted, v, apply=True)
+        contracted.add(v)
+        rank[v] = level
+        level += 1
+        for u in list(in_adj[v]) + list(out_adj[v]):
+            deleted_neighbours[u] += 1
+
+    # Split the augmented graph into the upward (forward) and downward (backward) search graphs
+    fwd, bwd = [[] for _ in range(n)], [[] for _ in range(n)]
+    for u in range(n):
+        for v, (w, mid) in out_adj[u].items():
+            if rank[u] < rank[v]:
+                fwd[u].append((v, w, mid))
+            else:
+                bwd[v].append((u, w, mid))
+
+    def to_csr(rows):
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        flat = [item for row in rows for item in row]
+        heads = np.array([item[0] for item in flat], dtype=np.int32)
+        costs = np.array([item[1] for item in flat], dtype=np.float64)
+        mids = np.array([item[2] for item in flat], dtype=np.int32)
+        return indptr, heads, costs, mids
+
+    arrays = {'rank': rank}
+    for prefix, rows in (('fwd', fwd), ('bwd', bwd)):
+        indptr, heads, costs, mids = to_csr(rows)
+        arrays.update({f'{prefix}_indptr': indptr, f'{prefix}_heads': heads,
+                       f'{prefix}_costs': costs, f'{prefix}_mids': mids})
+    return arrays
+
+
+def save_hierarchy(arrays, snapshot, ch_path=CH_PATH):
+    np.savez(ch_path, snapshot_version=np.array(snapshot.version), **arrays)
+
+
+class ContractionHierarchy:
+    """
+    Shortest-path queries on a prebuilt contraction hierarchy, answered by a bidirectional
+    upward Dijkstra followed by recursive shortcut unpacking
+    """
+
+    def __init__(self, arrays):
+        self.rank = arrays['rank'].tolist()
+        self._graph = {}
+        for prefix in ('fwd', 'bwd'):
+            self._graph[prefix] = tuple(arrays[f'{prefix}_{name}'].tolist()
+                                        for name in ('indptr', 'heads', 'costs', 'mids'))
+
+    @classmethod
+    def load(cls, snapshot, ch_path=CH_PATH):
+        """
+        Load the hierarchy saved for this snapshot, or return None if it is missing or stale
+        """
+        if not os.path.exists(ch_path):
+            return None
+        with np.load(ch_path) as data:
+            if str(data['snapshot_version']) != snapshot.version:
+                logger.warning("Contraction hierarchy %s was built for another snapshot, ignoring it", ch_path)
+                return None
+            return cls({name: data[name] for name in data.files})
+
+    def _edge_mid(self, u, v):
+        """
+        Middle node of the hierarchy edge u -> v (-1 for an original road edge)
+        """
+        if self.rank[u] < self.rank[v]:
+            indptr, heads, _, mids = self._graph['fwd']
+            row, head = u, v
+        else:
+            indptr, heads, _, mids = self._graph['bwd']
+            row, head = v, u
+        for i in range(indptr[row], indptr[row + 1]):
+            if heads[i] == head:
+                return mids[i]
+        return None
+
+    def _unpack(self, u, v, out):
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            mid = self._edge_mid(a, b)
+            if mid is None or mid < 0:
+                out.append(b)
+            else:
+                stack.append((mid, b))
+                stack.append((a, mid))
+
+    def shortest_path(self, source, target):
+        """
+        Return (cost, list of node indices) between two node indices, or (inf, None) if unreachable
+        """
+        if source == target:
+            return 0.0, [source]
+
+        searches = {}
+        for prefix, start in (('fwd', source), ('bwd', target)):
+            searches[prefix] = ({start: 0.0}, {start: -1}, [(0.0, start)])
+
+        best, meeting = float('inf'), None
+        active = ['fwd', 'bwd']
+        while active:
+            for prefix in list(active):
+                dist, pred, heap = searches[prefix]
+                if not heap or heap[0][0] >= best:
+                    active.remove(prefix)
+                    continue
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                other_dist = searches['bwd' if prefix == 'fwd' else 'fwd'][0]
+                if u in other_dist and d + other_dist[u] < best:
+                    best, meeting = d + other_dist[u], u
+                indptr, heads, costs, _ = self._graph[prefix]
+                for i in range(indptr[u], indptr[u + 1]):
+                    v = heads[i]
+                    nd = d + costs[i]
+                    if nd < dist.get(v, float('inf')):
+                        dist[v] = nd
+                        pred[v] = u
+                        heapq.heappush(heap, (nd, v))
+
+        if meeting is None:
+            return float('inf'), None
+
+        # Hierarchy-level path: source .. meeting .. target
+        up = [meeting]
+        pred_f = searches['fwd'][1]
+        while pred_f[up[-1]] != -1:
+            up.append(pred_f[up[-1]])
+        up.reverse()
+        down = []
+        pred_b = searches['bwd'][1]
+        node = meeting
+        while pred_b[node] != -1:
+            node = pred_b[node]
+            down.append(node)
+        hops = up + down
+
+        nodes = [hops[0]]
+        for a, b in zip(hops[:-1], hops[1:]):
+            self._unpack(a, b, nodes)
+        return best, nodes
+
+
+def verify(snapshot, hierarchy, G, pairs=100, seed=0):
+    """
+    Compare CH distances with ox.routing.shortest_path on random node pairs; return the mismatches
+    """
+    import osmnx as ox
+
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    for source, target in rng.integers(0, snapshot.n_nodes, size=(pairs, 2)).tolist():
+        source_id, target_id = int(snapshot.node_ids[source]), int(snapshot.node_ids[target])
+        reference = ox.routing.shortest_path(G, source_id, target_id, weight='length')
+        cost, nodes = hierarchy.shortest_path(source, target)
+        if reference is None:
+            if nodes is not None:
+                mismatches.append((source_id, target_id, None, cost))
+            continue
+        reference_cost = sum(min(data['length'] for data in G[u][v].values())
+                             for u, v in zip(reference[:-1], reference[1:]))
+        ch_nodes = snapshot.node_ids[nodes].tolist() if nodes else []
+        ch_cost = sum(min(data['length'] for data in G[u][v].values())
+                      for u, v in zip(ch_nodes[:-1], ch_nodes[1:]))
+        if (not ch_nodes or ch_nodes[0] != source_id or ch_nodes[-1] != target_id
+                or abs(ch_cost - reference_cost) > 1e-3 * max(reference_cost, 1.0)):
+            mismatches.append((source_id, target_id, reference_cost, ch_cost))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy for the compiled snapshot")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--out', default=CH_PATH)
+    parser.add_argument('--verify', type=int, default=0, help="number of random pairs checked against OSMnx")
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    start_time = time.time()
+    arrays = build_contraction_hierarchy(snapshot)
+    save_hierarchy(arrays, snapshot, args.out)
+    n_shortcuts = int((arrays['fwd_mids'] >= 0).sum() + (arrays['bwd_mids'] >= 0).sum())
+    print(f"Contracted {snapshot.n_nodes} nodes with {n_shortcuts} shortcuts in {time.time() - start_time:.1f} sec")
+
+    if args.verify:
+        import osmnx as ox
+        hierarchy = ContractionHierarchy.load(snapshot, args.out)
+        mismatches = verify(snapshot, hierarchy, ox.load_graphml(args.graphml), pairs=args.verify)
+        print(f"{args.verify - len(mismatches)}/{args.verify} random pairs match ox.routing.shortest_path")
+        for mismatch in mismatches[:10]:
+            print(f"  mismatch {mismatch}")
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import shapely
+
+from spatial_index import SpatialIndex
+from graph_tables import GraphTables
+
+
+GRAPHML_PATH = '../data/london_bike_network_safety_comfort_score.graphml'
+SNAPSHOT_PATH = '../data/london_bike_network_snapshot'
+
+FORMAT_VERSION = 2
+
+# name -> dtype of every array stored in the snapshot directory
+NODE_ARRAYS = {
+    'node_ids': np.int64,          # OSM node id of each node index (sorted ascending)
+    'x': np.float64,               # longitude
+    'y': np.float64,               # latitude
+    'node_safety_score': np.float32,
+    'node_comfort_score': np.float32,
+    'street_count': np.int32,
+}
+
+EDGE_ARRAYS = {
+    'indptr': np.int64,            # CSR row pointer, length n_nodes + 1
+    'indices': np.int32,           # head node index of every edge
+    'edge_src': np.int32,          # tail node index of every edge
+    'edge_key': np.int32,          # MultiDiGraph key of every edge
+    'length': np.float32,
+    'safety_score': np.float32,
+    'comfort_score': np.float32,
+    'casualty_count': np.float32,
+    'cycleway': np.uint8,          # 1 if highway == 'cycleway'
+    'geom_offsets': np.int64,      # edge i's geometry is geom_coords[geom_offsets[i]:geom_offsets[i + 1]]
+    'geom_coords': np.float64,     # (lon, lat) points of all edge geometries, concatenated
+}
+
+# GraphML attributes the snapshot arrays are built from
+SNAPSHOT_NODE_ATTRS = ['x', 'y', 'safety_score', 'comfort_score', 'street_count']
+SNAPSHOT_EDGE_ATTRS = ['length', 'safety_score', 'comfort_score', 'casualty_count', 'highway', 'geometry']
+
+
+def compile_snapshot(G, snapshot_path=SNAPSHOT_PATH):
+    """
+    Compile a scored MultiDiGraph into CSR arrays and write them to snapshot_path as .npy files
+    """
+    tables = GraphTables.from_graph(G, SNAPSHOT_NODE_ATTRS, SNAPSHOT_EDGE_ATTRS)
+    return compile_snapshot_tables(tables, snapshot_path)
+
+
+def snapshot_edge_order(tables):
+    """
+    Edge table rows in snapshot edge order: by tail node, head node and key, node ids ascending
+    """
+    node_ids = np.sort(tables.nodes['node'].values)
+    src = np.searchsorted(node_ids, tables.edges['u'].values)
+    dst = np.searchsorted(node_ids, tables.edges['v'].values)
+    return np.lexsort((tables.edges['key'].values, dst, src))
+
+
+def compile_snapshot_tables(tables, snapshot_path=SNAPSHOT_PATH):
+    """
+    Compile the node and edge tables of a scored network (GraphTables) into the snapshot arrays
+    """
+    node_order = np.argsort(tables.nodes['node'].values, kind='stable')
+    node_ids = tables.nodes['node'].values[node_order].astype(np.int64)
+    n_nodes = len(node_ids)
+
+    arrays = {'node_ids': node_ids}
+    arrays['x'] = tables.numeric('nodes', 'x')[node_order]
+    arrays['y'] = tables.numeric('nodes', 'y')[node_order]
+    arrays['node_safety_score'] = tables.numeric('nodes', 'safety_score')[node_order].astype(np.float32)
+    arrays['node_comfort_score'] = tables.numeric('nodes', 'comfort_score')[node_order].astype(np.float32)
+    arrays['street_count'] = tables.numeric('nodes', 'street_count', 0)[node_order].astype(np.int32)
+
+    # Sort edges by tail node so that they form CSR rows
+    edges = tables.edges
+    src = np.searchsorted(node_ids, edges['u'].values)
+    dst = np.searchsorted(node_ids, edges['v'].values)
+    keys = edges['key'].values
+    edge_order = snapshot_edge_order(tables)
+    n_edges = len(edge_order)
+
+    arrays['edge_src'] = src[edge_order].astype(np.int32)
+    arrays['indices'] = dst[edge_order].astype(np.int32)
+    arrays['edge_key'] = keys[edge_order].astype(np.int32)
+    arrays['length'] = tables.numeric('edges', 'length', 0.0)[edge_order].astype(np.float32)
+    arrays['safety_score'] = tables.numeric('edges', 'safety_score')[edge_order].astype(np.float32)
+    arrays['comfort_score'] = tables.numeric('edges', 'comfort_score')[edge_order].astype(np.float32)
+    arrays['casualty_count'] = tables.numeric('edges', 'casualty_count', 0.0)[edge_order].astype(np.float32)
+    highway = edges['highway'].values[edge_order] if 'highway' in edges else np.full(n_edges, None)
+    arrays['cycleway'] = (highway == 'cycleway').astype(np.uint8)
+
+    # Edges without a geometry attribute are straight lines between their end nodes
+    geoms = tables.edge_geometries()[edge_order]
+    coords, coord_edge = shapely.get_coordinates(geoms, return_index=True)
+    arrays['geom_offsets'] = np.zeros(n_edges + 1, dtype=np.int64)
+    np.cumsum(np.bincount(coord_edge, minlength=n_edges), out=arrays['geom_offsets'][1:])
+    arrays['geom_coords'] = coords.astype(np.float64)
+
+    arrays['indptr'] = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(arrays['edge_src'], minlength=n_nodes), out=arrays['indptr'][1:])
+    for name, dtype in {**NODE_ARRAYS, **EDGE_ARRAYS}.items():
+        arrays[name] = np.ascontiguousarray(arrays[name], dtype=dtype)
+
+    os.makedirs(snapshot_path, exist_ok=True)
+    digest = hashlib.sha1()
+    for name in sorted(arrays):
+        np.save(os.path.join(snapshot_path, f'{name}.npy'), arrays[name])
+        digest.update(name.encode())
+        digest.update(arrays[name].tobytes())
+
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'version': digest.hexdigest(),
+        'n_nodes': n_nodes,
+        'n_edges': n_edges,
+        'arrays': sorted(arrays),
+    }
+    with open(os.path.join(snapshot_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    # Serialize the node KD-tree with the snapshot so workers never build it
+    SpatialIndex.build(GraphSnapshot.load(snapshot_path))
+    return meta
+
+
+class GraphSnapshot:
+    """
+    Read-only view of a compiled graph snapshot. Arrays are np.memmap objects, so several
+    worker processes loading the same snapshot share the same physical pages.
+    """
+
+    def __init__(self, snapshot_path, meta, arrays):
+        self.path = snapshot_path
+        self.meta = meta
+        self.version = meta['version']
+        self.n_nodes = meta['n_nodes']
+        self.n_edges = meta['n_edges']
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    @classmethod
+    def load(cls, snapshot_path=SNAPSHOT_PATH):
+        with open(os.path.join(snapshot_path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {meta.get('format_version')} in {snapshot_path}, "
+                             f"rebuild it with graph_snapshot.py")
+
+        arrays = {}
+        for name in meta['arrays']:
+            arrays[name] = np.load(os.path.join(snapshot_path, f'{name}.npy'), mmap_mode='r')
+        return cls(snapshot_path, meta, arrays)
+
+    def node_index(self, node_id):
+        """
+        Return the array index of an OSM node id
+        """
+        i = int(np.searchsorted(self.node_ids, node_id))
+        if i >= self.n_nodes or self.node_ids[i] != node_id:
+            raise KeyError(node_id)
+        return i
+
+    def node_indices(self, node_ids):
+        """
+        Vectorized node_index for an array of OSM node ids
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        idx = np.searchsorted(self.node_ids, node_ids)
+        idx = np.minimum(idx, self.n_nodes - 1)
+        if not np.array_equal(self.node_ids[idx], node_ids):
+            raise KeyError("Some node ids are not in the snapshot")
+        return idx.astype(np.int32)
+
+    def out_edges(self, i):
+        """
+        Return the range of edge indices leaving node index i
+        """
+        return range(int(self.indptr[i]), int(self.indptr[i + 1]))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the scored GraphML network into a binary snapshot")
+    parser.add_argument('--graphml', default=GRAPHML_PATH)
+    parser.add_argument('--out', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    meta = compile_snapshot_tables(GraphTables.read_graphml(args.graphml), args.out)
+    print(f"Compiled {meta['n_nodes']} nodes and {meta['n_edges']} edges into {args.out} "
+          f"(version {meta['version'][:12]}) in {time.time() - start_time:.2f} sec")
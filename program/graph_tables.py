@@ -0,0 +1,306 @@
+import os
+import ast
+import json
+import numpy as np
+import pandas as pd
+import shapely
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+
+GRAPHML_NS = 'http://graphml.graphdrawing.org/xmlns'
+
+# Bytes of GraphML fed to the parser at a time when reading
+READ_BLOCK_SIZE = 1024 * 1024
+# Graph elements serialized per worker task when writing GraphML
+WRITE_CHUNK_SIZE = 100_000
+
+
+def parse_list_value(value):
+    """
+    List-valued OSM tags are stored as their Python repr ("['primary', 'secondary']"), like osmnx does
+    """
+    if isinstance(value, str) and value.startswith('[') and value.endswith(']'):
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            pass
+    return value
+
+
+def _to_text(value):
+    if value is None or (value.__class__ is float and value != value):
+        return 'nan'
+    return str(value)
+
+
+def _to_float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _escape(column):
+    return column.str.replace('&', '&amp;').str.replace('<', '&lt;').str.replace('>', '&gt;').str.replace('"', '&quot;')
+
+
+def _serialize_chunk(args):
+    tag, start_tags, columns, key_ids = args
+    text = pd.Series(start_tags, dtype=object)
+    for name, values in columns.items():
+        values = pd.Series(values, dtype=object)
+        present = values.notna().values
+        data = pd.Series('', index=values.index, dtype=object)
+        data[present] = (f'<data key="{key_ids[name]}">' + _escape(values[present].astype(str))
+                         + '</data>').astype(object).values
+        text = text + data
+    return ''.join((text + f'</{tag}>\n').values)
+
+
+class _GraphMLColumns:
+    """
+    XMLParser target collecting GraphML key names, graph attributes, element ids and per-key
+    (rows, values) columns of the nodes and edges as the document is parsed
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.graph_attrs = {}
+        self.element_ids = {'node': [], 'edge': []}
+        self.columns = {'node': {}, 'edge': {}}  # key id -> (rows, values)
+        self._element = None                    # 'node' or 'edge' while inside one
+        self._key = None                        # key id while inside a <data> element
+        self._text = []
+        self._tags = {}                         # tag -> local name, namespaced or not
+
+    def _local(self, tag):
+        name = self._tags.get(tag)
+        if name is None:
+            name = self._tags[tag] = tag.rpartition('}')[2]
+        return name
+
+    def start(self, tag, attrib):
+        tag = self._local(tag)
+        if tag == 'data':
+            self._key = attrib.get('key')
+            self._text = []
+        elif tag == 'node':
+            self._element = tag
+            self.element_ids[tag].append(attrib.get('id'))
+        elif tag == 'edge':
+            self._element = tag
+            self.element_ids[tag].append((attrib.get('source'), attrib.get('target'), attrib.get('id', '0')))
+        elif tag == 'key':
+            self.keys[attrib.get('id')] = attrib.get('attr.name', attrib.get('id'))
+
+    def data(self, text):
+        if self._key is not None:
+            self._text.append(text)
+
+    def end(self, tag):
+        tag = self._local(tag)
+        if tag == 'data' and self._key is not None:
+            value = ''.join(self._text)
+            if self._element is None:
+                self.graph_attrs[self._key] = value
+            else:
+                rows_values = self.columns[self._element].get(self._key)
+                if rows_values is None:
+                    rows_values = self.columns[self._element][self._key] = ([], [])
+                rows_values[0].append(len(self.element_ids[self._element]) - 1)
+                rows_values[1].append(value)
+            self._key = None
+        elif tag == 'node' or tag == 'edge':
+            self._element = None
+
+    def close(self):
+        return self
+
+
+class GraphTables:
+    """
+    Columnar view of a GraphML road network: one node table (column 'node' plus one column per attribute)
+    and one edge table ('u', 'v', 'key' plus attributes). Attribute values are kept as the strings stored
+    in the GraphML file (None where an element has no such attribute), so tables read from a file and
+    tables built from an osmnx graph compare equal and can be written back without type guessing.
+    """
+
+    def __init__(self, nodes, edges, graph_attrs=None):
+        self.nodes = nodes
+        self.edges = edges
+        self.graph_attrs = dict(graph_attrs or {})
+
+    @classmethod
+    def read_graphml(cls, path, block_size=READ_BLOCK_SIZE):
+        """
+        Read a GraphML file as written by osmnx / NetworkX into tables without building a NetworkX graph.
+        The file is stream-parsed by ElementTree's XML parser into the columns directly, without
+        building elements, so memory holds the columns only.
+        """
+        target = _GraphMLColumns()
+        parser = ET.XMLParser(target=target)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                parser.feed(block)
+        parser.close()
+        keys, columns, element_ids = target.keys, target.columns, target.element_ids
+        graph_attrs = {keys.get(key_id, key_id): value for key_id, value in target.graph_attrs.items()}
+
+        def table(tag, index_columns):
+            frame = pd.DataFrame(index_columns)
+            for key_id, (rows, values) in columns[tag].items():
+                column = np.full(len(frame), None, dtype=object)
+                column[rows] = pd.Series(values, dtype=object).values
+                frame[keys.get(key_id, key_id)] = pd.Series(column, dtype=object)
+            return frame
+
+        edge_ids = np.array(element_ids['edge'], dtype=object).reshape(-1, 3).astype(np.int64)
+        nodes = table('node', {'node': np.array(element_ids['node'], dtype=object).astype(np.int64)})
+        edges = table('edge', {'u': edge_ids[:, 0], 'v': edge_ids[:, 1], 'key': edge_ids[:, 2]})
+        return cls(nodes, edges, graph_attrs)
+
+    @classmethod
+    def from_graph(cls, G, node_attrs=None, edge_attrs=None):
+        """
+        Tables of a NetworkX MultiDiGraph, with every attribute value converted to its GraphML text.
+        node_attrs / edge_attrs limit the tables to the listed attributes.
+        """
+        node_items = list(G.nodes(data=True))
+        edge_items = list(G.edges(keys=True, data=True))
+
+        def table(index_columns, records, names):
+            frame = pd.DataFrame(index_columns)
+            if names is None:
+                names = dict.fromkeys(name for data in records for name in data)
+            for name in names:
+                missing = object()
+                values = [data.get(name, missing) for data in records]
+                frame[name] = pd.Series([None if value is missing else _to_text(value) for value in values], dtype=object)
+            return frame
+
+        nodes = table({'node': np.array([int(node) for node, _ in node_items], dtype=np.int64)},
+                      [data for _, data in node_items], node_attrs)
+        edges = table({'u': np.array([int(u) for u, _, _, _ in edge_items], dtype=np.int64),
+                       'v': np.array([int(v) for _, v, _, _ in edge_items], dtype=np.int64),
+                       'key': np.array([int(k) for _, _, k, _ in edge_items], dtype=np.int64)},
+                      [data for _, _, _, data in edge_items], edge_attrs)
+        return cls(nodes, edges, {name: _to_text(value) for name, value in G.graph.items()})
+
+    def numeric(self, table, column, default=np.nan):
+        """
+        A node ('nodes') or edge ('edges') attribute column as float64, default where it is missing
+        or not a number. Values are parsed with float(), so they round-trip exactly.
+        """
+        frame = self.nodes if table == 'nodes' else self.edges
+        numbers = np.full(len(frame), default, dtype=np.float64)
+        if column not in frame:
+            return numbers
+        values = frame[column].values
+        present = pd.notna(values)
+        try:
+            numbers[present] = values[present].astype(np.float64)
+        except (TypeError, ValueError):
+            numbers[present] = [_to_float(value, default) for value in values[present]]
+        return numbers
+
+    def set_numeric(self, table, column, values):
+        """
+        Store a float array as the text of a node or edge attribute column
+        """
+        frame = self.nodes if table == 'nodes' else self.edges
+        frame[column] = pd.Series([repr(value) for value in np.asarray(values, dtype=np.float64).tolist()],
+                                  index=frame.index, dtype=object)
+
+    def edge_geometries(self):
+        """
+        Shapely LineString of every edge row (lon/lat), a straight line between the end nodes where the
+        edge has no geometry attribute
+        """
+        wkt = self.edges['geometry'].values if 'geometry' in self.edges else np.full(len(self.edges), None, dtype=object)
+        has_geometry = pd.notna(wkt)
+        geoms = np.empty(len(wkt), dtype=object)
+        geoms[has_geometry] = shapely.from_wkt(wkt[has_geometry].astype(str))
+        straight = np.flatnonzero(~has_geometry)
+        if len(straight):
+            node_ids = self.nodes['node'].values
+            order = np.argsort(node_ids, kind='stable')
+            x, y = self.numeric('nodes', 'x')[order], self.numeric('nodes', 'y')[order]
+            tails = np.searchsorted(node_ids[order], self.edges['u'].values[straight])
+            heads = np.searchsorted(node_ids[order], self.edges['v'].values[straight])
+            geoms[straight] = shapely.linestrings(np.stack([np.column_stack((x[tails], y[tails])),
+                                                            np.column_stack((x[heads], y[heads]))], axis=1))
+        return geoms
+
+    def save(self, path):
+        """
+        Save the tables as nodes.parquet / edges.parquet plus graph.json in the directory path
+        """
+        os.makedirs(path, exist_ok=True)
+        self.nodes.to_parquet(os.path.join(path, 'nodes.parquet'), index=False)
+        self.edges.to_parquet(os.path.join(path, 'edges.parquet'), index=False)
+        with open(os.path.join(path, 'graph.json'), 'w') as f:
+            json.dump(self.graph_attrs, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load tables saved with save(); attribute columns come back as object columns with None for missing
+        """
+        frames = []
+        for name in ('nodes', 'edges'):
+            frame = pd.read_parquet(os.path.join(path, f'{name}.parquet'))
+            for column in frame.columns:
+                if column not in ('node', 'u', 'v', 'key'):
+                    values = frame[column].values.astype(object)
+                    values[pd.isna(values)] = None
+                    frame[column] = pd.Series(values, index=frame.index, dtype=object)
+            frames.append(frame)
+        with open(os.path.join(path, 'graph.json')) as f:
+            graph_attrs = json.load(f)
+        return cls(frames[0], frames[1], graph_attrs)
+
+    def write_graphml(self, path, processes=1):
+        """
+        Write the tables as a GraphML file that ox.load_graphml reads back (all attributes as strings,
+        like ox.save_graphml). Elements are serialized in chunks, in a process pool when processes > 1.
+        """
+        node_attrs = [name for name in self.nodes.columns if name != 'node']
+        edge_attrs = [name for name in self.edges.columns if name not in ('u', 'v', 'key')]
+        key_ids = {}
+        key_lines = []
+        for domain, names in (('graph', list(self.graph_attrs)), ('node', node_attrs), ('edge', edge_attrs)):
+            for name in names:
+                key_ids[(domain, name)] = f'd{len(key_lines)}'
+                key_lines.append(f'  <key id="d{len(key_lines)}" for="{domain}" attr.name="{name}" attr.type="string" />\n')
+
+        def tasks(tag, frame, attrs, start_tags):
+            domain_keys = {name: key_ids[(tag, name)] for name in attrs}
+            for start in range(0, len(frame), WRITE_CHUNK_SIZE):
+                chunk = frame.iloc[start:start + WRITE_CHUNK_SIZE]
+                yield (tag, start_tags[start:start + WRITE_CHUNK_SIZE],
+                       {name: chunk[name].values for name in attrs}, domain_keys)
+
+        node_tags = ('    <node id="' + self.nodes['node'].astype(str) + '">').astype(object).values
+        edge_tags = ('    <edge source="' + self.edges['u'].astype(str) + '" target="' + self.edges['v'].astype(str)
+                     + '" id="' + self.edges['key'].astype(str) + '">').astype(object).values
+        all_tasks = list(tasks('node', self.nodes, node_attrs, node_tags)) + \
+            list(tasks('edge', self.edges, edge_attrs, edge_tags))
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            f.write(f'<graphml xmlns="{GRAPHML_NS}" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                    f'xsi:schemaLocation="{GRAPHML_NS} {GRAPHML_NS}/1.0/graphml.xsd">\n')
+            f.writelines(key_lines)
+            f.write('  <graph edgedefault="directed">\n')
+            for name, value in self.graph_attrs.items():
+                text = _escape(pd.Series([str(value)], dtype=object))[0]
+                f.write(f'    <data key="{key_ids[("graph", name)]}">{text}</data>\n')
+            if processes and processes > 1 and len(all_tasks) > 1:
+                with Pool(processes) as pool:
+                    for text in pool.imap(_serialize_chunk, all_tasks):
+                        f.write(text)
+            else:
+                for task in all_tasks:
+                    f.write(_serialize_chunk(task))
+            f.write('  </graph>\n</graphml>\n')
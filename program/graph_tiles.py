@@ -0,0 +1,430 @@
+import os
+import json
+import math
+import time
+import logging
+import heapq
+import bisect
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import EARTH_RADIUS_M, DEFAULT_PENALTY, normalize_scores, haversine
+
+
+logger = logging.getLogger(__name__)
+
+TILES_PATH = '../data/london_bike_network_tiles'
+
+# Tile edge in degrees of latitude and longitude (about 2.8 km north-south by 1.7 km east-west in London)
+TILE_SIZE_DEG = 0.025
+# Tiles kept loaded for the search loop at once; a query touching more tiles still completes
+MAX_RESIDENT_TILES = 64
+# Edge cost lists kept per loaded tile, one per recently used weight setting
+TILE_COST_CACHE = 4
+
+# Arrays of the tile store. Nodes are renumbered tile by tile ("tiled" indices), so the nodes of tile t
+# are tile_offsets[t]:tile_offsets[t + 1] and every per-node and per-edge array below is read in one
+# contiguous slice per tile. Edge arrays are stored twice: outgoing edges in the tail's tile (forward
+# search) and incoming edges in the head's tile (backward search), so a search crossing a boundary only
+# needs the tiles it actually expands.
+TILE_ARRAYS = (
+    'tile_keys', 'tile_offsets',                        # per tile: (row, col) of the grid, node ranges
+    'node_index', 'tiled_index', 'component',           # tiled -> snapshot index, snapshot -> tiled, weak component
+    'lat', 'lon',                                       # per tiled node, radians
+    'fwd_indptr', 'fwd_head', 'fwd_edge', 'fwd_length', 'fwd_safety', 'fwd_comfort',
+    'rev_indptr', 'rev_tail', 'rev_edge', 'rev_length', 'rev_safety', 'rev_comfort',
+    'boundary_nodes', 'boundary_lat', 'boundary_lon',   # the overlay: nodes with an edge to or from another tile
+)
+
+
+def build_tiles(snapshot, tiles_path=TILES_PATH, tile_size=TILE_SIZE_DEG):
+    """
+    Partition a compiled snapshot into a grid of spatial tiles and write the tile store to tiles_path.
+    Edge safety and comfort are stored as the penalties RouteEngine derives from them (normalized
+    over the whole graph), so tiled searches find the same costs as whole-graph ones.
+    """
+    n_nodes = snapshot.n_nodes
+    lat, lon = np.asarray(snapshot.y, dtype=np.float64), np.asarray(snapshot.x, dtype=np.float64)
+    cells = np.stack([np.floor(lat / tile_size), np.floor(lon / tile_size)], axis=1).astype(np.int32)
+    tile_keys, tile_of = np.unique(cells, axis=0, return_inverse=True)
+    tile_of = tile_of.ravel()
+
+    node_index = np.argsort(tile_of, kind='stable')
+    tiled_index = np.empty(n_nodes, dtype=np.int64)
+    tiled_index[node_index] = np.arange(n_nodes)
+    tile_offsets = np.zeros(len(tile_keys) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tile_of, minlength=len(tile_keys)), out=tile_offsets[1:])
+
+    src, dst = snapshot.edge_src.astype(np.int64), snapshot.indices.astype(np.int64)
+    _, component = connected_components(csr_matrix((np.ones(len(src), dtype=np.int8), (src, dst)),
+                                                   shape=(n_nodes, n_nodes)), directed=True, connection='weak')
+
+    safety_penalty = 1.0 - normalize_scores(snapshot.safety_score)
+    comfort_penalty = 1.0 - normalize_scores(snapshot.comfort_score)
+    arrays = {
+        'tile_keys': tile_keys, 'tile_offsets': tile_offsets,
+        'node_index': node_index.astype(np.int64), 'tiled_index': tiled_index,
+        'component': component.astype(np.int32),
+        'lat': np.radians(lat[node_index]), 'lon': np.radians(lon[node_index]),
+    }
+    for direction, (near, far) in (('fwd', (src, dst)), ('rev', (dst, src))):
+        # edges grouped by the tiled index of their near end, in snapshot order within a node
+        order = np.argsort(tiled_index[near], kind='stable')
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tiled_index[near], minlength=n_nodes), out=indptr[1:])
+        arrays[f'{direction}_indptr'] = indptr
+        arrays[f'{direction}_head' if direction == 'fwd' else f'{direction}_tail'] = tiled_index[far[order]]
+        arrays[f'{direction}_edge'] = order.astype(np.int64)
+        arrays[f'{direction}_length'] = np.asarray(snapshot.length)[order]
+        arrays[f'{direction}_safety'] = safety_penalty[order]
+        arrays[f'{direction}_comfort'] = comfort_penalty[order]
+
+    cut = tile_of[src] != tile_of[dst]
+    boundary = np.unique(tiled_index[np.concatenate([src[cut], dst[cut]])])
+    arrays['boundary_nodes'] = boundary
+    arrays['boundary_lat'] = arrays['lat'][boundary]
+    arrays['boundary_lon'] = arrays['lon'][boundary]
+
+    os.makedirs(tiles_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tiles_path, f'{name}.npy'), array)
+    meta = {
+        'snapshot_version': snapshot.version,
+        'tile_size_deg': tile_size,
+        'n_tiles': len(tile_keys),
+        'n_nodes': n_nodes,
+        'n_edges': snapshot.n_edges,
+        'boundary_nodes': len(boundary),
+        'cut_edges': int(cut.sum()),
+        'max_tile_nodes': int(np.diff(tile_offsets).max()),
+    }
+    with open(os.path.join(tiles_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class GraphTiles:
+    """
+    Memory-mapped tile store of a snapshot (see build_tiles); nothing is read until a tile is loaded
+    """
+
+    def __init__(self, snapshot, tiles_path, meta, arrays):
+        self.snapshot = snapshot
+        self.path = tiles_path
+        self.meta = meta
+        self.n_tiles = meta['n_tiles']
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    @classmethod
+    def load(cls, snapshot, tiles_path=TILES_PATH):
+        """
+        Open the tile store built for this snapshot, or return None if it is missing or stale
+        """
+        meta_path = os.path.join(tiles_path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('snapshot_version') != snapshot.version:
+            logger.warning("Graph tiles %s were built for another snapshot, ignoring them", tiles_path)
+            return None
+        arrays = {name: np.load(os.path.join(tiles_path, f'{name}.npy'), mmap_mode='r') for name in TILE_ARRAYS}
+        return cls(snapshot, tiles_path, meta, arrays)
+
+
+class Tile:
+    """
+    One loaded tile: the forward and reverse adjacency of its nodes as Python lists for the search loop
+    """
+
+    def __init__(self, tiles, tile):
+        self.tile = tile
+        self.start, end = int(tiles.tile_offsets[tile]), int(tiles.tile_offsets[tile + 1])
+        self.n_nodes = end - self.start
+        self.lat = np.array(tiles.lat[self.start:end])
+        self.lon = np.array(tiles.lon[self.start:end])
+        for direction, ends in (('fwd', 'fwd_head'), ('rev', 'rev_tail')):
+            indptr = np.asarray(getattr(tiles, f'{direction}_indptr')[self.start:end + 1])
+            first, last = int(indptr[0]), int(indptr[-1])
+            setattr(self, f'{direction}_indptr', (indptr - first).tolist())
+            setattr(self, f'{direction}_ends', getattr(tiles, ends)[first:last].tolist())
+            setattr(self, f'{direction}_edges', getattr(tiles, f'{direction}_edge')[first:last].tolist())
+            setattr(self, f'_{direction}_terms', (getattr(tiles, f'{direction}_length')[first:last].astype(np.float64),
+                                                  np.array(getattr(tiles, f'{direction}_safety')[first:last]),
+                                                  np.array(getattr(tiles, f'{direction}_comfort')[first:last])))
+        self._costs = OrderedDict()
+        self._lock = threading.Lock()  # a resident tile is shared by the searches of concurrent requests
+
+    def costs(self, weights):
+        """
+        (forward, reverse) edge cost lists for (distance, safety, comfort) weights, with the formula of
+        RouteEngine.edge_costs
+        """
+        with self._lock:
+            costs = self._costs.get(weights)
+            if costs is not None:
+                self._costs.move_to_end(weights)
+                return costs
+        distance_weight, safety_weight, comfort_weight = weights
+        costs = tuple((length * (distance_weight + safety_weight * safety + comfort_weight * comfort)).tolist()
+                      for length, safety, comfort in (self._fwd_terms, self._rev_terms))
+        with self._lock:
+            self._costs[weights] = costs
+            while len(self._costs) > TILE_COST_CACHE:
+                self._costs.popitem(last=False)
+        return costs
+
+
+def _haversine_array(lat, lon, lat0, lon0):
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * math.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class TiledRouteEngine:
+    """
+    RouteEngine counterpart over a GraphTiles store: bidirectional A* with the same combined edge costs,
+    loading tiles through an LRU only when the search expands one of their nodes. The boundary overlay
+    (coordinates of every node with an edge to or from another tile) stays resident, so the search can
+    reach into a neighbouring tile without loading it; that tile is loaded only once the search
+    expands the boundary node. Node and edge indices in and out are the snapshot's.
+    """
+
+    def __init__(self, tiles, max_tiles=MAX_RESIDENT_TILES):
+        self.tiles = tiles
+        self.snapshot = tiles.snapshot
+        self.max_tiles = max_tiles
+        self._offsets = tiles.tile_offsets.tolist()
+        self._boundary = dict(zip(tiles.boundary_nodes.tolist(),
+                                  zip(tiles.boundary_lat.tolist(), tiles.boundary_lon.tolist())))
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def tile(self, tile):
+        """
+        Return a loaded tile, loading it (and evicting the least recently used one) if needed
+        """
+        with self._lock:
+            loaded = self._loaded.get(tile)
+            if loaded is not None:
+                self._loaded.move_to_end(tile)
+                return loaded
+        loaded = Tile(self.tiles, tile)
+        with self._lock:
+            self._loaded[tile] = loaded
+            self.loads += 1
+            while len(self._loaded) > self.max_tiles:
+                self._loaded.popitem(last=False)
+                self.evictions += 1
+        return loaded
+
+    def _coordinates(self, node):
+        if node in self._boundary:
+            return self._boundary[node]
+        loaded = self.tile(bisect.bisect_right(self._offsets, node) - 1)
+        return float(loaded.lat[node - loaded.start]), float(loaded.lon[node - loaded.start])
+
+    def _centre(self, nodes):
+        """
+        Centre (radians) and radius in metres of a set of tiled nodes, like RouteEngine._centre, for the
+        lower bounds of route_engine.Potential (a single node is its own centre, radius 0)
+        """
+        coordinates = [self._coordinates(node) for node in nodes]
+        lat = sum(lat for lat, _ in coordinates) / len(coordinates)
+        lon = sum(lon for _, lon in coordinates) / len(coordinates)
+        return lat, lon, max(haversine(node_lat, node_lon, lat, lon) for node_lat, node_lon in coordinates)
+
+    def shortest_path(self, source, target, distance_weight, safety_weight, comfort_weight, penalties=None):
+        """
+        Bidirectional A* between two snapshot node indices. penalties maps snapshot edge indices to cost
+        multipliers. Return (total cost, list of snapshot edge indices) or (inf, None) if the target
+        is unreachable.
+        """
+        if source == target:
+            return 0.0, []
+        total, _, _, path = self.shortest_path_between({source: 0.0}, {target: 0.0}, distance_weight, safety_weight,
+                                                       comfort_weight, penalties)
+        return total, path
+
+    def shortest_path_between(self, sources, targets, distance_weight, safety_weight, comfort_weight, penalties=None):
+        """
+        RouteEngine.shortest_path_between over the tiles: the cheapest path from any source to any
+        target (snapshot node index -> extra cost at that end) in one search. Return (total cost
+        including the extra costs, source, target, list of snapshot edge indices) or
+        (inf, None, None, None) if no target is reachable.
+        """
+        component = self.tiles.component
+        target_components = {int(component[target]) for target in targets}
+        sources = {source: extra for source, extra in sources.items() if int(component[source]) in target_components}
+        if not sources:
+            return float('inf'), None, None, None
+        common = sources.keys() & targets.keys()
+        if common:
+            # a station node among both the sources and the targets
+            node = min(common, key=lambda node: sources[node] + targets[node])
+            return sources[node] + targets[node], node, node, []
+
+        weights = (distance_weight, safety_weight, comfort_weight)
+        tiled_index = self.tiles.tiled_index
+        start_f = {int(tiled_index[source]): extra for source, extra in sources.items()}
+        start_b = {int(tiled_index[target]): extra for target, extra in targets.items()}
+        lat_s, lon_s, radius_s = self._centre(start_f)
+        lat_t, lon_t, radius_t = self._centre(start_b)
+        # average (symmetric) potential as in RouteEngine.potentials / multi_potentials: for all nodes
+        # of a tile when the search first expands into it, for boundary nodes of other tiles when
+        # they are first reached
+        scale = 0.5 * 0.99 * distance_weight
+        boundary = self._boundary
+        pot = {}
+        used = {}
+
+        def use_tile(node):
+            # tiles of one search are held in `used`, so LRU evictions during a long query do not reload them
+            tile = bisect.bisect_right(self._offsets, node) - 1
+            entry = used.get(tile)
+            if entry is None:
+                loaded = self.tile(tile)
+                entry = used[tile] = (loaded,) + loaded.costs(weights)
+                if scale > 0:
+                    values = scale * (np.maximum(_haversine_array(loaded.lat, loaded.lon, lat_t, lon_t) - radius_t, 0.0)
+                                      - np.maximum(_haversine_array(loaded.lat, loaded.lon, lat_s, lon_s) - radius_s, 0.0))
+                    pot.update(zip(range(loaded.start, loaded.start + loaded.n_nodes), values.tolist()))
+                else:
+                    pot.update(dict.fromkeys(range(loaded.start, loaded.start + loaded.n_nodes), 0.0))
+            return entry
+
+        def boundary_potential(v):
+            if scale <= 0:
+                return 0.0
+            lat, lon = boundary[v]
+            return scale * (max(haversine(lat, lon, lat_t, lon_t) - radius_t, 0.0)
+                            - max(haversine(lat, lon, lat_s, lon_s) - radius_s, 0.0))
+
+        for node in list(start_f) + list(start_b):
+            use_tile(node)
+        penalties = penalties or None
+        inf = float('inf')
+
+        # start keys as in RouteEngine.shortest_path_between, so both searches add up to the true cost
+        dist_f = {node: extra + pot[node] for node, extra in start_f.items()}
+        dist_b = {node: extra - pot[node] for node, extra in start_b.items()}
+        pred_f, pred_b = dict.fromkeys(start_f), dict.fromkeys(start_b)
+        done_f, done_b = set(), set()
+        heap_f, heap_b = [(d, node) for node, d in dist_f.items()], [(d, node) for node, d in dist_b.items()]
+        heapq.heapify(heap_f)
+        heapq.heapify(heap_b)
+        best, meeting = inf, None
+
+        while heap_f and heap_b:
+            if heap_f[0][0] + heap_b[0][0] >= best:
+                break
+
+            forward = heap_f[0][0] <= heap_b[0][0]
+            heap, dist, pred, done, other = ((heap_f, dist_f, pred_f, done_f, dist_b) if forward
+                                             else (heap_b, dist_b, pred_b, done_b, dist_f))
+            d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            loaded, fwd_costs, rev_costs = use_tile(u)
+            i = u - loaded.start
+            if forward:
+                indptr, ends, edges, costs, sign = loaded.fwd_indptr, loaded.fwd_ends, loaded.fwd_edges, fwd_costs, 1.0
+            else:
+                indptr, ends, edges, costs, sign = loaded.rev_indptr, loaded.rev_ends, loaded.rev_edges, rev_costs, -1.0
+            pu = pot[u]
+            for j in range(indptr[i], indptr[i + 1]):
+                v = ends[j]
+                cost = costs[j]
+                if penalties is not None:
+                    cost *= penalties.get(edges[j], 1.0)
+                pv = pot.get(v)
+                if pv is None:
+                    pv = pot[v] = boundary_potential(v)
+                nd = d + cost + sign * (pv - pu)
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    pred[v] = (edges[j], u, cost)
+                    heapq.heappush(heap, (nd, v))
+                    if v in other and nd + other[v] < best:
+                        best, meeting = nd + other[v], v
+
+        if meeting is None:
+            return inf, None, None, None
+
+        path, total = [], 0.0
+        node = meeting
+        while pred_f[node] is not None:
+            e, node, cost = pred_f[node]
+            path.append(e)
+            total += cost
+        path.reverse()
+        source = int(self.tiles.node_index[node])
+        node = meeting
+        while pred_b[node] is not None:
+            e, node, cost = pred_b[node]
+            path.append(e)
+            total += cost
+        target = int(self.tiles.node_index[node])
+        return sources[source] + total + targets[target], source, target, path
+
+    def path_nodes(self, source, edge_path):
+        """
+        Convert a list of snapshot edge indices into the list of snapshot node indices it visits
+        """
+        return [source] + self.snapshot.indices[edge_path].tolist()
+
+    def k_diverse_paths(self, source, target, k, distance_weight, safety_weight, comfort_weight,
+                        penalty=DEFAULT_PENALTY, max_iterations=None):
+        """
+        Up to k distinct edge paths with the penalty method of RouteEngine.k_diverse_paths
+        """
+        max_iterations = max_iterations or 3 * k
+        penalties = {}
+        paths, seen = [], set()
+        for _ in range(max_iterations):
+            _, path = self.shortest_path(source, target, distance_weight, safety_weight, comfort_weight, penalties)
+            if path is None:
+                break
+            key = tuple(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+                if len(paths) >= k:
+                    break
+            for e in path:
+                penalties[e] = penalties.get(e, 1.0) * penalty
+        return paths
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tiles': self.tiles.n_tiles,
+                'resident_tiles': len(self._loaded),
+                'max_tiles': self.max_tiles,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Partition the compiled snapshot into spatial graph tiles")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--out', default=TILES_PATH)
+    parser.add_argument('--tile-size', type=float, default=TILE_SIZE_DEG, help="tile edge in degrees")
+    args = parser.parse_args()
+
+    snapshot = GraphSnapshot.load(args.snapshot)
+    start_time = time.time()
+    meta = build_tiles(snapshot, args.out, args.tile_size)
+    print(f"Partitioned {meta['n_nodes']} nodes into {meta['n_tiles']} tiles (at most {meta['max_tile_nodes']} nodes) "
+          f"with {meta['boundary_nodes']} boundary nodes and {meta['cut_edges']} cut edges "
+          f"in {time.time() - start_time:.2f} sec")
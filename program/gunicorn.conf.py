@@ -0,0 +1,41 @@
+"""
+Production serving, run from the program directory:
+    gunicorn -c gunicorn.conf.py app:app
+
+The app module is imported once in the master before the workers fork (preload_app), so the graph
+snapshot, spatial index, contraction hierarchy and station data are loaded once and shared by the
+workers copy-on-write. Each worker serves requests on a few threads; route computations go through
+the bounded executor of serving.py.
+"""
+import os
+import gc
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+# more than serving.ROUTE_WORKERS + ROUTE_QUEUE, so some threads are always free for /search
+threads = int(os.environ.get('THREADS', 8))
+preload_app = True
+# above serving.ROUTE_TIMEOUT, so slow routes are answered with 504 before the worker is killed
+timeout = 60
+graceful_timeout = 30
+
+
+def when_ready(server):
+    import app
+    # the master does not serve requests: stop its station polling thread before forking, then move
+    # the loaded objects out of the garbage collector's reach so collections in the workers do not
+    # touch (and copy) their pages
+    app.route_network.stop_station_refresh()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import app
+    app.route_network.start_station_refresh()
+
+
+def worker_exit(server, worker):
+    import app
+    app.route_network.close()
@@ -0,0 +1,158 @@
+import os
+import time
+import bisect
+import threading
+
+
+# Switch for all spans; when off, span() hands out one shared no-op context manager. ROUTE_METRICS=0
+# in the environment turns instrumentation off for a whole server.
+enabled = os.environ.get('ROUTE_METRICS', '1') != '0'
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """
+    Monotonic counter per label combination
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for values, count in sorted(self._values.items()):
+                lines.append(f'{self.name}{_label_text(self.labels, values)} {count}')
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus style) per label combination
+    """
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_label_text(self.labels, values, [("le", bound)])} {cumulative}')
+                lines.append(f'{self.name}_sum{_label_text(self.labels, values)} {series[-1]:.6f}')
+                lines.append(f'{self.name}_count{_label_text(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """
+    Named counters and histograms plus gauge collectors (callables returning a dict of stats, read on
+    every render and exposed as <prefix>_<key>), rendered in the Prometheus text format
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        return self.metrics.setdefault(name, Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help_text, labels, buckets))
+
+    def register_collector(self, prefix, collector):
+        self.collectors.append((prefix, collector))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        for prefix, collector in self.collectors:
+            for key, value in collector().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'# TYPE {prefix}_{key} gauge')
+                    lines.append(f'{prefix}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram('route_stage_seconds', "Time spent in each stage of route planning", ['stage'])
+REQUEST_SECONDS = registry.histogram('http_request_seconds', "Request handling time per endpoint", ['endpoint'])
+REQUESTS = registry.counter('http_requests_total', "Requests per endpoint and status code", ['endpoint', 'status'])
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage):
+    """
+    Context manager timing one stage of a request into route_stage_seconds{stage=...}
+    """
+    if not enabled:
+        return _NO_SPAN
+    return _Span(stage)
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
@@ -0,0 +1,215 @@
+import time
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+from graph_tables import GraphTables, parse_list_value
+from graph_snapshot import GRAPHML_PATH, SNAPSHOT_PATH, compile_snapshot_tables
+
+
+ACCIDENT_GRAPHML_PATH = '../data/london_bike_network_accident_score.graphml'
+EDGE_SCORES_PATH = '../data/edge_attr_scores.csv'
+NODE_SCORES_PATH = '../data/node_attr_scores.csv'
+
+EDGE_SCORE_ATTRIBUTES = ['access', 'highway', 'bridge', 'service', 'junction', 'tunnel', 'lanes']
+NODE_SCORE_ATTRIBUTES = ['street_count', 'highway', 'junction', 'railway']
+
+# Attributes whose values are numbers: '2', '2.0' and 2 must all find the same score row
+NUMERIC_ATTRIBUTES = ('lanes', 'street_count')
+
+# Values used when an attribute is present but empty (NaN / None), as in set_network_attr.ipynb
+DEFAULT_NODE_ATTR = {
+    'highway': '',
+    'junction': '',
+    'railway': '',
+}
+DEFAULT_EDGE_ATTR = {
+    'access': 'unknown',
+    'maxspeed': '20 mph',
+    'lanes': '1.5',
+    'bridge': 'yes',
+    'service': 'unknown',
+    'junction': 'approach',
+    'tunnel': 'yes',
+}
+
+# Graph elements scored per worker task
+CHUNK_SIZE = 250_000
+
+
+def feature_keys(attribute_type, values):
+    """
+    Canonical string key of each value of one attribute, so graph values and CSV values join exactly
+    """
+    values = pd.Series(np.asarray(values, dtype=object), dtype=object)
+    keys = values.astype(str).astype(object)
+    if attribute_type in NUMERIC_ATTRIBUTES:
+        numbers = pd.to_numeric(values, errors='coerce')
+        keys = keys.where(numbers.isna(), numbers.astype(np.float64).astype(str).astype(object))
+    return keys.values
+
+
+def read_attribute_scores(path, attributes):
+    """
+    Read an attribute score CSV (attribute_type, feature_value, safety_score, comfort_score) into a join
+    table with canonical feature keys. Later rows win over earlier rows for the same value, like the dict
+    maps of the notebooks.
+    """
+    scores = pd.read_csv(path, dtype={'feature_value': object}, keep_default_na=False)
+    scores = scores[scores['attribute_type'].isin(attributes)]
+    keys = scores['feature_value'].values.astype(object)
+    for attr in attributes:
+        mask = (scores['attribute_type'] == attr).values
+        keys[mask] = feature_keys(attr, keys[mask])
+    scores = pd.DataFrame({
+        'attribute_type': scores['attribute_type'].values.astype(object),
+        'feature_value': keys,
+        'safety_score': scores['safety_score'].values.astype(np.float64),
+        'comfort_score': scores['comfort_score'].values.astype(np.float64),
+    })
+    return scores.drop_duplicates(['attribute_type', 'feature_value'], keep='last').reset_index(drop=True)
+
+
+def fill_missing_attributes(table, defaults):
+    """
+    Replace empty values ('nan' in GraphML) of the defaulted attributes with their default. Elements
+    without the attribute at all are left as they are, like set_network_attr.ipynb.
+    """
+    for attr, default in defaults.items():
+        if attr in table:
+            empty = (table[attr] == 'nan').values
+            if empty.any():
+                table.loc[empty, attr] = default
+    return table
+
+
+def attribute_codes(column, attribute_type):
+    """
+    Factorize one attribute column, with list-valued OSM tags exploded into one entry per item.
+    Return (row of each entry, code of each entry, canonical key of each code).
+    """
+    present = np.flatnonzero(pd.notna(column.values))
+    codes, uniques = pd.factorize(column.values[present])
+    values = pd.Series([parse_list_value(value) for value in uniques], dtype=object)
+    if any(isinstance(value, list) for value in values.values):
+        # explode the distinct values, then expand every row to the items of its value
+        exploded = values.explode()
+        exploded = exploded[exploded.notna()]
+        items, item_values = pd.factorize(exploded.values)
+        counts = np.bincount(exploded.index.values, minlength=len(values))
+        starts = np.cumsum(counts) - counts
+        entry_counts = counts[codes]
+        first = np.repeat(np.cumsum(entry_counts) - entry_counts, entry_counts)
+        positions = np.repeat(starts[codes], entry_counts) + np.arange(entry_counts.sum()) - first
+        return np.repeat(present, entry_counts), items[positions], feature_keys(attribute_type, item_values)
+    return present, codes, feature_keys(attribute_type, values.values)
+
+
+def attribute_scores(column, attribute_type, scores, changed_keys=None):
+    """
+    Safety and comfort contribution of one attribute column per row. With changed_keys (canonical
+    feature keys), only the rows carrying one of those values are scored. Return (rows, safety, comfort)
+    of the scored rows.
+    """
+    n_rows = len(column)
+    entry_rows, codes, keys = attribute_codes(column, attribute_type)
+    lookup = scores[scores['attribute_type'] == attribute_type].set_index('feature_value')
+    value_scores = lookup.reindex(keys)[['safety_score', 'comfort_score']].fillna(0.0).values
+    rows = np.arange(n_rows)
+    if changed_keys is not None:
+        rows = np.unique(entry_rows[np.isin(keys, list(changed_keys))[codes]])
+        keep = np.isin(entry_rows, rows)
+        entry_rows, codes = entry_rows[keep], codes[keep]
+    safety = np.bincount(entry_rows, weights=value_scores[codes, 0], minlength=n_rows)
+    comfort = np.bincount(entry_rows, weights=value_scores[codes, 1], minlength=n_rows)
+    return rows, safety[rows], comfort[rows]
+
+
+def score_table(table, attributes, scores):
+    """
+    Sum the safety and comfort score of every attribute value per row. Each distinct value is joined
+    against the score table once and the results are gathered back to the rows.
+    """
+    n_rows = len(table)
+    safety, comfort = np.zeros(n_rows), np.zeros(n_rows)
+    for attr in attributes:
+        if attr not in table:
+            continue
+        _, attr_safety, attr_comfort = attribute_scores(table[attr], attr, scores)
+        safety += attr_safety
+        comfort += attr_comfort
+    return safety, comfort
+
+
+def _score_chunk(args):
+    table, attributes, scores = args
+    return score_table(table.reset_index(drop=True), attributes, scores)
+
+
+def score_attributes(table, attributes, scores, processes=1, chunk_size=CHUNK_SIZE):
+    """
+    score_table over row chunks, in a process pool when processes > 1
+    """
+    columns = [attr for attr in attributes if attr in table]
+    tasks = [(table.iloc[start:start + chunk_size][columns], attributes, scores)
+             for start in range(0, len(table), chunk_size)]
+    if processes and processes > 1 and len(tasks) > 1:
+        with Pool(processes) as pool:
+            results = pool.map(_score_chunk, tasks)
+    else:
+        results = [_score_chunk(task) for task in tasks]
+
+    if not results:
+        return np.zeros(0), np.zeros(0)
+    return (np.concatenate([safety for safety, _ in results]),
+            np.concatenate([comfort for _, comfort in results]))
+
+
+def score_tables(tables, edge_scores_path=EDGE_SCORES_PATH, node_scores_path=NODE_SCORES_PATH, processes=1):
+    """
+    Fill missing attribute values and set the safety_score / comfort_score columns of the edge and
+    node tables. Edge safety also includes the edge's accident_score.
+    """
+    fill_missing_attributes(tables.edges, DEFAULT_EDGE_ATTR)
+    edge_safety, edge_comfort = score_attributes(tables.edges, EDGE_SCORE_ATTRIBUTES,
+                                                 read_attribute_scores(edge_scores_path, EDGE_SCORE_ATTRIBUTES), processes)
+    edge_safety += tables.numeric('edges', 'accident_score', default=0.0)
+    tables.set_numeric('edges', 'safety_score', edge_safety)
+    tables.set_numeric('edges', 'comfort_score', edge_comfort)
+
+    fill_missing_attributes(tables.nodes, DEFAULT_NODE_ATTR)
+    node_safety, node_comfort = score_attributes(tables.nodes, NODE_SCORE_ATTRIBUTES,
+                                                 read_attribute_scores(node_scores_path, NODE_SCORE_ATTRIBUTES), processes)
+    tables.set_numeric('nodes', 'safety_score', node_safety)
+    tables.set_numeric('nodes', 'comfort_score', node_comfort)
+    return tables
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Score the accident-annotated network and compile the snapshot")
+    parser.add_argument('--graphml', default=ACCIDENT_GRAPHML_PATH)
+    parser.add_argument('--out', default=GRAPHML_PATH)
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--edge-scores', default=EDGE_SCORES_PATH)
+    parser.add_argument('--node-scores', default=NODE_SCORES_PATH)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    tables = GraphTables.read_graphml(args.graphml)
+    print(f"Loaded {args.graphml} in {time.time() - start_time:.2f} sec")
+
+    stage_time = time.time()
+    score_tables(tables, args.edge_scores, args.node_scores, args.processes)
+    print(f"Scored {len(tables.edges)} edges and {len(tables.nodes)} nodes in {time.time() - stage_time:.2f} sec")
+
+    stage_time = time.time()
+    tables.write_graphml(args.out, args.processes)
+    print(f"Saved {args.out} in {time.time() - stage_time:.2f} sec")
+
+    stage_time = time.time()
+    meta = compile_snapshot_tables(tables, args.snapshot)
+    print(f"Compiled snapshot {meta['version'][:12]} in {time.time() - stage_time:.2f} sec")
+    print(f"Total: {time.time() - start_time:.2f} sec")
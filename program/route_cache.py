@@ -0,0 +1,110 @@
+import os
+import pickle
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# Normalized weights are rounded to this step for result keys
+WEIGHT_STEP = 0.01
+# Coarser step for the weights a diverse search runs with, so nearby slider settings share candidates
+SEARCH_WEIGHT_STEP = 0.25
+
+
+def quantize_weights(distance_weight, safety_weight, comfort_weight, step=WEIGHT_STEP):
+    return tuple(round(round(w / step) * step, 6) for w in (distance_weight, safety_weight, comfort_weight))
+
+
+class RouteCache:
+    """
+    Bounded LRU cache with an optional shared on-disk tier (one pickle per key, written atomically,
+    so several worker processes can share it). Keys are scoped to a graph snapshot version: calling
+    set_version with a new version drops every entry built for the old graph.
+    """
+
+    def __init__(self, max_entries=1024, disk_path=None, version=None):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.version = version
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_version(self, version):
+        """
+        Invalidate everything when the graph snapshot version changes
+        """
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+        if self.disk_path and os.path.isdir(self.disk_path):
+            for name in os.listdir(self.disk_path):
+                if name != str(version):
+                    shutil.rmtree(os.path.join(self.disk_path, name), ignore_errors=True)
+
+    def _disk_file(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_path, str(self.version), f'{digest}.pkl')
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.disk_path:
+            try:
+                with open(self._disk_file(key), 'rb') as f:
+                    stored_key, value = pickle.load(f)
+                if stored_key == key:
+                    self.disk_hits += 1
+                    self._put_memory(key, value)
+                    return value
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_memory(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+        if self.disk_path:
+            path = self._disk_file(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+
+    def clear(self):
+        """
+        Drop the in-memory entries (the disk tier is kept)
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
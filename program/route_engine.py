@@ -0,0 +1,524 @@
+import math
+import heapq
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371009
+
+# Cost multiplier applied to the edges of every route already found when searching for the next alternative
+DEFAULT_PENALTY = 1.4
+# Edge cost arrays kept per recently used weight setting (8 bytes per edge each)
+ENGINE_COST_CACHE = 4
+
+# Pareto search: labels within this relative margin of another one on every objective are dropped,
+# which keeps the front (and the search) small at the price of a (1 + epsilon) approximation
+PARETO_EPSILON = 0.02
+# Weight grid of the weighted searches seeding the Pareto front
+PARETO_SWEEP_STEP = 0.25
+# Routes may cost at most this much more than the worst seed route on each objective
+PARETO_SLACK = 0.1
+# Labels settled before the Pareto search gives up and returns the front found so far
+MAX_PARETO_LABELS = 200_000
+
+
+def normalize_scores(values):
+    """
+    Scale finite values to [0, 1]; missing (NaN) scores are treated as neutral (0.5)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return np.full(len(values), 0.5)
+    low, high = values[finite].min(), values[finite].max()
+    if high == low:
+        return np.full(len(values), 0.5)
+    return np.where(finite, (values - low) / (high - low), 0.5)
+
+
+def haversine(lat, lon, lat0, lon0):
+    """
+    Great-circle distance in metres between two points given in radians
+    """
+    a = math.sin((lat - lat0) / 2) ** 2 + math.cos(lat) * math.cos(lat0) * math.sin((lon - lon0) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class Potential(dict):
+    """
+    Average (symmetric) A* potential, consistent for both search directions, computed on first use per
+    node: scale * (lower bound to the targets - lower bound to the sources). Each side is a centre
+    (radians) and radius in metres, the bound being the distance to the centre minus the radius.
+    """
+    __slots__ = ('lat', 'lon', 'scale', 'targets', 'sources')
+
+    def __init__(self, lat, lon, scale, targets, sources):
+        super().__init__()
+        self.lat, self.lon, self.scale = lat, lon, scale
+        self.targets, self.sources = targets, sources
+
+    def __missing__(self, node):
+        lat, lon = self.lat[node], self.lon[node]
+        lat_t, lon_t, radius_t = self.targets
+        lat_s, lon_s, radius_s = self.sources
+        value = self.scale * (max(haversine(lat, lon, lat_t, lon_t) - radius_t, 0.0)
+                              - max(haversine(lat, lon, lat_s, lon_s) - radius_s, 0.0))
+        self[node] = value
+        return value
+
+
+class RouteEngine:
+    """
+    Multi-criteria router over the CSR arrays of a GraphSnapshot.
+
+    Every edge gets a combined cost
+        length * (distance_weight + safety_weight * (1 - safety) + comfort_weight * (1 - comfort))
+    where safety and comfort are the edge scores normalized to [0, 1] over the whole graph, so the
+    cost is never below distance_weight * length and a haversine heuristic stays admissible.
+
+    The search loops index the arrays through memoryviews: no per-process copy into Python objects,
+    so the memory-mapped snapshot pages stay shared between workers, and nothing per query is
+    proportional to the graph size. Only the reverse adjacency, node coordinates and the cost arrays
+    of recently used weights are per-process numpy arrays.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.n_nodes = snapshot.n_nodes
+
+        self._indptr = memoryview(np.ascontiguousarray(snapshot.indptr))
+        self._heads = memoryview(np.ascontiguousarray(snapshot.indices))
+        self._tails = memoryview(np.ascontiguousarray(snapshot.edge_src))
+
+        # Reverse adjacency (incoming edges per node) for the backward search
+        order = np.argsort(snapshot.indices, kind='stable')
+        rev_indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(snapshot.indices, minlength=self.n_nodes), out=rev_indptr[1:])
+        self._rev_indptr = memoryview(rev_indptr)
+        self._rev_edges = memoryview(order)
+
+        self._lat = memoryview(np.radians(np.asarray(snapshot.y, dtype=np.float64)))
+        self._lon = memoryview(np.radians(np.asarray(snapshot.x, dtype=np.float64)))
+
+        self._length = np.asarray(snapshot.length, dtype=np.float64)
+        self._safety_penalty = 1.0 - normalize_scores(snapshot.safety_score)
+        self._comfort_penalty = 1.0 - normalize_scores(snapshot.comfort_score)
+        self._costs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def edge_costs(self, distance_weight, safety_weight, comfort_weight, edge_safety=None):
+        """
+        Combined per-edge cost array for the given preference weights. edge_safety replaces the
+        snapshot's edge safety scores (e.g. with the current accident risk folded in).
+        """
+        safety_penalty = self._safety_penalty if edge_safety is None else 1.0 - normalize_scores(edge_safety)
+        return self._length * (distance_weight
+                               + safety_weight * safety_penalty
+                               + comfort_weight * self._comfort_penalty)
+
+    def costs(self, distance_weight, safety_weight, comfort_weight, edge_safety=None):
+        """
+        edge_costs as a memoryview for the searches, built once per weight setting: the last
+        ENGINE_COST_CACHE settings are kept. Costs with edge_safety are cached per array, so pass the
+        same array (e.g. AccidentRisk's cached edge safety) to reuse them.
+        """
+        key = (distance_weight, safety_weight, comfort_weight, None if edge_safety is None else id(edge_safety))
+        with self._lock:
+            # entries hold their edge safety array, so its id is not reused by another while cached
+            cached = self._costs.get(key)
+            if cached is not None:
+                self._costs.move_to_end(key)
+                return cached[1]
+        costs = memoryview(self.edge_costs(distance_weight, safety_weight, comfort_weight, edge_safety))
+        with self._lock:
+            self._costs[key] = (edge_safety, costs)
+            while len(self._costs) > ENGINE_COST_CACHE:
+                self._costs.popitem(last=False)
+        return costs
+
+    def _centre(self, nodes):
+        """
+        Centre (radians) and radius in metres of a set of nodes (a single node is its own centre)
+        """
+        nodes = list(nodes)
+        lat = sum(self._lat[node] for node in nodes) / len(nodes)
+        lon = sum(self._lon[node] for node in nodes) / len(nodes)
+        if len(nodes) == 1:
+            return lat, lon, 0.0
+        return lat, lon, max(haversine(self._lat[node], self._lon[node], lat, lon) for node in nodes)
+
+    def potentials(self, source, target, heuristic_scale):
+        """
+        A* potential for a search from source to target, None without a distance weight
+        """
+        return self.multi_potentials((source,), (target,), heuristic_scale)
+
+    def multi_potentials(self, sources, targets, heuristic_scale):
+        """
+        potentials() for a search between sets of nodes, towards the nearest target and from the
+        nearest source (lower bound: distance to the set's centre minus its radius)
+        """
+        if heuristic_scale <= 0:
+            return None
+        # float32 lengths are rounded, keep a small margin so the heuristic stays a lower bound
+        scale = 0.5 * 0.99 * heuristic_scale
+        return Potential(self._lat, self._lon, scale, self._centre(targets), self._centre(sources))
+
+    def shortest_path(self, source, target, costs, potential=None, penalties=None):
+        """
+        Bidirectional A* (bidirectional Dijkstra when potential is None) between two node indices.
+        costs are indexed by edge (costs() or a list), penalties optionally maps edge indices to cost
+        multipliers. Return (total cost, list of edge indices) or (inf, None) if the target is unreachable.
+        """
+        if source == target:
+            return 0.0, []
+        path = self._bidirectional({source: 0.0}, {target: 0.0}, costs, potential, penalties)
+        if path is None:
+            return float('inf'), None
+        return self._path_cost(path, costs, penalties), path
+
+    def shortest_path_between(self, sources, targets, costs, potential=None, penalties=None):
+        """
+        Cheapest path from any of several sources to any of several targets in one bidirectional
+        search. sources and targets map node indices to an extra cost paid for starting or ending
+        there (e.g. for walking to that station). Return (total cost including both extra costs,
+        source, target, list of edge indices) or (inf, None, None, None) if no target is reachable.
+        potential must come from multi_potentials for the same sources and targets.
+        """
+        p = potential
+        start_f = {source: extra + (p[source] if p is not None else 0.0) for source, extra in sources.items()}
+        start_b = {target: extra - (p[target] if p is not None else 0.0) for target, extra in targets.items()}
+        path = self._bidirectional(start_f, start_b, costs, potential, penalties)
+        if path is None:
+            return float('inf'), None, None, None
+        if path:
+            source, target = self._tails[path[0]], self._heads[path[-1]]
+        else:
+            # a station node among both the sources and the targets
+            source = target = min(set(sources) & set(targets), key=lambda node: sources[node] + targets[node])
+        return sources[source] + self._path_cost(path, costs, penalties) + targets[target], source, target, path
+
+    @staticmethod
+    def _path_cost(path, costs, penalties=None):
+        if penalties:
+            return float(sum(costs[e] * penalties.get(e, 1.0) for e in path))
+        return float(sum(costs[e] for e in path))
+
+    def _bidirectional(self, start_f, start_b, costs, potential, penalties=None):
+        """
+        Bidirectional search from the start keys of the forward and backward heaps (node -> key);
+        return the edge path through the best meeting node, or None if the searches never meet
+        """
+        indptr, heads, tails = self._indptr, self._heads, self._tails
+        rev_indptr, rev_edges = self._rev_indptr, self._rev_edges
+        p = potential
+        penalties = penalties or None
+
+        dist_f, dist_b = dict(start_f), dict(start_b)
+        pred_f, pred_b = dict.fromkeys(start_f, -1), dict.fromkeys(start_b, -1)
+        done_f, done_b = set(), set()
+        heap_f, heap_b = [(d, node) for node, d in start_f.items()], [(d, node) for node, d in start_b.items()]
+        heapq.heapify(heap_f)
+        heapq.heapify(heap_b)
+        best, meeting = float('inf'), None
+        for node in start_f.keys() & start_b.keys():
+            if start_f[node] + start_b[node] < best:
+                best, meeting = start_f[node] + start_b[node], node
+
+        while heap_f and heap_b:
+            if heap_f[0][0] + heap_b[0][0] >= best:
+                break
+
+            forward = heap_f[0][0] <= heap_b[0][0]
+            if forward:
+                d, u = heapq.heappop(heap_f)
+                if u in done_f:
+                    continue
+                done_f.add(u)
+                if p is not None:
+                    d -= p[u]
+                for e in range(indptr[u], indptr[u + 1]):
+                    v = heads[e]
+                    c = costs[e]
+                    if penalties is not None:
+                        c *= penalties.get(e, 1.0)
+                    nd = d + c
+                    if p is not None:
+                        nd += p[v]
+                    if nd < dist_f.get(v, float('inf')):
+                        dist_f[v] = nd
+                        pred_f[v] = e
+                        heapq.heappush(heap_f, (nd, v))
+                        if v in dist_b and nd + dist_b[v] < best:
+                            best, meeting = nd + dist_b[v], v
+            else:
+                d, u = heapq.heappop(heap_b)
+                if u in done_b:
+                    continue
+                done_b.add(u)
+                if p is not None:
+                    d += p[u]
+                for i in range(rev_indptr[u], rev_indptr[u + 1]):
+                    e = rev_edges[i]
+                    v = tails[e]
+                    c = costs[e]
+                    if penalties is not None:
+                        c *= penalties.get(e, 1.0)
+                    nd = d + c
+                    if p is not None:
+                        nd -= p[v]
+                    if nd < dist_b.get(v, float('inf')):
+                        dist_b[v] = nd
+                        pred_b[v] = e
+                        heapq.heappush(heap_b, (nd, v))
+                        if v in dist_f and nd + dist_f[v] < best:
+                            best, meeting = nd + dist_f[v], v
+
+        if meeting is None:
+            return None
+
+        path = []
+        node = meeting
+        while pred_f[node] != -1:
+            e = pred_f[node]
+            path.append(e)
+            node = tails[e]
+        path.reverse()
+        node = meeting
+        while pred_b[node] != -1:
+            e = pred_b[node]
+            path.append(e)
+            node = heads[e]
+        return path
+
+    def shortest_path_tree(self, source, costs, targets=None, max_cost=None, reverse=False):
+        """
+        One-to-many Dijkstra from a node index, stopping once every target is settled (the whole
+        reachable graph when targets is None) or the cost exceeds max_cost. Return the per-node
+        distance and predecessor edge lists. A reverse tree follows incoming edges, giving the
+        paths from every node to source (pred is then the next edge towards source).
+        """
+        if reverse:
+            indptr, edges, ends = self._rev_indptr, self._rev_edges, self._tails
+        else:
+            indptr, edges, ends = self._indptr, None, self._heads
+        dist = [float('inf')] * self.n_nodes
+        pred = [-1] * self.n_nodes
+        remaining = set(targets) if targets is not None else None
+
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if max_cost is not None and d > max_cost:
+                break
+            if remaining is not None:
+                remaining.discard(u)
+                if not remaining:
+                    break
+            for i in range(indptr[u], indptr[u + 1]):
+                e = i if edges is None else edges[i]
+                v = ends[e]
+                nd = d + costs[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = e
+                    heapq.heappush(heap, (nd, v))
+        return dist, pred
+
+    def tree_path(self, pred, source, target):
+        """
+        Edge path from source to target in a shortest_path_tree, None if the target was not reached
+        """
+        if target == source:
+            return []
+        if pred[target] == -1:
+            return None
+        path = []
+        node = target
+        while node != source:
+            e = pred[node]
+            path.append(e)
+            node = self._tails[e]
+        path.reverse()
+        return path
+
+    def path_nodes(self, source, edge_path):
+        """
+        Convert a list of edge indices into the list of node indices it visits
+        """
+        return [source] + [self._heads[e] for e in edge_path]
+
+    def k_diverse_paths(self, source, target, k, distance_weight, safety_weight, comfort_weight,
+                        penalty=DEFAULT_PENALTY, max_iterations=None, edge_safety=None, costs=None, first_path=None):
+        """
+        Return up to k distinct edge paths using the penalty method: after each search the edges
+        of the found route get more expensive, pushing the next search onto different streets.
+        costs are the costs() of the weights when already at hand, first_path the shortest path
+        when already known (e.g. from a shortest_path_tree). The penalties go into an
+        {edge: factor} dict, the costs themselves are never copied.
+        """
+        if costs is None:
+            costs = self.costs(distance_weight, safety_weight, comfort_weight, edge_safety)
+        potential = self.potentials(source, target, distance_weight)
+        max_iterations = max_iterations or 3 * k
+
+        paths, seen = [], set()
+        penalties = {}
+        for i in range(max_iterations):
+            if i == 0 and first_path is not None:
+                path = first_path
+            else:
+                _, path = self.shortest_path(source, target, costs, potential, penalties)
+            if path is None:
+                break
+            key = tuple(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+                if len(paths) >= k:
+                    break
+            for e in path:
+                penalties[e] = penalties.get(e, 1.0) * penalty
+        return paths
+
+    def objective_costs(self, edge_safety=None):
+        """
+        Per-edge (length, safety, comfort) costs whose weighted sums are the edge_costs of any weights
+        """
+        return [self.edge_costs(1.0, 0.0, 0.0), self.edge_costs(0.0, 1.0, 0.0, edge_safety),
+                self.edge_costs(0.0, 0.0, 1.0)]
+
+    def pareto_paths(self, source, target, max_paths, edge_safety=None, epsilon=PARETO_EPSILON,
+                     max_labels=MAX_PARETO_LABELS):
+        """
+        Return up to max_paths edge paths from the Pareto front over (length, safety, comfort) costs,
+        together with their cost tuples and whether the search finished. Weighted searches over a grid
+        of weights seed the front and bound every objective; a label-setting search then adds the
+        routes no weighted sum finds. Fronts larger than max_paths are thinned to the most spread out
+        routes, keeping the seed routes first.
+        """
+        if source == target:
+            return [[]], [(0.0, 0.0, 0.0)], True
+        objectives = self.objective_costs(edge_safety)
+        objective_lists = [memoryview(costs) for costs in objectives]
+
+        seeds, seen = [], set()
+        steps = int(round(1 / PARETO_SWEEP_STEP))
+        for i in range(steps + 1):
+            for j in range(steps - i + 1):
+                weights = (i / steps, j / steps, (steps - i - j) / steps)
+                costs = weights[0] * objectives[0] + weights[1] * objectives[1] + weights[2] * objectives[2]
+                _, path = self.shortest_path(source, target, memoryview(costs), self.potentials(source, target, weights[0]))
+                if path is None:
+                    return [], [], True
+                if tuple(path) not in seen:
+                    seen.add(tuple(path))
+                    seeds.append((tuple(sum(cost[e] for e in path) for cost in objective_lists), path))
+
+        bounds = [max(costs[i] for costs, _ in seeds) * (1 + PARETO_SLACK) for i in range(3)]
+        # exact per-objective costs to the target, as far as the bounds reach
+        lower = [self.shortest_path_tree(target, costs, max_cost=bound, reverse=True)[0]
+                 for costs, bound in zip(objective_lists, bounds)]
+        front, complete = self._label_setting(source, target, objective_lists, lower, bounds,
+                                              [costs for costs, _ in seeds], epsilon, max_labels)
+
+        # seed routes first, then the search's routes not (nearly) dominated by a seed
+        paths = seeds + [(costs, path) for costs, path in front
+                         if not any(_dominates(seed, costs, epsilon) for seed, _ in seeds)]
+        chosen = _spread(paths, max_paths, bounds, keep=len(seeds))
+        return [paths[i][1] for i in chosen], [paths[i][0] for i in chosen], complete
+
+    def _label_setting(self, source, target, objectives, lower, bounds, front, epsilon, max_labels):
+        """
+        Bounded multi-objective label-setting search. Labels are settled in order of their lower-bounded
+        cost normalized by the bounds (a dominating label always comes first) and dropped when they
+        exceed a bound or are epsilon-dominated at their node or, lower bounds added, by a known route.
+        Return the (costs, edge path) of the routes reaching the target and whether the search finished.
+        """
+        indptr, heads = self._indptr, self._heads
+        len_cost, safety_cost, comfort_cost = objectives
+        h_len, h_safety, h_comfort = lower
+        b_len, b_safety, b_comfort = bounds
+        w_len, w_safety, w_comfort = (1 / max(bound, 1e-9) for bound in bounds)
+        known = list(front)
+        margin = 1 + epsilon
+
+        def pruned(node, a, b, c):
+            fa, fb, fc = a + h_len[node], b + h_safety[node], c + h_comfort[node]
+            if fa > b_len or fb > b_safety or fc > b_comfort:
+                return True
+            fa, fb, fc = fa * margin, fb * margin, fc * margin
+            for ka, kb, kc in known:
+                if ka <= fa and kb <= fb and kc <= fc:
+                    return True
+            for ka, kb, kc in settled.get(node, ()):
+                if ka <= a * margin and kb <= b * margin and kc <= c * margin:
+                    return True
+            return False
+
+        # label i: node, edge into it, previous label and costs
+        nodes, edges, preds, costs = [source], [-1], [-1], [(0.0, 0.0, 0.0)]
+        settled = {}
+        heap = [(0.0, 0)]
+        found = []
+        n_settled = 0
+        while heap:
+            if n_settled >= max_labels:
+                return found, False
+            _, label = heapq.heappop(heap)
+            u = nodes[label]
+            a, b, c = costs[label]
+            if pruned(u, a, b, c):
+                continue
+            settled.setdefault(u, []).append((a, b, c))
+            n_settled += 1
+            if u == target:
+                path = []
+                i = label
+                while edges[i] != -1:
+                    path.append(edges[i])
+                    i = preds[i]
+                path.reverse()
+                found.append(((a, b, c), path))
+                known.append((a, b, c))
+                continue
+            for e in range(indptr[u], indptr[u + 1]):
+                v = heads[e]
+                na, nb, nc = a + len_cost[e], b + safety_cost[e], c + comfort_cost[e]
+                if pruned(v, na, nb, nc):
+                    continue
+                nodes.append(v)
+                edges.append(e)
+                preds.append(label)
+                costs.append((na, nb, nc))
+                key = (na + h_len[v]) * w_len + (nb + h_safety[v]) * w_safety + (nc + h_comfort[v]) * w_comfort
+                heapq.heappush(heap, (key, len(nodes) - 1))
+        return found, True
+
+
+def _dominates(a, b, epsilon=0.0):
+    """
+    True when cost tuple a is no worse than b on every objective, up to a relative margin
+    """
+    return all(x <= y * (1 + epsilon) for x, y in zip(a, b))
+
+
+def _spread(paths, n, bounds, keep=1):
+    """
+    Indices of up to n (costs, path) entries: the first keep ones, then greedily the entry
+    farthest (objectives scaled by bounds) from everything chosen so far
+    """
+    if len(paths) <= n:
+        return list(range(len(paths)))
+    points = np.array([costs for costs, _ in paths]) / np.maximum(bounds, 1e-9)
+    chosen = list(range(max(min(n, keep), 1)))
+    distance = np.min(np.linalg.norm(points[:, None, :] - points[None, chosen, :], axis=2), axis=1)
+    while len(chosen) < n:
+        i = int(np.argmax(distance))
+        chosen.append(i)
+        distance = np.minimum(distance, np.linalg.norm(points - points[i], axis=1))
+    return chosen
@@ -0,0 +1,84 @@
+import struct
+import numpy as np
+
+
+# Opt-in response formats of /route next to the default list of {"lat", "lon"} dicts
+ROUTE_FORMATS = ('json', 'polyline', 'binary')
+DEFAULT_ROUTE_FORMAT = 'json'
+POLYLINE_PRECISION = 5
+
+
+def edge_polyline(snapshot, edges):
+    """
+    Return the (lat, lon) points of a route given as snapshot edge indices, by concatenating the
+    edges' slices of the flat geometry array. Like the per-edge GeoDataFrame walk it replaces,
+    the shared point between consecutive edges appears twice.
+    """
+    edges = np.asarray(edges, dtype=np.int64)
+    edges = edges[edges >= 0]
+    offsets = np.asarray(snapshot.geom_offsets)
+    starts, counts = offsets[edges], offsets[edges + 1] - offsets[edges]
+    # index of every point: its edge's start offset plus its position inside the edge
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    points = np.repeat(starts, counts) + np.arange(counts.sum()) - first
+    coords = np.asarray(snapshot.geom_coords)[points]
+    return coords[:, ::-1]
+
+
+def encode_polyline(points, precision=POLYLINE_PRECISION):
+    """
+    Encode (lat, lon) points with the Google encoded polyline algorithm
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return ''
+    values = np.round(points * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    deltas = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # 5-bit chunks, least significant first, with the continuation bit set on all but the last
+    shifts = np.arange(0, 64, 5)
+    chunks = (deltas[:, None] >> shifts) & 0x1f
+    n_chunks = np.maximum(1, np.sum((deltas[:, None] >> shifts) > 0, axis=1))
+    used = shifts < n_chunks[:, None] * 5
+    chunks = chunks | np.where(shifts < (n_chunks[:, None] - 1) * 5, 0x20, 0)
+    return (chunks[used] + 63).astype(np.uint8).tobytes().decode('ascii')
+
+
+def decode_polyline(text, precision=POLYLINE_PRECISION):
+    """
+    Decode a Google encoded polyline into an array of (lat, lon) points
+    """
+    values = []
+    value = shift = 0
+    for char in text.encode('ascii'):
+        byte = char - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    return np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def pack_routes(routes):
+    """
+    Pack a list of (lat, lon) point arrays into little-endian bytes: uint32 route count, uint32 point
+    count per route, then all points as float32 (lat, lon) pairs
+    """
+    counts = [len(points) for points in routes]
+    header = struct.pack(f'<I{len(counts)}I', len(counts), *counts)
+    points = np.concatenate(routes).astype('<f4') if routes else np.zeros((0, 2), '<f4')
+    return header + points.tobytes()
+
+
+def unpack_routes(data):
+    """
+    Inverse of pack_routes
+    """
+    n_routes, = struct.unpack_from('<I', data)
+    if not n_routes:
+        return []
+    counts = struct.unpack_from(f'<{n_routes}I', data, 4)
+    points = np.frombuffer(data, dtype='<f4', offset=4 * (n_routes + 1)).reshape(-1, 2)
+    return np.split(points.astype(np.float64), np.cumsum(counts)[:-1])
@@ -1,76 +1,220 @@
+import os
 import time
-import requests
+import logging
+import threading
 import pandas as pd
 import numpy as np
 import osmnx as ox
-import xml.etree.ElementTree as ET
+from graph_snapshot import GraphSnapshot, GRAPHML_PATH, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer, combined_scores
+from spatial_index import SpatialIndex, project
+from tfl_feed import StationFeed, TFL_FEED_URL
+from station_search import StationSearchIndex
+from route_geometry import edge_polyline
+from route_result import RouteResult
+from route_cache import RouteCache, SEARCH_WEIGHT_STEP, quantize_weights
+from contraction import ContractionHierarchy, CH_PATH
+from accident_risk import AccidentRisk
+from station_routes import StationRouteStore, STATION_ROUTES_PATH, METRIC_COLUMNS
+from batch_routing import BatchRouter
+from graph_tiles import GraphTiles, TiledRouteEngine, TILES_PATH
+from instrumentation import span
+
+
+# 'diverse': penalty-method alternatives searched directly on the combined distance/safety/comfort cost
+# 'yen': k shortest paths on length, rescored afterwards
+# 'pareto': routes of the (length, safety, comfort) Pareto front, found once per station pair and re-ranked for any weights
+ROUTING_MODES = ('diverse', 'yen', 'pareto')
+DEFAULT_ROUTING_MODE = 'diverse'
+# Routes kept from a Pareto front (the most spread out ones when it is larger)
+PARETO_ROUTES = 20
+
+# Stations considered at each end of a route: the requested one and its nearest neighbours with bikes
+# (start) or free docks (end), all evaluated in one multi-source / multi-target search
+STATION_CANDIDATES = 3
+# Alternative stations further than this (metres) from the requested one are not considered
+MAX_STATION_WALK_M = 500
+# Route cost of walking one metre to or from an alternative station, in metres of cycling
+WALK_COST_FACTOR = 3.0
+# bike_type -> availability column a start station needs a bike in
+BIKE_TYPES = {'any': 'bikes', 'standard': 'standardBikes', 'ebike': 'eBikes'}
+# Placeholder of the lazily loaded snapshot structures, which may load as None (file missing or stale)
+NOT_LOADED = object()
+
+logger = logging.getLogger(__name__)
 
 
 class RouteNetwork:
 
-    def __init__(self):
-        file_path = '../data/london_bike_network_safety_comfort_score.graphml'
-        self.G = ox.load_graphml(file_path)
-
-        # load station data 
-        self.station_df = self.load_tfl_data()
+    def __init__(self, graphml_path=GRAPHML_PATH, snapshot_path=SNAPSHOT_PATH, ch_path=CH_PATH,
+                 station_routes_path=STATION_ROUTES_PATH, tiles_path=TILES_PATH, station_feed_url=TFL_FEED_URL,
+                 station_refresh_interval=60,
+                 route_cache_size=1024, route_cache_dir=None, batch_processes=1, station_candidates=STATION_CANDIDATES):
+        self.graphml_path = graphml_path
+        self.station_candidates = station_candidates
+        self._G = None
+        # Read paths are safe to call from many threads; this only guards the lazily built members
+        self._lock = threading.Lock()
+
+        # Prefer the compiled snapshot (memory-mapped, shared between workers) over parsing GraphML
+        self.snapshot = None
+        self._engine = None
+        self.tiled_engine = None
+        self.scorer = None
+        self._spatial = None
+        self.ch = None
+        self.station_routes = None
+        self._accident_risk = None
+        # Batches run in the calling request thread by default: forking a pool from a threaded server
+        # worker is unsafe. More processes are meant for offline use (one pool, closed by close())
+        self.batch_processes = batch_processes
+        self._batch_router = None
+        if snapshot_path and os.path.isdir(snapshot_path):
+            self.snapshot = GraphSnapshot.load(snapshot_path)
+            # With graph tiles, interactive searches only load the tiles around each route: the whole-graph
+            # engine is built on first use (batch routing, risk-weighted searches) and distance-only queries
+            # run on the tiles instead of the contraction hierarchy. The node index and accident risk are
+            # always loaded on first use.
+            tiles = GraphTiles.load(self.snapshot, tiles_path) if tiles_path else None
+            if tiles is not None:
+                self.tiled_engine = TiledRouteEngine(tiles)
+            else:
+                self._engine = RouteEngine(self.snapshot)
+                self.ch = ContractionHierarchy.load(self.snapshot, ch_path)
+            self.scorer = RouteScorer(self.snapshot)
+            self._spatial = NOT_LOADED
+            self._accident_risk = NOT_LOADED
+            self.station_routes = StationRouteStore.open(self.snapshot, station_routes_path)
+            logger.info("Loaded graph snapshot %s: %d nodes, %d edges",
+                        self.snapshot.version[:12], self.snapshot.n_nodes, self.snapshot.n_edges)
+        else:
+            self._G = ox.load_graphml(graphml_path)
+
+        # Candidate routes per snapped pair and ranked results per pair and weights, scoped to the graph version
+        graph_version = self.snapshot.version if self.snapshot is not None else graphml_path
+        self.candidate_cache = RouteCache(route_cache_size, route_cache_dir and os.path.join(route_cache_dir, 'candidates'))
+        self.result_cache = RouteCache(route_cache_size, route_cache_dir and os.path.join(route_cache_dir, 'results'))
+        self.candidate_cache.set_version(graph_version)
+        self.result_cache.set_version(graph_version)
+
+        # load station data once (blocking), then keep it fresh from a background thread
+        self.station_df = pd.DataFrame()
+        self.station_index = StationSearchIndex()
+        self.station_refresh_interval = station_refresh_interval
+        self.station_feed = StationFeed(station_feed_url, interval=station_refresh_interval)
+        self.station_feed.subscribe(self._on_station_update)
+        self.station_feed.refresh()
         if self.station_df.empty:
             raise Exception("bicycle station data cannot be loaded")
         else:
-            print(self.station_df.head())
-            print(f"A total of {len(self.station_df)} sites were loaded")
+            self.start_station_refresh()
+            logger.debug("Stations:\n%s", self.station_df.head())
+            logger.info("A total of %d sites were loaded", len(self.station_df))
+
+    @property
+    def G(self):
+        """
+        The NetworkX graph, only parsed from GraphML the first time a code path needs it
+        """
+        if self._G is None:
+            with self._lock:
+                if self._G is None:
+                    self._G = ox.load_graphml(self.graphml_path)
+        return self._G
+
+    @property
+    def engine(self):
+        """
+        The whole-graph RouteEngine (None without a snapshot), built lazily when graph tiles are used
+        """
+        if self._engine is None and self.snapshot is not None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = RouteEngine(self.snapshot)
+        return self._engine
 
+    def _load_once(self, name, load):
+        """
+        Value of the lazily loaded member name, calling load() under the lock the first time
+        """
+        value = getattr(self, name)
+        if value is NOT_LOADED:
+            with self._lock:
+                value = getattr(self, name)
+                if value is NOT_LOADED:
+                    value = load()
+                    setattr(self, name, value)
+        return value
+
+    @property
+    def spatial(self):
+        """
+        The snapshot's SpatialIndex (None without a snapshot), loaded on the first lookup
+        """
+        return self._load_once('_spatial', lambda: SpatialIndex.load(self.snapshot))
+
+    @property
+    def accident_risk(self):
+        """
+        The snapshot's AccidentRisk, loaded on the first risk-weighted request; None without a
+        snapshot or accident series
+        """
+        def load():
+            accident_risk = AccidentRisk.load(self.snapshot)
+            if accident_risk is None:
+                logger.info("No accident series for this snapshot, time-decayed accident risk is unavailable")
+            return accident_risk
+
+        return self._load_once('_accident_risk', load)
+
+    def start_station_refresh(self):
+        """
+        Start refreshing the station data in the background (again in every worker process after a fork,
+        since threads do not survive it)
+        """
+        if self.station_refresh_interval:
+            self.station_feed.start()
+
+    def stop_station_refresh(self):
+        self.station_feed.stop()
+
+    def close(self):
+        """
+        Stop the background work: station polling and the batch routing pool, if any
+        """
+        self.stop_station_refresh()
+        with self._lock:
+            if self._batch_router is not None:
+                self._batch_router.close()
 
-    def load_tfl_data(self, url="https://tfl.gov.uk/tfl/syndication/feeds/cycle-hire/livecyclehireupdates.xml"):
+    def load_tfl_data(self, url=TFL_FEED_URL):
         """
         Obtain the bike data from the TfL data site and return the DataFrame containing the site
         """
-        try:
-            # Obtain and parse the xml dataset
-            response = requests.get(url)
-            root = ET.fromstring(response.content)
-
-            station_list = []
-            for station in root.findall('station'):
-                station_data = {'valid': True}
-                try:
-                    # Extract core fields
-                    station_data.update({
-                        'id': int(station.find('id').text),
-                        'name': station.find('name').text.strip(),
-                        'lat': float(station.find('lat').text),
-                        'lon': float(station.find('long').text),
-                        'bikes': int(station.find('nbBikes').text),
-                        'standardBikes': int(station.find('nbStandardBikes').text),
-                        'eBikes': int(station.find('nbEBikes').text),
-                        'docks': int(station.find('nbEmptyDocks').text)
-                    })
-
-                    # Validity check (If there is at least one vehicle at the site, 
-                    # it is considered available; otherwise, it is marked as invalid)
-                    station_data['valid'] = (station_data['bikes'] >= 1) 
-
-                except(AttributeError, ValueError, TypeError) as e:
-                    print(f"Parsing site error: {str(e)}")
-                    station_data['valid'] = False
-
-                station_list.append(station_data)
-
-            return pd.DataFrame(station_list)
-
-        except requests.exceptions.RequestException as e:
-            print(f"Network request failed: {str(e)}")
-            return pd.DataFrame()
-
-        except ET.ParseError as e:
-            print(f"XML parsing failed: {str(e)}")
-            return pd.DataFrame()
+        feed = StationFeed(url)
+        feed.refresh()
+        return feed.table
 
 
     def get_station_coord(self, station_name, station_df, is_start=True): # is_start = True, indicates the starting point
         """
         Obtain the corresponding geographical coordinates based on the incoming starting point and ending point
         """
+        if len(self.station_index):
+            # Ranked index lookup: best name match first, then stations with more bikes
+            matches = self.station_index.search(station_name, limit=None)
+            if not matches:
+                raise ValueError(f"No matching site was found: {station_name}")
+            for row in matches:
+                if not row['valid']:
+                    continue
+                if is_start and row['bikes'] > 0:
+                    return row['lat'], row['lon'], row['name']
+                elif not is_start:
+                    return row['lat'], row['lon'], row['name']
+            raise ValueError(f"No available stations found: {station_name}")
+
         # Fuzzy matching query
         matches = station_df[station_df['name'].str.contains(station_name, case=False)]
         if len(matches) == 0:
@@ -91,23 +235,151 @@ class RouteNetwork:
         raise ValueError(f"No available stations found: {station_name}")
 
 
+    def candidate_stations(self, station_name, is_start=True, n=STATION_CANDIDATES, bike_type='any'):
+        """
+        The station best matching station_name and its nearest neighbours within MAX_STATION_WALK_M,
+        keeping those with a bike of bike_type (start) or a free dock (end). Return up to n stations,
+        nearest first, with a 'walk' column (metres from the matched station).
+        """
+        if bike_type not in BIKE_TYPES:
+            raise ValueError(f"Unknown bike type {bike_type}, expected one of {', '.join(BIKE_TYPES)}")
+        station_df = self.station_df
+        if len(self.station_index):
+            matches = self.station_index.search(station_name, limit=1)
+            if not matches:
+                raise ValueError(f"No matching site was found: {station_name}")
+            lat, lon = matches[0]['lat'], matches[0]['lon']
+        else:
+            matches = station_df[station_df['name'].str.contains(station_name, case=False)]
+            if len(matches) == 0:
+                raise ValueError(f"No matching site was found: {station_name}")
+            lat, lon = matches['lat'].iloc[0], matches['lon'].iloc[0]
+
+        x, y = project(station_df['lat'].values, station_df['lon'].values, lat)
+        x0, y0 = project(lat, lon, lat)
+        walk = np.hypot(x - x0, y - y0)
+        available = station_df[BIKE_TYPES[bike_type] if is_start else 'docks'].values > 0
+        nearest = np.flatnonzero(available & (walk <= MAX_STATION_WALK_M))
+        nearest = nearest[np.argsort(walk[nearest], kind='stable')[:n]]
+        if len(nearest) == 0:
+            raise ValueError(f"No available stations found: {station_name}")
+        candidates = station_df.iloc[nearest].copy()
+        candidates['walk'] = walk[nearest]
+        return candidates
+
+    def choose_station_pair(self, starts, ends, distance_weight, safety_weight, comfort_weight,
+                            risk_window_days=None, risk_half_life_days=None):
+        """
+        Pick the start and end station (rows of candidate_stations) with the cheapest route plus walking,
+        in one multi-source / multi-target search with the search weights of findKBestRoutes
+        """
+        if len(starts) == 1 and len(ends) == 1:
+            return starts.iloc[0], ends.iloc[0]
+
+        # the nearest station wins when several share a road node
+        def extra_costs(stations):
+            extra = {}
+            nodes = self.snapshot.node_indices(stations['node'].values).tolist()
+            for node, walk in zip(nodes, stations['walk'].tolist()):
+                extra.setdefault(node, WALK_COST_FACTOR * walk)
+            return nodes, extra
+
+        start_nodes, sources = extra_costs(starts)
+        end_nodes, targets = extra_costs(ends)
+        search_weights = quantize_weights(*quantize_weights(distance_weight, safety_weight, comfort_weight),
+                                          step=SEARCH_WEIGHT_STEP)
+        risk = (risk_window_days, risk_half_life_days)
+        key = ('station_pair', tuple(sources.items()), tuple(targets.items()), search_weights, self.riskKey(*risk))
+        pair = self.candidate_cache.get(key)
+        if pair is None:
+            edge_safety = self.riskEdgeSafety(*risk)
+            if self.tiled_engine is not None and edge_safety is None:
+                _, source, target, _ = self.tiled_engine.shortest_path_between(sources, targets, *search_weights)
+            else:
+                costs = self.engine.costs(*search_weights, edge_safety)
+                _, source, target, _ = self.engine.shortest_path_between(
+                    sources, targets, costs, self.engine.multi_potentials(sources, targets, search_weights[0]))
+            if source is None:
+                raise ValueError("No available path could be found between the candidate stations")
+            pair = (start_nodes.index(source), end_nodes.index(target))
+            self.candidate_cache.put(key, pair)
+        return starts.iloc[pair[0]], ends.iloc[pair[1]]
+
+    def _on_station_update(self, station_df, diff):
+        """
+        Called by the station feed after every change: enrich the new table, then swap it in
+        """
+        station_df = station_df.copy()
+        self.snap_stations(station_df)
+        self.station_index.update(station_df, diff)
+        self.station_df = station_df
+
+    def snap_stations(self, station_df):
+        """
+        Snap every station to its nearest road node in one batch query (adds 'node' and 'node_dist' columns)
+        """
+        if self.spatial is None or station_df.empty:
+            return
+        nodes, dists = self.spatial.nearest_nodes(station_df['lat'].values, station_df['lon'].values)
+        station_df['node'] = self.snapshot.node_ids[nodes]
+        station_df['node_dist'] = dists
+
+    def get_station_node(self, station_name, lat, lon):
+        """
+        Return (node ID, distance) of a station, using the precomputed snap when available
+        """
+        if 'node' in self.station_df:
+            rows = self.station_df[self.station_df['name'] == station_name]
+            if len(rows):
+                return int(rows['node'].iloc[0]), float(rows['node_dist'].iloc[0])
+        return self.get_nearest_road_node(lat, lon)
+
     def get_nearest_road_node(self, lat, lon):
         """
         Return (node ID, distance to the site)
         """
+        if self.spatial is not None:
+            nodes, dists = self.spatial.nearest_nodes(lat, lon)
+            node_id, distance = int(self.snapshot.node_ids[nodes[0]]), float(dists[0])
+            logger.debug("The nearest node ID: %s, with a distance of %.2f meters", node_id, distance)
+            return node_id, distance
+
         try:
             node_id, distance = ox.distance.nearest_nodes(self.G, X=lon, Y=lat, return_dist=True)
-            print(f"The nearest node ID: {node_id}, with a distance of {distance:.2f} meters")
+            logger.debug("The nearest node ID: %s, with a distance of %.2f meters", node_id, distance)
             return node_id, distance
 
         except Exception as e:
-            print(f"Failed to find the nearest node: {str(e)}")
+            logger.warning("Failed to find the nearest node: %s", e)
             return None, float('inf')
 
-    def evaluateRouteScores(self, route):
+    def riskEdgeSafety(self, risk_window_days=None, risk_half_life_days=None):
+        """
+        Edge safety scores with the accident risk of the given window / half-life (as of today) in place
+        of the static accident score, or None to use the snapshot's scores
+        """
+        if (risk_window_days is None and risk_half_life_days is None) or self.accident_risk is None:
+            return None
+        return self.accident_risk.edge_safety(risk_window_days, risk_half_life_days)
+
+    def riskKey(self, risk_window_days=None, risk_half_life_days=None):
+        """
+        Cache key part of a risk setting; risks change daily
+        """
+        if (risk_window_days is None and risk_half_life_days is None) or self.accident_risk is None:
+            return None
+        return (risk_window_days, risk_half_life_days, str(np.datetime64('today', 'D')))
+
+    def evaluateRouteScores(self, route, risk_window_days=None, risk_half_life_days=None):
         """
         Evaluate  and return the cycling score and factors of the current path
         """
+        if self.scorer is not None:
+            metrics, _ = self.scorer.score_node_routes([self.snapshot.node_indices(route)],
+                                                       self.riskEdgeSafety(risk_window_days, risk_half_life_days))
+            return (float(metrics['safety_factor'][0]), float(metrics['comfort_factor'][0]),
+                    int(metrics['street_count'][0]), float(metrics['cycleway_coverage'][0]))
+
         edge_safety_scores = []
         edge_comfort_scores = []
         node_safety_scores = []
@@ -164,154 +436,388 @@ class RouteNetwork:
         
         return safety_score, comfort_score, street_counts, cycle_coverage
 
-    def findKBestRoutes(self, start_node, end_node, k, safety_weight, comfort_weight, distance_weight):
+    def searchCandidateRoutes(self, start_node, end_node, k, safety_weight, comfort_weight, distance_weight,
+                              mode=DEFAULT_ROUTING_MODE, risk_window_days=None, risk_half_life_days=None):
+        """
+        Return up to k candidate routes between two road nodes: int32 arrays of node indices when the
+        snapshot is loaded, lists of node IDs otherwise
+        """
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode: {mode}")
+
+        if mode == 'pareto':
+            # the front does not depend on the weights, they only rank it
+            if self.snapshot is None:
+                raise ValueError("Pareto routing needs the graph snapshot")
+            source = self.snapshot.node_index(start_node)
+            target = self.snapshot.node_index(end_node)
+            edge_paths, _, complete = self.engine.pareto_paths(source, target, k,
+                                                               self.riskEdgeSafety(risk_window_days, risk_half_life_days))
+            if not complete:
+                logger.warning("Pareto search stopped at its label limit, the front is partial")
+            return [np.array(self.engine.path_nodes(source, path), dtype=np.int32) for path in edge_paths]
+
+        if mode == 'diverse' and self.snapshot is not None:
+            source = self.snapshot.node_index(start_node)
+            target = self.snapshot.node_index(end_node)
+            edge_safety = self.riskEdgeSafety(risk_window_days, risk_half_life_days)
+            # tiles hold the static edge scores, risk-weighted searches run on the whole graph
+            if self.tiled_engine is not None and edge_safety is None:
+                engine = self.tiled_engine
+                edge_paths = engine.k_diverse_paths(source, target, k, distance_weight, safety_weight, comfort_weight)
+            else:
+                engine = self.engine
+                edge_paths = engine.k_diverse_paths(source, target, k,
+                                                    distance_weight=distance_weight,
+                                                    safety_weight=safety_weight,
+                                                    comfort_weight=comfort_weight,
+                                                    edge_safety=edge_safety)
+            return [np.array(engine.path_nodes(source, path), dtype=np.int32) for path in edge_paths]
+
+        routes = list(ox.routing.k_shortest_paths(self.G, start_node, end_node, k, weight="length")) # Yen's algorithm, obtain k shortest paths
+        if self.snapshot is not None:
+            return [self.snapshot.node_indices(route).astype(np.int32) for route in routes]
+        return routes
+
+    def findKBestRoutes(self, start_node, end_node, k, safety_weight, comfort_weight, distance_weight,
+                        mode=DEFAULT_ROUTING_MODE, risk_window_days=None, risk_half_life_days=None):
         """
         Taking into account both distance and safety factors comprehensively, return k optimal routes
         """
         # if distance_weight is None:
         #     distance_weight = 1.0 - safety_weight - comfort_weight
 
-        routes = list(ox.routing.k_shortest_paths(self.G, start_node, end_node, k, weight="length")) # Yen's algorithm, obtain k shortest paths
-        
+        # Served straight from the result cache when the same pair and (rounded) weights were asked before
+        weights = quantize_weights(distance_weight, safety_weight, comfort_weight)
+        distance_weight, safety_weight, comfort_weight = weights
+        risk = (risk_window_days, risk_half_life_days)
+        result_key = (start_node, end_node, mode, k, weights, self.riskKey(*risk))
+        ranked = self.result_cache.get(result_key)
+        if ranked is not None:
+            return [detail.replace() for detail in ranked]
+
+        # Candidates are shared between weights: Yen's routes and Pareto fronts do not depend on them at all, diverse
+        # searches run with coarsely rounded weights so nearby slider settings only need re-ranking
+        search_weights = None if mode in ('yen', 'pareto') else quantize_weights(*weights, step=SEARCH_WEIGHT_STEP)
+        candidate_key = (start_node, end_node, mode, k, search_weights, self.riskKey(*risk))
+        route_details = self.candidate_cache.get(candidate_key)
+        if route_details is None:
+            search_distance, search_safety, search_comfort = search_weights or weights
+            with span('search'):
+                routes = self.searchCandidateRoutes(start_node, end_node, k, search_safety, search_comfort, search_distance,
+                                                    mode, *risk)
+            with span('scoring'):
+                route_details = self.scoreRoutes(routes, *risk)
+            self.candidate_cache.put(candidate_key, route_details)
+
+        with span('ranking'):
+            ranked = self.rankRoutes([detail.replace() for detail in route_details], safety_weight, comfort_weight, distance_weight)
+        self.result_cache.put(result_key, ranked)
+        return [detail.replace() for detail in ranked]
+
+    def scoreRoutes(self, routes, risk_window_days=None, risk_half_life_days=None):
+        """
+        Score all candidate routes (searchCandidateRoutes output) into RouteResults, in one batch over
+        the snapshot arrays when available
+        """
+        if not routes:
+            return []
+        if self.scorer is None:
+            route_details = []
+            for route in routes:
+                safety_factor, comfort_factor, street_counts, lanes_coverage = self.evaluateRouteScores(route)
+                gdf = ox.routing.route_to_gdf(self.G, route, weight="length")
+                total_length = gdf["length"].sum()
+
+                acc_list = []
+                for num in gdf['casualty_count']:
+                    acc_list.append(num)
+
+                accidents_counts = 0
+                for num in acc_list:
+                    accidents_counts += int(num) 
+
+                # store route details
+                route_details.append(RouteResult(
+                    np.asarray(route, dtype=np.int64),
+                    safety_factor=safety_factor,
+                    comfort_factor=comfort_factor,
+                    total_length=float(total_length),
+                    street_count=street_counts,
+                    cycleway_coverage=lanes_coverage,
+                    accidents_count=accidents_counts
+                ))
+            return route_details
+
+        metrics, edges = self.scorer.score_node_routes(routes, self.riskEdgeSafety(risk_window_days, risk_half_life_days))
+        # one conversion per metric instead of one numpy scalar per route
+        safety, comfort, length, coverage = (metrics[name].astype(np.float64).tolist() for name in
+                                             ('safety_factor', 'comfort_factor', 'total_length', 'cycleway_coverage'))
+        streets, accidents = (metrics[name].astype(np.int64).tolist() for name in ('street_count', 'accidents_count'))
         route_details = []
-        for route in routes:
-            safety_factor, comfort_factor, street_counts, lanes_coverage = self.evaluateRouteScores(route)
-            gdf = ox.routing.route_to_gdf(self.G, route, weight="length")
-            total_length = gdf["length"].sum()
-
-            acc_list = []
-            for num in gdf['casualty_count']:
-                acc_list.append(num)
-
-            accidents_counts = 0
-            for num in acc_list:
-                accidents_counts += int(num) 
-
-            # store route details
-            route_details.append({
-                "route": route,
-                "safety_factor": safety_factor,
-                "comfort_factor": comfort_factor,
-                "total_length": total_length,
-                "street_count": street_counts,
-                "cycleway_coverage": lanes_coverage,
-                "accidents_count": accidents_counts
-            })
-
+        for i, route in enumerate(routes):
+            route_details.append(RouteResult(
+                np.asarray(route, dtype=np.int32),
+                edges[i].astype(np.int32),
+                safety_factor=safety[i],
+                comfort_factor=comfort[i],
+                total_length=length[i],
+                street_count=streets[i],
+                cycleway_coverage=coverage[i],
+                accidents_count=accidents[i]
+            ))
+        return route_details
+
+    def rankRoutes(self, route_details, safety_weight, comfort_weight, distance_weight):
+        """
+        Set the weighted combined score of each candidate RouteResult and return them best first
+        """
         if not route_details:
             return []
-            
-        # Use weight factor to identify best route considering combined effect of safety and distance 
-        lengths = [detail['total_length'] for detail in route_details]
-        safeties = [detail['safety_factor'] for detail in route_details]
-        comforts = [detail['comfort_factor'] for detail in route_details]
-        
-        max_length = max(lengths)
-        min_length = min(lengths)
-        max_safety = max(safeties) if safeties else 1
-        min_safety = min(safeties) if safeties else 0
-        max_comfort = max(comforts) if comforts else 1
-        min_comfort = min(comforts) if comforts else 0
-
-        # Calculate the comprehensive score of each path
-        for detail in route_details:
-            
-            norm_length_score = 1.0 - (detail["total_length"] - min_length) / (max_length - min_length) # Normalized distance score (the shorter the distance, the higher the score)
-            norm_safety_score = (detail["safety_factor"] - min_safety) / (max_safety - min_safety)      # Normalized safety score
-            norm_comfort_score = (detail["comfort_factor"] - min_comfort) / (max_comfort - min_comfort) # Normalized comfort score
-            
-            # Overall score 
-            combined_score = (distance_weight * norm_length_score + 
-                            safety_weight * norm_safety_score + 
-                            comfort_weight * norm_comfort_score)
-            
-            detail["combined_score"] = combined_score
-        
+
+        # Use weight factor to identify best route considering combined effect of safety, comfort and distance
+        scores = combined_scores([detail.total_length for detail in route_details],
+                                 [detail.safety_factor for detail in route_details],
+                                 [detail.comfort_factor for detail in route_details],
+                                 distance_weight, safety_weight, comfort_weight)
+        for detail, combined_score in zip(route_details, scores.tolist()):
+            detail.combined_score = combined_score
+
         # Sort in descending order of the comprehensive score
-        sorted_routes = sorted(route_details, key=lambda x: x["combined_score"], reverse=True)
+        sorted_routes = sorted(route_details, key=lambda x: x.combined_score, reverse=True)
         return sorted_routes
 
-    def plan_cycle_route(self, start_name, end_name, distance_weight, safety_weight, comfort_weight):
-        start_time = time.time()
+    def lookupStationRoutes(self, start_name, end_name, safety_weight, comfort_weight, distance_weight):
+        """
+        Return the precomputed alternatives between two stations re-ranked for the given weights,
+        or an empty list if the pair is not in the station route store
+        """
+        if self.station_routes is None:
+            return []
+
+        station_ids = dict(zip(self.station_df['name'], self.station_df['id']))
+        if start_name not in station_ids or end_name not in station_ids:
+            return []
+        origin_id, dest_id = int(station_ids[start_name]), int(station_ids[end_name])
+        stored = self.station_routes.lookup(origin_id, dest_id)
+        if stored.empty:
+            return []
+
+        source, _ = self.station_routes.station_node(origin_id)
+        heads = self.snapshot.indices
+        route_details = []
+        for row in stored.itertuples(index=False):
+            edges = np.asarray(row.edges, dtype=np.int32)
+            nodes = np.concatenate(([source], heads[edges])).astype(np.int32)
+            route_details.append(RouteResult(nodes, edges, **{column: getattr(row, column) for column in METRIC_COLUMNS}))
+        return self.rankRoutes(route_details, safety_weight, comfort_weight, distance_weight)
+
+    def batch_nodes(self, points):
+        """
+        Snap batch endpoints, TfL station ids or (lat, lon) pairs, to node indices in one query.
+        Return (node indices, distances in metres).
+        """
+        if self.spatial is None:
+            raise ValueError("Batch routing needs the compiled graph snapshot")
+        points = list(points)
+        if points and np.ndim(points[0]) == 0:
+            stations = self.station_df.set_index('id')
+            ids = np.asarray(points, dtype=np.int64)
+            found = stations.index.get_indexer(ids)
+            if (found < 0).any():
+                raise ValueError(f"Unknown station ids: {ids[found < 0][:10].tolist()}")
+            lats, lons = stations['lat'].values[found], stations['lon'].values[found]
+        else:
+            coordinates = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            lats, lons = coordinates[:, 0], coordinates[:, 1]
+        return self.spatial.nearest_nodes(lats, lons)
+
+    def plan_batch_routes(self, origins, destinations, distance_weight, safety_weight, comfort_weight, k=1,
+                          risk_window_days=None, risk_half_life_days=None, with_routes=False):
+        """
+        Route many origin-destination pairs (station ids or (lat, lon) pairs) with the search and
+        metrics of findKBestRoutes, without per-pair station matching. Weights are scalars or per-pair
+        arrays. Yield result DataFrames (batch_routing.RESULT_COLUMNS) as they are computed.
+        """
+        sources, _ = self.batch_nodes(origins)
+        targets, _ = self.batch_nodes(destinations)
+        # the lazy members take the lock themselves
+        engine, accident_risk = self.engine, self.accident_risk
+        with self._lock:
+            if self._batch_router is None:
+                self._batch_router = BatchRouter(self.snapshot, engine, self.scorer, accident_risk,
+                                                 processes=self.batch_processes)
+        return self._batch_router.route(sources, targets, distance_weight, safety_weight, comfort_weight, k,
+                                        risk_window_days, risk_half_life_days, with_routes)
+
+    def route_coordinates(self, route):
+        """
+        Return the (lat, lon) points of a route (RouteResult or list of node IDs) as an (n, 2) array
+        """
+        if isinstance(route, RouteResult):
+            if route.edges is not None:
+                return route.coordinates(self.snapshot)
+            route = route.node_ids()
+        if self.snapshot is not None:
+            nodes = self.snapshot.node_indices(route)
+            return edge_polyline(self.snapshot, self.scorer.edge_indices(nodes[:-1], nodes[1:]))
+
+        def extract_coordinates(geom):
+            """Extract all coordinate points from the geometric object"""
+            if geom.geom_type == 'Point':
+                return [(geom.x, geom.y)]
+            elif geom.geom_type == 'LineString':
+                return list(geom.coords)
+            elif geom.geom_type == 'MultiLineString':
+                coords = []
+                for line in geom.geoms:
+                    coords.extend(list(line.coords))
+                return coords
+            return []
+
+        gdf = ox.routing.route_to_gdf(self.G, route)
+        coordinates = [(point[1], point[0]) for geom in gdf.geometry for point in extract_coordinates(geom)]
+        return np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+
+    def plan_cycle_route(self, start_name, end_name, distance_weight, safety_weight, comfort_weight,
+                         mode=DEFAULT_ROUTING_MODE, risk_window_days=None, risk_half_life_days=None,
+                         candidates=None, bike_type='any', k=5):
+        """
+        Plan routes between two stations by name. Return a list of RouteResults, best first (a single
+        shortest path when every weight is zero, or for a distance-only query answered by the
+        contraction hierarchy), or {"error": message}.
+        """
+        start_time = time.perf_counter()
+        # distance-only diverse queries are answered with one contraction hierarchy search
+        use_ch = (self.ch is not None and mode == 'diverse' and distance_weight > 0
+                  and safety_weight == 0 and comfort_weight == 0)
+        shortest_only = use_ch or not (safety_weight > 0 or comfort_weight > 0 or distance_weight > 0)
 
         if self.station_df is None or self.station_df.empty:
             raise ValueError("The bicycle station data is not loaded or is empty")
+        candidates = self.station_candidates if candidates is None else candidates
 
         try:
-            # step 1: Obtain the coordinates of valid bicycle stations
-            start_lat, start_lon, start_name = self.get_station_coord(start_name, self.station_df, is_start=True)
-            end_lat, end_lon, end_name = self.get_station_coord(end_name, self.station_df, is_start=False)
-            print(f"start_lat: {start_lat}, start_lon: {start_lon}, starting point: {start_name}")
-            print(f"end_lat: {end_lat}, end_lon: {end_lon}, destinaton: {end_name}")
-            print()
+            # step 1: Obtain the coordinates of valid bicycle stations; with candidates > 1 the nearest
+            # stations with a bike at the start and a free dock at the end are weighed against each other
+            if candidates > 1 and mode == 'diverse' and 'node' in self.station_df:
+                with span('station_lookup'):
+                    starts = self.candidate_stations(start_name, True, candidates, bike_type)
+                    ends = self.candidate_stations(end_name, False, candidates)
+                with span('station_choice'):
+                    start, end = self.choose_station_pair(starts, ends, distance_weight, safety_weight, comfort_weight,
+                                                          risk_window_days, risk_half_life_days)
+                start_lat, start_lon, start_name = start['lat'], start['lon'], start['name']
+                end_lat, end_lon, end_name = end['lat'], end['lon'], end['name']
+            else:
+                with span('station_lookup'):
+                    start_lat, start_lon, start_name = self.get_station_coord(start_name, self.station_df, is_start=True)
+                    end_lat, end_lon, end_name = self.get_station_coord(end_name, self.station_df, is_start=False)
+            logger.debug("start_lat: %s, start_lon: %s, starting point: %s", start_lat, start_lon, start_name)
+            logger.debug("end_lat: %s, end_lon: %s, destinaton: %s", end_lat, end_lon, end_name)
+
+            # Precomputed station pairs only need re-ranking for the user's weights (their metrics use the
+            # static accident score)
+            if mode == 'diverse' and not shortest_only and self.riskKey(risk_window_days, risk_half_life_days) is None:
+                with span('station_routes'):
+                    stored_routes = self.lookupStationRoutes(start_name, end_name, safety_weight, comfort_weight, distance_weight)
+                if stored_routes:
+                    for detail in stored_routes:
+                        detail.start_station, detail.end_station = start_name, end_name
+                    logger.info("Route planning run times: %.3f sec (precomputed station routes)",
+                                time.perf_counter() - start_time)
+                    return stored_routes
 
             # step 2: Find the nearest road network node
-            start_node, start_dist = self.get_nearest_road_node(start_lat, start_lon)
-            end_node, end_dist = self.get_nearest_road_node(end_lat, end_lon)
-            print()
+            with span('snapping'):
+                start_node, start_dist = self.get_station_node(start_name, start_lat, start_lon)
+                end_node, end_dist = self.get_station_node(end_name, end_lat, end_lon)
 
             # step 3: Calculate the route based on the cycling indicators
-            consider_multi_obj = safety_weight > 0 or comfort_weight > 0 or distance_weight > 0
-            if consider_multi_obj:
-                print(f"The following is the route after considering safety")
-                print(f"Distance weight：{distance_weight}， Safety weight：{safety_weight}, Comfort weight：{comfort_weight}")
+            if not shortest_only:
+                logger.debug("Distance weight: %s, Safety weight: %s, Comfort weight: %s",
+                             distance_weight, safety_weight, comfort_weight)
                 k_optimal_route = self.findKBestRoutes(
-                    start_node, end_node, k=5, 
+                    start_node, end_node, k=k, 
                     safety_weight=safety_weight,
                     comfort_weight=comfort_weight,
-                    distance_weight=distance_weight
+                    distance_weight=distance_weight,
+                    mode=mode,
+                    risk_window_days=risk_window_days,
+                    risk_half_life_days=risk_half_life_days
                 )
 
-                end_time = time.time()
-                time_count = end_time - start_time 
-
                 if not k_optimal_route:
                     raise ValueError("No availble path could be found\n")
-
-                # Print all options
-                print("\nFind multiple optional paths:")
-                for i, option in enumerate(k_optimal_route):
-                    print(f"{i+1}. Overall score: {option['combined_score']:.4f}, "
-                        f"Length: {option['total_length']:.2f}m, "
-                        f"Safety: {option['safety_factor']:.4f}, "
-                        f"Comfort: {option['comfort_factor']:.4f}",
-                        f"Intersection: {option['street_count']:.2f}, "
-                        f"Lanes coverage: {option['cycleway_coverage']*100:.2f}%, "
-                        f"Accidents: {option['accidents_count']}")
-                print(f"Route planning run times：{time_count:.2f} sec")
+                # findKBestRoutes hands out copies, labelling them leaves the cached routes alone
+                for detail in k_optimal_route:
+                    detail.start_station, detail.end_station = start_name, end_name
+
+                # List all options (formatting them is not free, so only when debug logging is on)
+                if logger.isEnabledFor(logging.DEBUG):
+                    for i, option in enumerate(k_optimal_route):
+                        logger.debug("%d. Overall score: %.4f, Length: %.2fm, Safety: %.4f, Comfort: %.4f, "
+                                     "Intersection: %.2f, Lanes coverage: %.2f%%, Accidents: %s",
+                                     i + 1, option.combined_score, option.total_length, option.safety_factor,
+                                     option.comfort_factor, option.street_count,
+                                     option.cycleway_coverage * 100, option.accidents_count)
+                logger.info("Route planning run times: %.3f sec", time.perf_counter() - start_time)
 
                 return k_optimal_route
 
             else:
-                print(f"Only consider distance metric")
-                route = ox.routing.shortest_path(self.G, 
-                                                 start_node, 
-                                                 end_node, 
-                                                 weight='length',
-                                                 cpus=1)  # Using the Dijkstra algorithm, return the list of nodes that make up the shortest path
-
-                if not route:
-                    raise ValueError("NO available paths have found")
-
-                # Obtain all the edges on the path
-                edge_lengths = [self.G[u][v][k]['length'] for u, v, k in zip(route[:-1], route[1:], [0] * len(route))]
-                total_length = sum(edge_lengths)
-
-                print(f"A list of nodes that make up the shortest path: {route}")
-                print(f"All edges on the path: {edge_lengths}")
-                print(f"Shortest path: {total_length}m")
-                print()
-
-                return {
-                    'start_station': start_name,
-                    'end_station': end_name,
-                    'path_nodes': route,
-                    'total_distance': total_length,
-                    'walking_distance': start_dist + end_dist
-                }
+                with span('search'):
+                    if self.ch is not None:
+                        # Contraction hierarchy query, shortcuts are unpacked back into road nodes
+                        total_length, path = self.ch.shortest_path(self.snapshot.node_index(start_node),
+                                                                   self.snapshot.node_index(end_node))
+                        if path is None:
+                            raise ValueError("NO available paths have found")
+                        nodes = np.asarray(path, dtype=np.int32)
+                        edge_lengths = None
+                    elif self.tiled_engine is not None:
+                        source = self.snapshot.node_index(start_node)
+                        total_length, path = self.tiled_engine.shortest_path(source, self.snapshot.node_index(end_node),
+                                                                             1.0, 0.0, 0.0)
+                        if path is None:
+                            raise ValueError("NO available paths have found")
+                        nodes = np.asarray(self.tiled_engine.path_nodes(source, path), dtype=np.int32)
+                        edge_lengths = None
+                    else:
+                        route = ox.routing.shortest_path(self.G, 
+                                                         start_node, 
+                                                         end_node, 
+                                                         weight='length',
+                                                         cpus=1)  # Using the Dijkstra algorithm, return the list of nodes that make up the shortest path
+
+                        if not route:
+                            raise ValueError("NO available paths have found")
+
+                        # Obtain all the edges on the path
+                        edge_lengths = [self.G[u][v][k]['length'] for u, v, k in zip(route[:-1], route[1:], [0] * len(route))]
+                        total_length = sum(edge_lengths)
+                        nodes = self.snapshot.node_indices(route).astype(np.int32) if self.snapshot is not None else None
+
+                # node indices and edges with the snapshot, node ids on GraphML only
+                if nodes is not None:
+                    route = RouteResult(nodes, self.scorer.edge_indices(nodes[:-1], nodes[1:]).astype(np.int32))
+                else:
+                    route = RouteResult(np.asarray(route, dtype=np.int64))
+
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("A list of nodes that make up the shortest path: %s", route.node_ids(self.snapshot))
+                    if edge_lengths is not None:
+                        logger.debug("All edges on the path: %s", edge_lengths)
+                logger.info("Shortest path: %.1fm, run times: %.3f sec", total_length, time.perf_counter() - start_time)
+
+                # the same list of RouteResults as the multi-criteria case, with length and walk only
+                route.total_length = float(total_length)
+                route.walking_distance = float(start_dist + end_dist)
+                route.start_station, route.end_station = start_name, end_name
+                return [route]
 
         except Exception as e:
-            print(f"Path planning failure: {str(e)}")
+            logger.warning("Path planning failure: %s", e)
             return {"error": str(e)}
 
 
@@ -0,0 +1,82 @@
+import numpy as np
+from route_geometry import edge_polyline
+
+
+# Optional metrics of a route -> their key in the /route response metrics
+RESPONSE_METRICS = {
+    'safety_factor': 'safety_score',
+    'comfort_factor': 'comfort_score',
+    'combined_score': 'combined_score',
+    'walking_distance': 'walking_distance',
+    'start_station': 'start_station',
+    'end_station': 'end_station',
+}
+
+
+class RouteResult:
+    """
+    One planned route: int32 snapshot node and edge indices plus its metrics as plain Python numbers
+    (None when not computed, e.g. the safety of a plain shortest path). Node ids, geometry and the
+    response metrics are derived on first use. Without a snapshot (GraphML only) nodes holds the
+    node ids and edges is None.
+    """
+    __slots__ = ('nodes', 'edges', 'total_length', 'safety_factor', 'comfort_factor', 'street_count',
+                 'cycleway_coverage', 'accidents_count', 'combined_score', 'walking_distance',
+                 'start_station', 'end_station', '_coordinates')
+
+    def __init__(self, nodes, edges=None, total_length=0.0, safety_factor=None, comfort_factor=None,
+                 street_count=None, cycleway_coverage=None, accidents_count=None, combined_score=None,
+                 walking_distance=None, start_station=None, end_station=None):
+        self.nodes = nodes
+        self.edges = edges
+        self.total_length = total_length
+        self.safety_factor = safety_factor
+        self.comfort_factor = comfort_factor
+        self.street_count = street_count
+        self.cycleway_coverage = cycleway_coverage
+        self.accidents_count = accidents_count
+        self.combined_score = combined_score
+        self.walking_distance = walking_distance
+        self.start_station = start_station
+        self.end_station = end_station
+        self._coordinates = None
+
+    def __repr__(self):
+        return f"RouteResult({len(self.nodes)} nodes, {self.total_length:.1f} m, combined score {self.combined_score})"
+
+    def replace(self, **fields):
+        """
+        Shallow copy with some fields changed; arrays and geometry are shared, so ranking or labelling
+        a cached route costs one small object
+        """
+        other = object.__new__(RouteResult)
+        for name in self.__slots__:
+            setattr(other, name, fields[name] if name in fields else getattr(self, name))
+        return other
+
+    def node_ids(self, snapshot=None):
+        """
+        Node ids along the route as a list
+        """
+        if snapshot is None:
+            return np.asarray(self.nodes).tolist()
+        return snapshot.node_ids[self.nodes].tolist()
+
+    def coordinates(self, snapshot):
+        """
+        (lat, lon) points of the route as an (n, 2) array, sliced from the snapshot geometry once
+        """
+        if self._coordinates is None:
+            self._coordinates = edge_polyline(snapshot, self.edges)
+        return self._coordinates
+
+    def metrics(self):
+        """
+        The route's entry in the metrics list of a /route response
+        """
+        metrics = {"route_length": self.total_length}
+        for name, key in RESPONSE_METRICS.items():
+            value = getattr(self, name)
+            if value is not None:
+                metrics[key] = value
+        return metrics
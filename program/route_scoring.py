@@ -0,0 +1,189 @@
+import numpy as np
+
+
+def combined_scores(lengths, safeties, comforts, distance_weight, safety_weight, comfort_weight, groups=None):
+    """
+    Weighted combined score of candidate routes, with length, safety and comfort min-max normalized
+    among the routes of the same group (all routes when groups is None); shorter, safer and more
+    comfortable routes score higher. Weights are scalars or per-route arrays.
+    """
+    lengths = np.asarray(lengths, dtype=np.float64)
+    groups = np.zeros(len(lengths), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    n_groups = int(groups.max()) + 1 if len(groups) else 0
+
+    def normalized(values):
+        values = np.asarray(values, dtype=np.float64)
+        low, high = np.full(n_groups, np.inf), np.full(n_groups, -np.inf)
+        np.minimum.at(low, groups, values)
+        np.maximum.at(high, groups, values)
+        span = high - low
+        span[span == 0] = 1
+        return (values - low[groups]) / span[groups]
+
+    return (distance_weight * (1.0 - normalized(lengths))
+            + safety_weight * normalized(safeties)
+            + comfort_weight * normalized(comforts))
+
+
+class RouteScorer:
+    """
+    Batched route scoring with NumPy gathers over the snapshot attribute arrays.
+    Produces the same metrics as RouteNetwork.evaluateRouteScores plus total length and accidents,
+    for many routes at once. Attributes are gathered from the memory-mapped arrays, so only the pages
+    of the scored edges and nodes are read.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        n = snapshot.n_nodes
+        self._n = n
+
+        # (tail, head) -> cheapest parallel edge, resolved with a binary search on sorted pair keys
+        pair_keys = np.asarray(snapshot.edge_src, dtype=np.int64) * n + np.asarray(snapshot.indices, dtype=np.int64)
+        order = np.lexsort((np.asarray(snapshot.length), pair_keys))
+        sorted_keys = pair_keys[order]
+        first = np.ones(len(sorted_keys), dtype=bool)
+        first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        self._pair_keys = sorted_keys[first]
+        self._pair_edges = order[first]
+
+    def _values(self, name, index):
+        """
+        float64 values of a snapshot array at index
+        """
+        return np.asarray(getattr(self.snapshot, name)[index], dtype=np.float64)
+
+    def edge_indices(self, tails, heads):
+        """
+        Cheapest edge index for each (tail, head) node index pair, -1 where there is no edge
+        """
+        keys = np.asarray(tails, dtype=np.int64) * self._n + np.asarray(heads, dtype=np.int64)
+        pos = np.searchsorted(self._pair_keys, keys)
+        pos = np.minimum(pos, len(self._pair_keys) - 1)
+        found = self._pair_keys[pos] == keys
+        return np.where(found, self._pair_edges[pos], -1)
+
+    def score_node_routes(self, routes, edge_safety=None):
+        """
+        Score routes given as sequences of node indices. Return a dict of per-route metric arrays
+        and the resolved edge indices of every route. edge_safety replaces the snapshot's edge safety scores.
+        """
+        n_routes = len(routes)
+        lengths = np.array([len(route) for route in routes], dtype=np.int64)
+        nodes = np.concatenate([np.asarray(route, dtype=np.int64) for route in routes]) if n_routes else np.zeros(0, np.int64)
+        node_route = np.repeat(np.arange(n_routes), lengths)
+
+        # consecutive pairs inside the same route
+        same_route = node_route[1:] == node_route[:-1]
+        tails, heads = nodes[:-1][same_route], nodes[1:][same_route]
+        pair_route = node_route[1:][same_route]
+        edges = self.edge_indices(tails, heads)
+
+        metrics = self._score(nodes, node_route, edges, pair_route, n_routes, edge_safety)
+        split_at = np.cumsum(np.maximum(lengths - 1, 0))[:-1]
+        return metrics, np.split(edges, split_at)
+
+    def score_edge_routes(self, sources, edge_paths, edge_safety=None):
+        """
+        Score routes given as a source node index and a sequence of edge indices each
+        """
+        n_routes = len(edge_paths)
+        heads = np.asarray(self.snapshot.indices)
+        routes = [np.concatenate([[source], heads[np.asarray(path, dtype=np.int64)]])
+                  for source, path in zip(sources, edge_paths)]
+        nodes = np.concatenate(routes).astype(np.int64) if n_routes else np.zeros(0, np.int64)
+        node_route = np.repeat(np.arange(n_routes), [len(route) for route in routes])
+        edges = np.concatenate([np.asarray(path, dtype=np.int64) for path in edge_paths]) if n_routes else np.zeros(0, np.int64)
+        edge_route = np.repeat(np.arange(n_routes), [len(path) for path in edge_paths])
+        return self._score(nodes, node_route, edges, edge_route, n_routes, edge_safety)
+
+    def score_tree(self, source, pred, reverse=False, edge_safety=None):
+        """
+        Score the tree path of every node of a RouteEngine.shortest_path_tree at once (from source, or
+        to source for a reverse tree). Return a dict of per-node metric arrays, NaN for unreached nodes.
+        """
+        pred = np.asarray(pred, dtype=np.int64)
+        reached = pred >= 0
+        reached[source] = True
+        edges = pred[pred >= 0]
+        parent = np.full(self._n, -1, dtype=np.int64)
+        parent[pred >= 0] = (np.asarray(self.snapshot.indices) if reverse else np.asarray(self.snapshot.edge_src))[edges]
+
+        def finite(values):
+            ok = np.isfinite(values)
+            return np.where(ok, values, 0.0), ok
+
+        # per-node contribution of the node itself and of its tree edge, as sums and counts of finite scores
+        own = np.zeros((self._n, 13))
+        on_edge = pred >= 0
+        own[on_edge, 0] = self._values('length', edges)
+        own[on_edge, 1] = 1
+        own[on_edge, 2], own[on_edge, 3] = finite(self._values('safety_score', edges) if edge_safety is None
+                                                  else np.asarray(edge_safety, dtype=np.float64)[edges])
+        own[on_edge, 4], own[on_edge, 5] = finite(self._values('comfort_score', edges))
+        own[on_edge, 6] = self._values('cycleway', edges)
+        own[on_edge, 7] = self._values('casualty_count', edges)
+        own[reached, 8], own[reached, 9] = finite(self._values('node_safety_score', reached))
+        own[reached, 10], own[reached, 11] = finite(self._values('node_comfort_score', reached))
+        own[reached, 12] = self._values('street_count', reached)
+
+        # sums along every tree path by pointer jumping: each pass doubles the covered path segment
+        total, ancestor = own, parent
+        while True:
+            jumping = np.flatnonzero(ancestor >= 0)
+            if not len(jumping):
+                break
+            total[jumping] += total[ancestor[jumping]]
+            ancestor[jumping] = ancestor[ancestor[jumping]]
+
+        def mean(column):
+            return np.divide(total[:, column], total[:, column + 1], out=np.zeros(self._n), where=total[:, column + 1] > 0)
+
+        # Security score weight: 40% for nodes, 60% for edges; comfort score weight: 30% / 70%
+        metrics = {
+            'safety_factor': 0.4 * mean(8) + 0.6 * mean(2),
+            'comfort_factor': 0.3 * mean(10) + 0.7 * mean(4),
+            'street_count': total[:, 12],
+            'cycleway_coverage': np.divide(total[:, 6], total[:, 1], out=np.zeros(self._n), where=total[:, 1] > 0),
+            'total_length': total[:, 0],
+            'accidents_count': total[:, 7],
+        }
+        for values in metrics.values():
+            values[~reached] = np.nan
+        return metrics
+
+    def _score(self, nodes, node_route, edges, edge_route, n_routes, edge_safety=None):
+        def per_route(route_ids, values):
+            return np.bincount(route_ids, weights=values, minlength=n_routes)
+
+        def mean_per_route(route_ids, values):
+            valid = np.isfinite(values)
+            total = per_route(route_ids[valid], values[valid])
+            count = np.bincount(route_ids[valid], minlength=n_routes)
+            return np.divide(total, count, out=np.zeros(n_routes), where=count > 0)
+
+        # Pairs without an edge count towards the route length in edges but carry no attributes
+        total_edges = np.bincount(edge_route, minlength=n_routes)
+        has_edge = edges >= 0
+        edges, edge_route = edges[has_edge], edge_route[has_edge]
+
+        edge_safety = (self._values('safety_score', edges) if edge_safety is None
+                       else np.asarray(edge_safety, dtype=np.float64)[edges])
+
+        # Security score weight: 40% for nodes, 60% for edges; comfort score weight: 30% / 70%
+        safety = (0.4 * mean_per_route(node_route, self._values('node_safety_score', nodes))
+                  + 0.6 * mean_per_route(edge_route, edge_safety))
+        comfort = (0.3 * mean_per_route(node_route, self._values('node_comfort_score', nodes))
+                   + 0.7 * mean_per_route(edge_route, self._values('comfort_score', edges)))
+
+        cycleway = per_route(edge_route, self._values('cycleway', edges))
+        coverage = np.divide(cycleway, total_edges, out=np.zeros(n_routes), where=total_edges > 0)
+
+        return {
+            'safety_factor': safety,
+            'comfort_factor': comfort,
+            'street_count': per_route(node_route, self._values('street_count', nodes)).astype(np.int64),
+            'cycleway_coverage': coverage,
+            'total_length': per_route(edge_route, self._values('length', edges)),
+            'accidents_count': per_route(edge_route, self._values('casualty_count', edges)).astype(np.int64),
+        }
@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+
+# Route computations running at once in one worker process. Routing is CPU-bound Python, so more
+# threads only add GIL contention; gunicorn worker processes give the parallelism.
+ROUTE_WORKERS = 2
+# Route requests allowed to wait for a free route thread; requests beyond that are turned away.
+# ROUTE_WORKERS + ROUTE_QUEUE must stay below the request threads of a worker (gunicorn.conf.py),
+# otherwise waiting route requests can hold every thread and /search queues behind them.
+ROUTE_QUEUE = 4
+# Seconds a request waits for its route before the server answers with a timeout
+ROUTE_TIMEOUT = 30
+# Retry-After (seconds) suggested to clients turned away by admission control
+RETRY_AFTER = 1
+
+
+class ServerBusy(Exception):
+    """
+    Raised when every route thread is busy and the route queue is full
+    """
+
+
+class RouteTimeout(Exception):
+    """
+    Raised when a route computation does not finish within the request timeout
+    """
+
+
+class RouteExecutor:
+    """
+    Bounded executor for the CPU-heavy route requests, so they never occupy every request thread and
+    cheap requests (/search, /status) stay responsive. At most max_workers computations run and
+    max_queue wait; further requests are rejected at once (ServerBusy). A request that is not answered
+    within timeout seconds gets RouteTimeout; a computation that already started still runs to the
+    end and keeps its slot until then, so a backlog of slow routes sheds load instead of growing.
+    """
+
+    def __init__(self, max_workers=ROUTE_WORKERS, max_queue=ROUTE_QUEUE, timeout=ROUTE_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # threads are only created on the first submit, so a preloaded app forks without any
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='route')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        """
+        Take an admission slot, raise ServerBusy if there is none
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServerBusy("The server is busy, please retry shortly")
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a route thread and return its result
+        """
+        self.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self.release()
+            raise
+        future.add_done_callback(lambda _: self.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise RouteTimeout(f"Route planning took longer than {self.timeout} sec")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'timeout_sec': self.timeout,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+            }
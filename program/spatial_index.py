@@ -0,0 +1,103 @@
+import os
+import pickle
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+
+
+EARTH_RADIUS_M = 6371009
+
+NODE_INDEX_FILE = 'node_kdtree.pkl'
+
+
+def project(lats, lons, lat0):
+    """
+    Local equirectangular projection of lat/lon arrays around latitude lat0, return (x, y) in metres
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = np.radians(lons) * np.cos(np.radians(lat0)) * EARTH_RADIUS_M
+    y = np.radians(lats) * EARTH_RADIUS_M
+    return x, y
+
+
+class SpatialIndex:
+    """
+    Nearest-node and nearest-edge lookups for a GraphSnapshot.
+
+    Coordinates are projected with a local equirectangular projection (metres, accurate to well under
+    a metre over a city). The node KD-tree is pickled next to the snapshot arrays when the snapshot is
+    compiled; the edge STR-tree is built from the snapshot's flat geometry arrays the first time an edge
+    query is made (shapely rebuilds it faster than it unpickles it).
+    """
+
+    def __init__(self, snapshot, node_tree, lat0):
+        self.snapshot = snapshot
+        self.node_tree = node_tree
+        self.lat0 = lat0
+        self._edge_tree = None
+
+    @classmethod
+    def build(cls, snapshot):
+        """
+        Build the node KD-tree and save it in the snapshot directory
+        """
+        lat0 = float(np.mean(snapshot.y)) if snapshot.n_nodes else 0.0
+        index = cls(snapshot, None, lat0)
+        index.node_tree = cKDTree(np.column_stack(index.project(snapshot.y, snapshot.x)))
+        with open(os.path.join(snapshot.path, NODE_INDEX_FILE), 'wb') as f:
+            pickle.dump({'version': snapshot.version, 'lat0': lat0, 'tree': index.node_tree}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        return index
+
+    @classmethod
+    def load(cls, snapshot):
+        """
+        Load the KD-tree saved with the snapshot, rebuilding it if it is missing or stale
+        """
+        path = os.path.join(snapshot.path, NODE_INDEX_FILE)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                saved = pickle.load(f)
+            if saved['version'] == snapshot.version:
+                return cls(snapshot, saved['tree'], saved['lat0'])
+        return cls.build(snapshot)
+
+    def project(self, lats, lons):
+        """
+        Return projected (x, y) arrays in metres
+        """
+        return project(lats, lons, self.lat0)
+
+    def nearest_nodes(self, lats, lons):
+        """
+        Return (node indices, distances in metres) of the nearest road node to each coordinate
+        """
+        x, y = self.project(np.atleast_1d(lats), np.atleast_1d(lons))
+        dists, nodes = self.node_tree.query(np.column_stack((x, y)))
+        return nodes.astype(np.int32), dists
+
+    @property
+    def edge_tree(self):
+        if self._edge_tree is None:
+            snapshot = self.snapshot
+            coords = np.asarray(snapshot.geom_coords, dtype=np.float64)
+            offsets = np.asarray(snapshot.geom_offsets)
+            x, y = self.project(coords[:, 1], coords[:, 0])
+            edge_of_coord = np.repeat(np.arange(snapshot.n_edges), np.diff(offsets))
+            self._edge_geoms = shapely.linestrings(np.column_stack((x, y)), indices=edge_of_coord)
+            self._edge_tree = shapely.STRtree(self._edge_geoms)
+        return self._edge_tree
+
+    def nearest_edges(self, lats, lons):
+        """
+        Return (edge indices, distances in metres) of the nearest edge geometry to each coordinate
+        """
+        x, y = self.project(np.atleast_1d(lats), np.atleast_1d(lons))
+        points = shapely.points(x, y)
+        (point_idx, edge_idx), dists = self.edge_tree.query_nearest(points, return_distance=True, all_matches=False)
+        edges = np.full(len(points), -1, dtype=np.int64)
+        distances = np.full(len(points), np.inf)
+        edges[point_idx] = edge_idx
+        distances[point_idx] = dists
+        return edges, distances
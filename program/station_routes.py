@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import logging
+import hashlib
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool
+
+from graph_snapshot import GraphSnapshot, SNAPSHOT_PATH
+from route_engine import RouteEngine
+from route_scoring import RouteScorer
+from spatial_index import SpatialIndex
+
+
+logger = logging.getLogger(__name__)
+
+STATION_ROUTES_PATH = '../data/station_routes'
+
+# Weights used to generate the stored alternatives; user preferences are applied later by re-ranking
+PRECOMPUTE_WEIGHTS = (1 / 3, 1 / 3, 1 / 3)  # distance, safety, comfort
+
+METRIC_COLUMNS = ['total_length', 'safety_factor', 'comfort_factor', 'accidents_count',
+                  'cycleway_coverage', 'street_count']
+
+
+# Per-process state of the precompute pool, the snapshot is memory-mapped so workers share its pages
+_worker = {}
+
+
+def _init_worker(snapshot_path):
+    snapshot = GraphSnapshot.load(snapshot_path)
+    _worker['snapshot'] = snapshot
+    _worker['engine'] = RouteEngine(snapshot)
+    _worker['scorer'] = RouteScorer(snapshot)
+
+
+def _compute_pairs(origin, destinations, k):
+    """
+    Compute the k alternatives for one origin station and a list of destination stations.
+    origin/destinations are (station id, node index) tuples.
+    """
+    engine, scorer = _worker['engine'], _worker['scorer']
+    origin_id, source = origin
+    rows, paths = [], []
+    for dest_id, target in destinations:
+        if dest_id == origin_id:
+            continue
+        for rank, path in enumerate(engine.k_diverse_paths(source, target, k, *PRECOMPUTE_WEIGHTS)):
+            rows.append({'origin_id': origin_id, 'dest_id': dest_id, 'rank': rank,
+                         'edges': np.asarray(path, dtype=np.int32)})
+            paths.append(path)
+
+    # Score every route of this origin in one batch
+    metrics = scorer.score_edge_routes([source] * len(paths), paths)
+    for column in METRIC_COLUMNS:
+        for row, value in zip(rows, metrics[column].tolist()):
+            row[column] = value
+    return rows
+
+
+def _write_shard(path, df):
+    # Write to a temporary file first so an interrupted job never leaves a truncated shard behind
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _refresh_origin(args):
+    origin, destinations, k = args
+    return origin[0], [dest_id for dest_id, _ in destinations], _compute_pairs(origin, destinations, k)
+
+
+def _precompute_origin(args):
+    origin, destinations, k, shard_path = args
+    start_time = time.time()
+    df = pd.DataFrame(_compute_pairs(origin, destinations, k))
+    _write_shard(shard_path, df)
+    return origin[0], len(df), time.time() - start_time
+
+
+def changed_edges(old_snapshot, new_snapshot):
+    """
+    Edge indices whose scores differ between two snapshots with the same topology,
+    or None if the topology changed and everything must be recomputed
+    """
+    if (old_snapshot.n_edges != new_snapshot.n_edges
+            or not np.array_equal(old_snapshot.indptr, new_snapshot.indptr)
+            or not np.array_equal(old_snapshot.indices, new_snapshot.indices)):
+        return None
+    changed = np.zeros(new_snapshot.n_edges, dtype=bool)
+    for name in ('length', 'safety_score', 'comfort_score', 'casualty_count', 'cycleway'):
+        old, new = np.asarray(getattr(old_snapshot, name)), np.asarray(getattr(new_snapshot, name))
+        changed |= ~((old == new) | (np.isnan(old) & np.isnan(new))) if old.dtype.kind == 'f' else old != new
+    for name in ('node_safety_score', 'node_comfort_score', 'street_count'):
+        old, new = np.asarray(getattr(old_snapshot, name)), np.asarray(getattr(new_snapshot, name))
+        differs = ~((old == new) | (np.isnan(old) & np.isnan(new))) if old.dtype.kind == 'f' else old != new
+        # a node score change affects every route passing through the node, i.e. its incoming edges
+        changed |= differs[np.asarray(new_snapshot.indices)]
+    return np.flatnonzero(changed)
+
+
+class StationRouteStore:
+    """
+    On-disk station-to-station route multigraph: one Parquet shard per origin station holding the
+    k alternative routes to every other station (edge indices and bikeability metrics per arc),
+    plus a manifest recording the snapshot version and station-to-node snaps. Pairs still to be
+    recomputed after a snapshot change are listed under 'pending' until their shard is rewritten.
+    """
+
+    def __init__(self, path=STATION_ROUTES_PATH):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    @classmethod
+    def open(cls, snapshot, path=STATION_ROUTES_PATH):
+        """
+        Open an existing store for lookups, or return None if it is missing or built for another snapshot
+        """
+        store = cls(path)
+        if not store.manifest:
+            return None
+        if store.manifest.get('snapshot_version') != snapshot.version:
+            logger.warning("Station route store %s was built for another snapshot, ignoring it", path)
+            return None
+        return store
+
+    def _shard_path(self, origin_id):
+        return os.path.join(self.path, f'origin_{origin_id}.parquet')
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _stations_hash(stations):
+        digest = hashlib.sha1()
+        for station_id, node in stations:
+            digest.update(f'{station_id}:{node};'.encode())
+        return digest.hexdigest()
+
+    def precompute(self, station_df, snapshot_path=SNAPSHOT_PATH, k=5, processes=None, old_snapshot_path=None):
+        """
+        Build or bring the store up to date. Origins that already have a shard for the same snapshot,
+        station set and k are skipped, so an interrupted run resumes where it stopped. When the
+        snapshot changed but kept its topology, only the pairs whose routes are affected by the
+        changed edges are recomputed; they are recorded as pending first, so an interrupted refresh
+        resumes them and lookups never serve their stale routes.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        snapshot = GraphSnapshot.load(snapshot_path)
+
+        nodes, dists = SpatialIndex.load(snapshot).nearest_nodes(station_df['lat'].values, station_df['lon'].values)
+        stations = list(zip(station_df['id'].astype(int).tolist(), nodes.tolist()))
+        stations_hash = self._stations_hash(stations)
+
+        previous = self.manifest
+        same_setup = previous.get('stations_hash') == stations_hash and previous.get('k') == k
+        completed = set(previous.get('completed', [])) if same_setup else set()
+
+        # pairs of an interrupted refresh for this snapshot are resumed
+        pending = previous.get('pending', {}) if same_setup and previous.get('snapshot_version') == snapshot.version else {}
+        if same_setup and previous.get('snapshot_version') not in (None, snapshot.version):
+            edges = None
+            if old_snapshot_path is not None:
+                old_snapshot = GraphSnapshot.load(old_snapshot_path)
+                if old_snapshot.version == previous['snapshot_version']:
+                    edges = changed_edges(old_snapshot, snapshot)
+            if edges is None:
+                completed = set()
+            else:
+                affected = self.affected_pairs(snapshot, edges)
+                pending = {str(origin_id): sorted(int(dest_id) for dest_id in dest_ids)
+                           for origin_id, dest_ids in affected.items()}
+                logger.info("%d edges changed, %d pairs to recompute", len(edges),
+                            sum(len(dest_ids) for dest_ids in pending.values()))
+
+        self.manifest = {
+            'snapshot_version': snapshot.version,
+            'stations_hash': stations_hash,
+            'k': k,
+            'stations': {str(station_id): {'node': node, 'distance': float(dist)}
+                         for (station_id, node), dist in zip(stations, dists)},
+            'completed': sorted(completed),
+            'pending': pending,
+        }
+        self._save_manifest()
+
+        tasks = []
+        for origin in stations:
+            if origin[0] in completed:
+                continue
+            tasks.append((origin, stations, k, self._shard_path(origin[0])))
+
+        start_time = time.time()
+        with Pool(processes, initializer=_init_worker, initargs=(snapshot_path,)) as pool:
+            if pending:
+                self._refresh_pairs(pool, stations, k)
+            for i, (origin_id, n_rows, elapsed) in enumerate(pool.imap_unordered(_precompute_origin, tasks)):
+                self.manifest['completed'].append(origin_id)
+                self._save_manifest()
+                logger.info("[%d/%d] origin %s: %d routes in %.1f sec", i + 1, len(tasks), origin_id, n_rows, elapsed)
+        logger.info("Station routes up to date in %.1f sec", time.time() - start_time)
+
+    def affected_pairs(self, snapshot, edges):
+        """
+        {origin id: set of destination ids} whose stored routes use a changed edge, or whose route
+        corridor (bounding box of its alternatives) contains one, since a cheaper edge there may
+        create a better alternative
+        """
+        edges = np.asarray(edges, dtype=np.int64)
+        edge_set = set(edges.tolist())
+        xs = np.asarray(snapshot.x)[np.asarray(snapshot.edge_src)[edges]]
+        ys = np.asarray(snapshot.y)[np.asarray(snapshot.edge_src)[edges]]
+        node_x, node_y, heads = np.asarray(snapshot.x), np.asarray(snapshot.y), np.asarray(snapshot.indices)
+
+        affected = {}
+        for origin_id in self.manifest.get('completed', []):
+            shard_path = self._shard_path(origin_id)
+            if not os.path.exists(shard_path):
+                continue
+            df = pd.read_parquet(shard_path, columns=['dest_id', 'edges'])
+            for dest_id, group in df.groupby('dest_id'):
+                route_edges = np.concatenate(group['edges'].tolist())
+                if edge_set.intersection(route_edges.tolist()):
+                    affected.setdefault(origin_id, set()).add(dest_id)
+                    continue
+                rx, ry = node_x[heads[route_edges]], node_y[heads[route_edges]]
+                inside = (xs >= rx.min()) & (xs <= rx.max()) & (ys >= ry.min()) & (ys <= ry.max())
+                if inside.any():
+                    affected.setdefault(origin_id, set()).add(dest_id)
+        return affected
+
+    def _refresh_pairs(self, pool, stations, k):
+        """
+        Recompute the pending pairs, rewriting each origin's shard and then dropping it from 'pending'
+        """
+        node_of = dict(stations)
+        pending = self.manifest['pending']
+        tasks = [((int(origin_id), node_of[int(origin_id)]), [(dest_id, node_of[dest_id]) for dest_id in dest_ids], k)
+                 for origin_id, dest_ids in pending.items()]
+        for origin_id, dest_ids, rows in pool.imap_unordered(_refresh_origin, tasks):
+            shard_path = self._shard_path(origin_id)
+            df = pd.read_parquet(shard_path)
+            df = pd.concat([df[~df['dest_id'].isin(dest_ids)], pd.DataFrame(rows)], ignore_index=True)
+            _write_shard(shard_path, df)
+            del pending[str(origin_id)]
+            self._save_manifest()
+
+    def station_node(self, station_id):
+        """
+        Return (node index, distance to the station) recorded for a station
+        """
+        entry = self.manifest['stations'].get(str(station_id))
+        if entry is None:
+            return None, float('inf')
+        return entry['node'], entry['distance']
+
+    def lookup(self, origin_id, dest_id):
+        """
+        Return the stored alternatives between two stations as a DataFrame (empty if not precomputed)
+        """
+        shard_path = self._shard_path(origin_id)
+        if origin_id not in self.manifest.get('completed', []) or not os.path.exists(shard_path):
+            return pd.DataFrame()
+        if dest_id in self.manifest.get('pending', {}).get(str(origin_id), ()):
+            return pd.DataFrame()  # stale until the interrupted refresh is resumed
+        df = pd.read_parquet(shard_path, filters=[('dest_id', '==', dest_id)])
+        return df.sort_values('rank')
+
+
+if __name__ == "__main__":
+    import argparse
+    from route_network import RouteNetwork
+
+    parser = argparse.ArgumentParser(description="Precompute k alternative routes between all TfL stations")
+    parser.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    parser.add_argument('--old-snapshot', default=None,
+                        help="snapshot the store was built from, enables incremental refresh of changed edges")
+    parser.add_argument('--out', default=STATION_ROUTES_PATH)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    station_df = RouteNetwork(snapshot_path=args.snapshot).station_df
+    StationRouteStore(args.out).precompute(station_df, snapshot_path=args.snapshot, k=args.k,
+                                           processes=args.processes, old_snapshot_path=args.old_snapshot)
@@ -0,0 +1,166 @@
+import re
+import bisect
+import threading
+import unicodedata
+import pandas as pd
+
+
+# Match quality tiers, lower is better
+EXACT, NAME_PREFIX_WORDS, NAME_PREFIX, ALL_WORDS, TOKEN_PREFIX, SUBSTRING = range(6)
+
+DEFAULT_SEARCH_LIMIT = 20
+# Larger limits are clamped, a search response never lists more stations than this
+MAX_SEARCH_LIMIT = 100
+
+
+def normalize(text):
+    """
+    Lower-case, strip accents and replace punctuation with spaces ("King's Cross" -> "king s cross")
+    """
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ', text).split())
+
+
+def bike_count(record):
+    """
+    Available bikes of a station record, 0 when the feed gave none (a missing or NaN count)
+    """
+    bikes = record.get('bikes')
+    return 0 if pd.isna(bikes) else int(bikes)
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class StationSearchIndex:
+    """
+    In-memory search index over station names: a sorted token list for prefix lookups and a trigram
+    index for substring matches. Results are ranked by match quality, then by available bikes.
+    update() applies the station feed diff, so only added, removed or renamed stations are re-indexed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}      # id -> station record (dict)
+        self._normalized = {}   # id -> normalized name
+        self._token_ids = {}    # token -> set of ids
+        self._tokens = []       # sorted list of tokens for prefix ranges
+        self._trigram_ids = {}  # trigram -> set of ids
+
+    def __len__(self):
+        return len(self._records)
+
+    def _add(self, station_id, name):
+        norm = normalize(name)
+        self._normalized[station_id] = norm
+        for token in set(norm.split()):
+            if token not in self._token_ids:
+                self._token_ids[token] = set()
+                bisect.insort(self._tokens, token)
+            self._token_ids[token].add(station_id)
+        for gram in _trigrams(norm):
+            self._trigram_ids.setdefault(gram, set()).add(station_id)
+
+    def _remove(self, station_id):
+        norm = self._normalized.pop(station_id, None)
+        if norm is None:
+            return
+        for token in set(norm.split()):
+            ids = self._token_ids[token]
+            ids.discard(station_id)
+            if not ids:
+                del self._token_ids[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+        for gram in _trigrams(norm):
+            ids = self._trigram_ids[gram]
+            ids.discard(station_id)
+            if not ids:
+                del self._trigram_ids[gram]
+
+    def update(self, station_df, diff=None):
+        """
+        Bring the index in line with a station table. With a feed diff only the changed stations are
+        touched; without one the index is rebuilt.
+        """
+        records = {int(record['id']): record for record in station_df.to_dict('records')}
+        with self._lock:
+            if diff is None:
+                for station_id in list(self._normalized):
+                    self._remove(station_id)
+                renamed = list(records)
+            else:
+                for station_id in diff['removed']:
+                    self._remove(station_id)
+                    self._records.pop(station_id, None)
+                renamed = [station_id for station_id in list(diff['added']) + list(diff['moved'])
+                           if self._normalized.get(station_id) != normalize(records[station_id]['name'])]
+                for station_id in renamed:
+                    self._remove(station_id)
+
+            for station_id in renamed:
+                self._add(station_id, records[station_id]['name'])
+            # availability and coordinates are cheap to copy for every station
+            self._records = records
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        start = bisect.bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            ids |= self._token_ids[token]
+        return ids
+
+    def _match_tier(self, station_id, query, query_tokens):
+        norm = self._normalized[station_id]
+        if norm == query:
+            return EXACT
+        if norm.startswith(query + ' '):
+            return NAME_PREFIX_WORDS
+        if norm.startswith(query):
+            return NAME_PREFIX
+        name_tokens = norm.split()
+        if all(q in name_tokens for q in query_tokens):
+            return ALL_WORDS
+        if all(any(token.startswith(q) for token in name_tokens) for q in query_tokens):
+            return TOKEN_PREFIX
+        if query in norm:
+            return SUBSTRING
+        return None
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Return up to limit station records matching the query, best first
+        """
+        query = normalize(query)
+        query_tokens = query.split()
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            # every query token must prefix some token of the name
+            candidates = None
+            for token in query_tokens:
+                ids = self._prefix_ids(token)
+                candidates = ids if candidates is None else candidates & ids
+
+            # substring matches (e.g. "ross" in "king s cross") through the trigram index
+            if len(query) >= 3:
+                grams = _trigrams(query)
+                substring = set.intersection(*(self._trigram_ids.get(gram, set()) for gram in grams))
+            else:
+                substring = {station_id for station_id, norm in self._normalized.items() if query in norm}
+            candidates |= substring
+
+            ranked = []
+            for station_id in candidates:
+                tier = self._match_tier(station_id, query, query_tokens)
+                if tier is not None:
+                    record = self._records[station_id]
+                    ranked.append((tier, -bike_count(record), record['name'], record))
+            ranked.sort(key=lambda item: item[:3])
+
+        results = [record for _, _, _, record in ranked]
+        return results if limit is None else results[:limit]
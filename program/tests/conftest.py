@@ -0,0 +1,70 @@
+"""
+Shared fixtures: a small synthetic street grid with TfL stations (benchmarks.fixtures) as a
+networkx graph, GraphML, compiled snapshot and station feed XML. The modules use flat imports,
+so the program directory goes on sys.path.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import build_fixtures, synthetic_network  # noqa: E402
+from graph_snapshot import GraphSnapshot  # noqa: E402
+
+
+# Grid side of the test network: 400 nodes, small enough for pure Python references
+GRID_SIZE = 20
+N_STATIONS = 30
+SEED = 0
+
+
+@pytest.fixture(scope='session')
+def fixture_paths(tmp_path_factory):
+    return build_fixtures(str(tmp_path_factory.mktemp('fixtures')), GRID_SIZE, N_STATIONS, SEED)
+
+
+@pytest.fixture(scope='session')
+def network():
+    # the graph build_fixtures wrote, regenerated from the same seed
+    return synthetic_network(size=GRID_SIZE, seed=SEED)
+
+
+@pytest.fixture(scope='session')
+def snapshot_path(fixture_paths):
+    return fixture_paths['snapshot']
+
+
+@pytest.fixture(scope='session')
+def snapshot(snapshot_path):
+    return GraphSnapshot.load(snapshot_path)
+
+
+@pytest.fixture
+def make_route_network(fixture_paths, tmp_path):
+    """
+    Factory of RouteNetworks over the fixtures, without polling; optional data files (contraction
+    hierarchy, station routes, tiles) are only used when passed
+    """
+    from route_network import RouteNetwork
+
+    networks = []
+
+    def make(**kwargs):
+        options = {
+            'graphml_path': fixture_paths['graphml'],
+            'snapshot_path': fixture_paths['snapshot'],
+            'station_feed_url': fixture_paths['stations'],
+            'station_refresh_interval': 0,
+            'ch_path': str(tmp_path / 'missing_ch.npz'),
+            'station_routes_path': str(tmp_path / 'missing_station_routes'),
+            'tiles_path': str(tmp_path / 'missing_tiles'),
+        }
+        options.update(kwargs)
+        networks.append(RouteNetwork(**options))
+        return networks[-1]
+
+    yield make
+    for route_network in networks:
+        route_network.close()
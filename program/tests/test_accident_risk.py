@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from accident_risk import AccidentRisk
+from route_engine import RouteEngine
+
+
+N_ACCIDENTS = 500
+AS_OF = '2024-06-30'
+
+
+@pytest.fixture(scope='module')
+def accident_risk(snapshot):
+    """
+    Random accidents over the fixture snapshot's edges in 2020-2024, a tenth of them undated
+    """
+    rng = np.random.default_rng(0)
+    edges = rng.integers(0, snapshot.n_edges, N_ACCIDENTS)
+    first, last = (int(np.datetime64(day, 'D').astype(np.int64)) for day in ('2020-01-01', AS_OF))
+    days = rng.integers(first, last, N_ACCIDENTS).astype(np.int32)
+    days[rng.random(N_ACCIDENTS) < 0.1] = np.iinfo(np.int32).min
+    order = np.lexsort((days, edges))
+    indptr = np.zeros(snapshot.n_edges + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edges, minlength=snapshot.n_edges), out=indptr[1:])
+    severity = rng.integers(1, 4, N_ACCIDENTS).astype(np.uint8)
+    casualties = rng.integers(1, 3, N_ACCIDENTS).astype(np.int32)
+    return AccidentRisk(snapshot, indptr, days[order], severity[order], casualties[order])
+
+
+def test_edge_safety_is_cached(snapshot, accident_risk):
+    safety = accident_risk.edge_safety(365, 90, as_of=AS_OF)
+    assert accident_risk.edge_safety(365, 90, as_of=AS_OF) is safety
+    assert not safety.flags.writeable
+    expected = (np.asarray(snapshot.safety_score, dtype=np.float64) + accident_risk.static_risk
+                - accident_risk.edge_risk(365, 90, as_of=AS_OF))
+    np.testing.assert_allclose(safety, expected)
+
+    other = accident_risk.edge_safety(30, None, as_of=AS_OF)
+    assert other is not safety and not np.allclose(other, safety)
+
+
+def test_risk_weighted_costs_are_cached(accident_risk, snapshot):
+    engine = RouteEngine(snapshot)
+    safety = accident_risk.edge_safety(365, 90, as_of=AS_OF)
+    costs = engine.costs(0.5, 0.5, 0.0, safety)
+    assert engine.costs(0.5, 0.5, 0.0, accident_risk.edge_safety(365, 90, as_of=AS_OF)) is costs
+    np.testing.assert_allclose(np.asarray(costs), engine.edge_costs(0.5, 0.5, 0.0, safety))
+    # other safety scores, and none, get their own costs
+    assert engine.costs(0.5, 0.5, 0.0, accident_risk.edge_safety(30, None, as_of=AS_OF)) is not costs
+    assert engine.costs(0.5, 0.5, 0.0) is not costs
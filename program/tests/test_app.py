@@ -0,0 +1,94 @@
+import re
+import json
+import importlib
+
+import pytest
+
+import batch_routing
+
+
+@pytest.fixture(scope='module')
+def app_module(fixture_paths, tmp_path_factory):
+    """
+    The Flask app over the fixtures; the first station's bike count is blanked, as in a partial feed
+    """
+    with open(fixture_paths['stations'], encoding='utf-8') as f:
+        xml = re.sub(r'<nbBikes>\d+</nbBikes>', '<nbBikes></nbBikes>', f.read(), count=1)
+    stations_path = tmp_path_factory.mktemp('app') / 'stations.xml'
+    stations_path.write_text(xml, encoding='utf-8')
+
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv('GRAPHML_PATH', fixture_paths['graphml'])
+    monkeypatch.setenv('SNAPSHOT_PATH', fixture_paths['snapshot'])
+    monkeypatch.setenv('STATION_FEED_URL', str(stations_path))
+    app = importlib.import_module('app')
+    yield app
+    app.route_network.close()
+    monkeypatch.undo()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def test_search_station_without_bike_count(app_module, client):
+    table = app_module.route_network.station_df
+    blank = table[table['bikes'].isna()]
+    assert len(blank) == 1
+    response = client.get('/search', query_string={'query': blank['name'].iloc[0]})
+    assert response.status_code == 200
+    assert response.json[0]['name'] == blank['name'].iloc[0] and response.json[0]['bikes'] == 0
+
+    response = client.get('/search', query_string={'query': 'station', 'limit': 100})
+    assert response.status_code == 200 and len(response.json) == len(table)
+    bikes = [station['bikes'] for station in response.json]
+    assert bikes == sorted(bikes, reverse=True)
+
+
+@pytest.mark.parametrize('limit', ['abc', '0', '-3', ''])
+def test_search_rejects_invalid_limit(client, limit):
+    response = client.get('/search', query_string={'query': 'station', 'limit': limit})
+    assert response.status_code == 400
+
+
+def test_search_clamps_limit(client):
+    response = client.get('/search', query_string={'query': 'station', 'limit': 5})
+    assert len(response.json) == 5
+    response = client.get('/search', query_string={'query': 'station', 'limit': 10 ** 6})
+    assert response.status_code == 200
+
+
+def test_risk_without_accident_series(app_module, client):
+    assert app_module.route_network.accident_risk is None
+    names = app_module.route_network.station_df['name'].tolist()
+    response = client.get('/route', query_string={'start': names[0], 'end': names[1], 'risk_window': 365})
+    assert response.status_code == 400 and response.json['error'] == app_module.RISK_UNAVAILABLE
+    ids = app_module.route_network.station_df['id'].tolist()
+    response = client.post('/route/batch', json={'origins': ids[:1], 'destinations': ids[1:2], 'risk_half_life': 90})
+    assert response.status_code == 400 and response.json['error'] == app_module.RISK_UNAVAILABLE
+
+
+@pytest.mark.parametrize('failing_task', [0, 1])
+def test_batch_failure(app_module, client, monkeypatch, failing_task):
+    worker = batch_routing.BatchWorker
+    route, calls = worker.route, []
+
+    def failing_route(self, *args, **kwargs):
+        calls.append(None)
+        if len(calls) > failing_task:
+            raise RuntimeError("worker failed")
+        return route(self, *args, **kwargs)
+
+    monkeypatch.setattr(worker, 'route', failing_route)
+    ids = app_module.route_network.station_df['id'].tolist()
+    response = client.post('/route/batch', json={'origins': ids[:3], 'destinations': ids[3:6], 'distance': 1})
+    if failing_task == 0:
+        # nothing was sent yet: an error status
+        assert response.status_code == 500 and 'worker failed' in response.json['error']
+        return
+    # after the first results the stream ends with an error record
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert 'worker failed' in records[-1]['error']
+    assert records[:-1] and all('error' not in record for record in records[:-1])
@@ -0,0 +1,67 @@
+import logging
+
+import numpy as np
+import networkx as nx
+
+from contraction import ContractionHierarchy, build_contraction_hierarchy, save_hierarchy, verify
+
+
+def test_distances_match_networkx(network, snapshot, tmp_path):
+    ch_path = str(tmp_path / 'ch.npz')
+    save_hierarchy(build_contraction_hierarchy(snapshot), snapshot, ch_path)
+    hierarchy = ContractionHierarchy.load(snapshot, ch_path)
+
+    rng = np.random.default_rng(0)
+    for source, target in rng.integers(0, snapshot.n_nodes, size=(100, 2)).tolist():
+        cost, nodes = hierarchy.shortest_path(source, target)
+        source_id, target_id = int(snapshot.node_ids[source]), int(snapshot.node_ids[target])
+        try:
+            expected = nx.dijkstra_path_length(network, source_id, target_id, weight='length')
+        except nx.NetworkXNoPath:
+            assert nodes is None
+            continue
+        # the snapshot stores lengths as float32
+        assert abs(cost - expected) <= 1e-4 * max(expected, 1.0)
+        assert nodes[0] == source and nodes[-1] == target
+
+    assert verify(snapshot, hierarchy, network, pairs=50, seed=1) == []
+
+
+def test_stale_hierarchy_is_ignored(snapshot, tmp_path, caplog):
+    ch_path = str(tmp_path / 'ch.npz')
+    arrays = build_contraction_hierarchy(snapshot)
+    np.savez(ch_path, snapshot_version=np.array('another snapshot'), **arrays)
+
+    with caplog.at_level(logging.WARNING, logger='contraction'):
+        assert ContractionHierarchy.load(snapshot, ch_path) is None
+    assert 'built for another snapshot' in caplog.text
+    assert ContractionHierarchy.load(snapshot, str(tmp_path / 'missing.npz')) is None
+
+
+def test_distance_only_route_uses_hierarchy(make_route_network, network, snapshot, tmp_path, monkeypatch):
+    ch_path = str(tmp_path / 'ch.npz')
+    save_hierarchy(build_contraction_hierarchy(snapshot), snapshot, ch_path)
+    route_network = make_route_network(ch_path=ch_path)
+    hierarchy = route_network.ch
+    assert hierarchy is not None
+
+    queries = []
+    shortest_path = hierarchy.shortest_path
+    monkeypatch.setattr(hierarchy, 'shortest_path', lambda source, target: queries.append((source, target))
+                        or shortest_path(source, target))
+    find_k_best_routes = route_network.findKBestRoutes
+    searches = []
+    monkeypatch.setattr(route_network, 'findKBestRoutes', lambda *args, **kwargs: searches.append(args)
+                        or find_k_best_routes(*args, **kwargs))
+
+    stations = route_network.station_df[route_network.station_df['valid']]
+    start, end = stations['name'].iloc[0], stations['name'].iloc[-1]
+    routes = route_network.plan_cycle_route(start, end, 1.0, 0.0, 0.0, candidates=1)
+    assert len(routes) == 1 and len(queries) == 1 and not searches
+    node_ids = routes[0].node_ids(snapshot)
+    expected = nx.dijkstra_path_length(network, node_ids[0], node_ids[-1], weight='length')
+    assert abs(routes[0].total_length - expected) <= 1e-4 * max(expected, 1.0)
+
+    # any safety or comfort weight needs the multi-criteria search
+    routes = route_network.plan_cycle_route(start, end, 0.5, 0.5, 0.0, candidates=1)
+    assert len(queries) == 1 and len(searches) == 1 and len(routes) > 1
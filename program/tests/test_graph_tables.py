@@ -0,0 +1,46 @@
+from graph_tables import GraphTables
+
+
+# Valid GraphML the way other writers may produce it: single quotes, other attribute orders, an XML
+# comment, CDATA, character entities, values split across lines and graph data after the elements
+UNUSUAL_GRAPHML = """<?xml version='1.0' encoding='utf-8'?>
+<graphml xmlns='http://graphml.graphdrawing.org/xmlns'>
+  <key attr.type='string' attr.name='name' for='edge' id='d1'/>
+  <key id="d0" for="node" attr.name="y" attr.type="double"/>
+  <key for='graph' id='d2' attr.name='crs' attr.type='string'/>
+  <graph edgedefault='directed'>
+    <node id='1'><data key='d0'>51.5</data></node>
+    <!-- a comment between elements -->
+    <node id="2">
+      <data key="d0">
+        51.6</data>
+    </node>
+    <edge target='2' id='0' source='1'><data key='d1'><![CDATA[Bank <& Monument>]]></data></edge>
+    <edge source="1" target="2" id="1"><data key="d1">King&apos;s &amp; Queen&#8217;s
+Road</data></edge>
+    <edge id='0' target='1' source='2'/>
+    <data key='d2'>epsg:4326</data>
+  </graph>
+</graphml>
+"""
+
+
+def test_read_matches_graph_tables(network, fixture_paths):
+    tables = GraphTables.read_graphml(fixture_paths['graphml'])
+    expected = GraphTables.from_graph(network)
+    assert len(tables.nodes) == network.number_of_nodes() and len(tables.edges) == network.number_of_edges()
+    for read, built in ((tables.nodes, expected.nodes), (tables.edges, expected.edges)):
+        read = read[sorted(read.columns)]
+        assert read.equals(built[sorted(built.columns)])
+
+
+def test_read_unusual_graphml(tmp_path):
+    path = tmp_path / 'unusual.graphml'
+    path.write_text(UNUSUAL_GRAPHML, encoding='utf-8')
+    tables = GraphTables.read_graphml(str(path))
+
+    assert tables.graph_attrs == {'crs': 'epsg:4326'}
+    assert tables.nodes['node'].tolist() == [1, 2]
+    assert [float(y) for y in tables.nodes['y']] == [51.5, 51.6]
+    assert tables.edges[['u', 'v', 'key']].values.tolist() == [[1, 2, 0], [1, 2, 1], [2, 1, 0]]
+    assert tables.edges['name'].tolist() == ['Bank <& Monument>', "King's & Queen\u2019s\nRoad", None]
@@ -0,0 +1,134 @@
+import logging
+import math
+import threading
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import synthetic_network
+from contraction import build_contraction_hierarchy, save_hierarchy
+from graph_snapshot import GraphSnapshot, compile_snapshot
+from graph_tiles import GraphTiles, TiledRouteEngine, build_tiles
+from route_engine import RouteEngine
+from route_network import NOT_LOADED
+
+
+# Small tiles so the 20 × 20 fixture grid spans about 20 of them
+TEST_TILE_SIZE = 0.005
+WEIGHTS = [(1.0, 0.0, 0.0), (0.25, 0.5, 0.25), (0.0, 0.0, 1.0)]
+
+
+@pytest.fixture(scope='module')
+def split_network(network):
+    """
+    The fixture grid plus an island grid over its middle (another component sharing its tiles) and
+    a dead end reached by a one-way street (reachable, but nothing is reachable from it)
+    """
+    island = synthetic_network(size=4, seed=1)
+    island = nx.relabel_nodes(island, {node: node + 2_000_000 for node in island.nodes})
+    for _, data in island.nodes(data=True):
+        data['y'] += 0.008
+        data['x'] += 0.012
+    G = nx.compose(network, island)
+
+    entry = next(iter(network.nodes))
+    G.add_node(4_000_000, **{**network.nodes[entry], 'y': network.nodes[entry]['y'] - 0.006})
+    G.add_edge(entry, 4_000_000, key=0, **next(iter(network[entry].values()))[0])
+    return G
+
+
+@pytest.fixture(scope='module')
+def engines(split_network, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('split'))
+    compile_snapshot(split_network, path)
+    snapshot = GraphSnapshot.load(path)
+    tiles_path = str(tmp_path_factory.mktemp('tiles'))
+    build_tiles(snapshot, tiles_path, tile_size=TEST_TILE_SIZE)
+    # few resident tiles, so long searches also evict and reload tiles
+    return snapshot, RouteEngine(snapshot), TiledRouteEngine(GraphTiles.load(snapshot, tiles_path), max_tiles=4)
+
+
+def tile_of(tiled, node):
+    tiles = tiled.tiles
+    return int(np.searchsorted(tiles.tile_offsets, tiles.tiled_index[node], side='right')) - 1
+
+
+def assert_same_cost(engine, tiled, source, target, weights):
+    expected, expected_path = engine.shortest_path(source, target, engine.costs(*weights),
+                                                   engine.potentials(source, target, weights[0]))
+    found, path = tiled.shortest_path(source, target, *weights)
+    if math.isinf(expected):
+        assert math.isinf(found) and path is None
+        return
+    assert found == pytest.approx(expected, rel=1e-9)
+    assert engine.path_nodes(source, path)[-1] == target
+    assert tiled.path_nodes(source, path) == engine.path_nodes(source, path)
+
+
+def test_costs_match_across_tile_boundaries(engines):
+    snapshot, engine, tiled = engines
+    assert tiled.tiles.n_tiles > 10
+    main = np.flatnonzero(snapshot.node_ids < 2_000_000)
+    rng = np.random.default_rng(0)
+    pairs = [(int(a), int(b)) for a, b in rng.choice(main, size=(60, 2))]
+    pairs = [(a, b) for a, b in pairs if tile_of(tiled, a) != tile_of(tiled, b)]
+    assert len(pairs) >= 30
+    for weights in WEIGHTS:
+        for source, target in pairs:
+            assert_same_cost(engine, tiled, source, target, weights)
+    assert tiled.loads > tiled.tiles.n_tiles
+
+
+def test_unreachable_targets(engines):
+    snapshot, engine, tiled = engines
+    main = snapshot.node_index(next(iter(sorted(snapshot.node_ids.tolist()))))
+    far_main = snapshot.node_index(int(snapshot.node_ids[snapshot.node_ids < 2_000_000].max()))
+    island = snapshot.node_index(2_000_000 + 1_000_005)
+    dead_end = snapshot.node_index(4_000_000)
+    assert tiled.tiles.component[island] != tiled.tiles.component[main]
+
+    for weights in WEIGHTS:
+        for source, target in [(main, island), (island, far_main), (dead_end, far_main), (far_main, dead_end)]:
+            assert_same_cost(engine, tiled, source, target, weights)
+    assert math.isinf(tiled.shortest_path(main, island, *WEIGHTS[0])[0])
+    assert math.isinf(tiled.shortest_path(dead_end, far_main, *WEIGHTS[0])[0])
+    assert not math.isinf(tiled.shortest_path(far_main, dead_end, *WEIGHTS[0])[0])
+
+
+def test_stale_tiles_are_ignored(snapshot, engines, tmp_path, caplog):
+    split_snapshot, _, tiled = engines
+    with caplog.at_level(logging.WARNING, logger='graph_tiles'):
+        assert GraphTiles.load(snapshot, tiled.tiles.path) is None
+    assert 'built for another snapshot' in caplog.text
+    assert GraphTiles.load(split_snapshot, str(tmp_path)) is None
+
+
+def test_tiled_route_network(make_route_network, snapshot, tmp_path):
+    tiles_path, ch_path = str(tmp_path / 'tiles'), str(tmp_path / 'ch.npz')
+    build_tiles(snapshot, tiles_path, tile_size=TEST_TILE_SIZE)
+    save_hierarchy(build_contraction_hierarchy(snapshot), snapshot, ch_path)
+    tiled = make_route_network(tiles_path=tiles_path, ch_path=ch_path)
+    whole = make_route_network(ch_path=ch_path)
+
+    # the whole-graph structures are not loaded at startup
+    assert tiled.tiled_engine is not None and tiled._engine is None and tiled.ch is None
+    assert tiled._accident_risk is NOT_LOADED
+    stations = tiled.station_df[tiled.station_df['valid']]
+    start, end = stations['name'].iloc[0], stations['name'].iloc[-1]
+    for weights in [(1.0, 0.0, 0.0), (0.0, 0.0, 0.0)]:
+        # the shortest route first: the hierarchy's single route, or the best of the tiled alternatives
+        route = tiled.plan_cycle_route(start, end, *weights, candidates=1)[0]
+        expected = whole.plan_cycle_route(start, end, *weights, candidates=1)[0]
+        assert route.total_length == pytest.approx(expected.total_length, rel=1e-6)
+    assert tiled._engine is None
+
+    # batches build the whole-graph engine on first use
+    ids = stations['id'].tolist()
+    frames = []
+    batch = threading.Thread(target=lambda: frames.extend(tiled.plan_batch_routes(ids[:2], ids[2:4], 1.0, 0.0, 0.0)),
+                             daemon=True)
+    batch.start()
+    batch.join(timeout=30)
+    assert not batch.is_alive()
+    assert sum(len(frame) for frame in frames) == 2 and tiled._engine is not None
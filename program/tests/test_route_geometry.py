@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from route_engine import RouteEngine
+from route_geometry import edge_polyline, encode_polyline, decode_polyline, pack_routes, unpack_routes
+
+
+# Example of the Google encoded polyline algorithm documentation
+REFERENCE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+REFERENCE_POLYLINE = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+@pytest.fixture(scope='module')
+def snapshot_routes(snapshot):
+    """
+    Point arrays of a few shortest routes across the fixture grid
+    """
+    engine = RouteEngine(snapshot)
+    costs = engine.costs(1.0, 0.0, 0.0)
+    rng = np.random.default_rng(0)
+    routes = []
+    for source, target in rng.integers(0, snapshot.n_nodes, size=(10, 2)).tolist():
+        _, path = engine.shortest_path(source, target, costs, engine.potentials(source, target, 1.0))
+        if path:
+            routes.append(edge_polyline(snapshot, path))
+    return routes
+
+
+def test_reference_polyline():
+    assert encode_polyline(REFERENCE_POINTS) == REFERENCE_POLYLINE
+    np.testing.assert_allclose(decode_polyline(REFERENCE_POLYLINE), REFERENCE_POINTS)
+    assert encode_polyline([]) == ''
+    assert decode_polyline('').shape == (0, 2)
+
+
+def test_snapshot_route_round_trip(snapshot, snapshot_routes):
+    assert snapshot_routes
+    for points in snapshot_routes:
+        assert points.shape[1] == 2
+        # (lat, lon) order, on the fixture grid over London
+        assert (np.abs(points[:, 0] - 51.5) < 0.1).all() and (np.abs(points[:, 1] + 0.15) < 0.1).all()
+        decoded = decode_polyline(encode_polyline(points))
+        assert decoded.shape == points.shape
+        assert np.abs(decoded - points).max() <= 0.5e-5 + 1e-9
+        # precision 6 keeps one more decimal
+        assert np.abs(decode_polyline(encode_polyline(points, 6), 6) - points).max() <= 0.5e-6 + 1e-9
+
+
+def test_pack_round_trip(snapshot_routes):
+    routes = snapshot_routes + [np.zeros((0, 2))]
+    unpacked = unpack_routes(pack_routes(routes))
+    assert len(unpacked) == len(routes)
+    for points, restored in zip(routes, unpacked):
+        assert restored.shape == points.shape
+        np.testing.assert_allclose(restored, points.astype(np.float32))
+    assert unpack_routes(pack_routes([])) == []
@@ -0,0 +1,74 @@
+import io
+
+import numpy as np
+import pytest
+
+import station_routes
+from graph_snapshot import GraphSnapshot, compile_snapshot
+from station_routes import StationRouteStore
+from tfl_feed import parse_station_feed
+
+
+N_STORE_STATIONS = 6
+
+
+@pytest.fixture(scope='module')
+def station_df(fixture_paths):
+    with open(fixture_paths['stations'], 'rb') as f:
+        return parse_station_feed(io.BytesIO(f.read())).head(N_STORE_STATIONS)
+
+
+@pytest.fixture(scope='module')
+def rescored_snapshot_path(network, tmp_path_factory):
+    """
+    The fixture network with the safety score of a tenth of its streets changed: same topology,
+    another snapshot version
+    """
+    G = network.copy()
+    rng = np.random.default_rng(1)
+    for u, v, key, data in G.edges(keys=True, data=True):
+        if rng.random() < 0.1:
+            G[u][v][key]['safety_score'] = data['safety_score'] + 3.0
+    path = str(tmp_path_factory.mktemp('rescored'))
+    compile_snapshot(G, path)
+    return path
+
+
+def stored_routes(store, station_df, pairs=None):
+    ids = station_df['id'].tolist()
+    pairs = pairs or [(origin, dest) for origin in ids for dest in ids if origin != dest]
+    routes = {}
+    for origin, dest in pairs:
+        df = store.lookup(origin, dest)
+        routes[origin, dest] = [] if df.empty else [edges.tolist() for edges in df['edges']]
+    return routes
+
+
+def test_interrupted_refresh_resumes(station_df, snapshot_path, rescored_snapshot_path, tmp_path, monkeypatch):
+    store = StationRouteStore(str(tmp_path / 'store'))
+    store.precompute(station_df, snapshot_path, k=2, processes=1)
+    snapshot = GraphSnapshot.load(snapshot_path)
+    rescored = GraphSnapshot.load(rescored_snapshot_path)
+    assert StationRouteStore.open(snapshot, store.path) is not None
+    assert all(stored_routes(store, station_df).values())
+
+    def interrupted(path, df):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(station_routes, '_write_shard', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        store.precompute(station_df, rescored_snapshot_path, k=2, processes=1, old_snapshot_path=snapshot_path)
+    monkeypatch.undo()
+
+    # the store is for the new snapshot, but the pairs still to refresh are not served
+    store = StationRouteStore.open(rescored, store.path)
+    pending = [(int(origin), dest) for origin, dests in store.manifest['pending'].items() for dest in dests]
+    assert pending
+    assert not any(stored_routes(store, station_df, pending).values())
+
+    # the next run resumes the refresh without the old snapshot
+    store.precompute(station_df, rescored_snapshot_path, k=2, processes=1)
+    assert store.manifest['pending'] == {}
+    fresh = StationRouteStore(str(tmp_path / 'fresh'))
+    fresh.precompute(station_df, rescored_snapshot_path, k=2, processes=1)
+    assert stored_routes(store, station_df, pending) == stored_routes(fresh, station_df, pending)
@@ -0,0 +1,149 @@
+import io
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.fixtures import station_feed_xml
+from tfl_feed import StationFeed, STATION_COLUMNS, parse_station_feed, diff_stations
+
+
+@pytest.fixture(scope='module')
+def feed_xml(snapshot):
+    return station_feed_xml(snapshot, n_stations=30, seed=0)
+
+
+@pytest.fixture
+def feed_server(feed_xml):
+    """
+    Local HTTP server for the feed: serves state['body'] with state['etag'] and answers 304 to a
+    matching If-None-Match. Yields (url, state); state['requests'] records the request headers.
+    """
+    state = {'body': feed_xml.encode(), 'etag': '"v1"', 'requests': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['requests'].append(dict(self.headers))
+            if self.headers.get('If-None-Match') == state['etag']:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('ETag', state['etag'])
+            self.send_header('Content-Length', str(len(state['body'])))
+            self.end_headers()
+            self.wfile.write(state['body'])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/feed.xml', state
+    server.shutdown()
+    server.server_close()
+
+
+def with_bikes(xml, station_id, bikes):
+    """
+    The feed with the bike count of one station changed
+    """
+    table = parse_station_feed(io.StringIO(xml))
+    old = int(table.loc[table['id'] == station_id, 'bikes'].iloc[0])
+    start = xml.index(f'<id>{station_id}</id>')
+    end = xml.index('</station>', start)
+    station = xml[start:end].replace(f'<nbBikes>{old}</nbBikes>', f'<nbBikes>{bikes}</nbBikes>')
+    return xml[:start] + station + xml[end:]
+
+
+def test_parse_fixture_feed(feed_xml):
+    table = parse_station_feed(io.StringIO(feed_xml))
+    assert list(table.columns) == STATION_COLUMNS
+    assert len(table) == 30
+    assert table['id'].tolist() == list(range(1, 31))
+    assert (table['valid'] == (table['bikes'] >= 1)).all()
+    assert table['name'].str.endswith('Fixture').all()
+
+
+def test_diff_stations(feed_xml):
+    old = parse_station_feed(io.StringIO(feed_xml))
+    new = old[old['id'] != 1].copy()
+    new.loc[new['id'] == 2, 'lat'] += 0.001
+    new.loc[new['id'] == 3, 'bikes'] += 1
+    new.loc[len(old)] = new.iloc[0].to_dict() | {'id': 99}
+
+    diff = diff_stations(old, new)
+    assert diff == {'added': [99], 'removed': [1], 'moved': [2], 'availability': [3]}
+    assert diff_stations(None, old)['added'] == old['id'].tolist()
+    assert not any(diff_stations(old, old.copy()).values())
+
+
+def test_conditional_get(feed_server, feed_xml):
+    url, state = feed_server
+    feed = StationFeed(url)
+
+    diff = feed.refresh()
+    assert diff['added'] == list(range(1, 31))
+    assert len(feed.table) == 30
+
+    assert feed.refresh() is None
+    assert state['requests'][-1]['If-None-Match'] == '"v1"'
+    assert (feed.fetches, feed.not_modified, feed.errors) == (2, 1, 0)
+
+    state['body'] = with_bikes(feed_xml, 5, 42).encode()
+    state['etag'] = '"v2"'
+    diff = feed.refresh()
+    assert diff == {'added': [], 'removed': [], 'moved': [], 'availability': [5]}
+    assert int(feed.table.loc[feed.table['id'] == 5, 'bikes'].iloc[0]) == 42
+
+
+def test_failed_subscriber_keeps_table(feed_server, feed_xml):
+    url, state = feed_server
+    feed = StationFeed(url)
+    feed.refresh()
+    table = feed.table
+
+    received = []
+
+    def subscriber(new_table, diff):
+        if not received:
+            received.append(None)
+            raise RuntimeError("subscriber failed")
+        received.append(diff)
+
+    feed.subscribe(subscriber)
+    state['body'] = with_bikes(feed_xml, 5, 42).encode()
+    state['etag'] = '"v2"'
+    with pytest.raises(RuntimeError):
+        feed.refresh()
+    assert feed.table is table
+
+    # the next refresh fetches the document again instead of getting a 304
+    diff = feed.refresh()
+    assert 'If-None-Match' not in state['requests'][-1]
+    assert diff['availability'] == [5] and received[-1] == diff
+    assert int(feed.table.loc[feed.table['id'] == 5, 'bikes'].iloc[0]) == 42
+
+
+def test_polling_survives_errors(feed_server):
+    url, _ = feed_server
+    feed = StationFeed(url, interval=0.01)
+    failures = []
+
+    def subscriber(new_table, diff):
+        if len(failures) < 2:
+            failures.append(diff)
+            raise RuntimeError("subscriber failed")
+
+    feed.subscribe(subscriber)
+    feed.start()
+    try:
+        deadline = time.time() + 5
+        while feed.table.empty and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        feed.stop()
+    assert len(feed.table) == 30
+    assert feed.errors == 2
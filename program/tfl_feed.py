@@ -0,0 +1,226 @@
+import io
+import os
+import time
+import logging
+import threading
+import requests
+import numpy as np
+import pandas as pd
+import xml.etree.ElementTree as ET
+
+
+logger = logging.getLogger(__name__)
+
+TFL_FEED_URL = "https://tfl.gov.uk/tfl/syndication/feeds/cycle-hire/livecyclehireupdates.xml"
+
+# column -> (XML tag, parser) of every station field kept in the station table
+STATION_FIELDS = {
+    'id': ('id', int),
+    'name': ('name', lambda text: text.strip()),
+    'lat': ('lat', float),
+    'lon': ('long', float),
+    'bikes': ('nbBikes', int),
+    'standardBikes': ('nbStandardBikes', int),
+    'eBikes': ('nbEBikes', int),
+    'docks': ('nbEmptyDocks', int),
+}
+
+STATION_COLUMNS = ['valid'] + list(STATION_FIELDS)
+LOCATION_COLUMNS = ['name', 'lat', 'lon']
+AVAILABILITY_COLUMNS = ['bikes', 'standardBikes', 'eBikes', 'docks', 'valid']
+
+
+def parse_station_feed(source):
+    """
+    Stream-parse a livecyclehireupdates XML document (path or file object) into a station DataFrame.
+    Stations are cleared from the tree as soon as they are read, so memory stays flat.
+    """
+    columns = {column: [] for column in STATION_COLUMNS}
+    for _, elem in ET.iterparse(source, events=('end',)):
+        if elem.tag != 'station':
+            continue
+        values = {}
+        try:
+            for column, (tag, parse) in STATION_FIELDS.items():
+                values[column] = parse(elem.find(tag).text)
+            # If there is at least one bike at the site it is considered available, otherwise invalid
+            values['valid'] = values['bikes'] >= 1
+        except (AttributeError, ValueError, TypeError) as e:
+            logger.warning("Parsing site error: %s", e)
+            values['valid'] = False
+        elem.clear()
+
+        if 'id' not in values:
+            continue  # a station without id cannot be tracked across refreshes
+        for column in STATION_COLUMNS:
+            columns[column].append(values.get(column))
+
+    df = pd.DataFrame(columns, columns=STATION_COLUMNS)
+    return df.astype({'valid': bool})
+
+
+def diff_stations(old, new):
+    """
+    Compare two station tables by id. Return a dict of id lists: added, removed,
+    moved (name or coordinates changed) and availability (bike/dock counts changed).
+    """
+    if old is None or old.empty:
+        return {'added': new['id'].tolist(), 'removed': [], 'moved': [], 'availability': []}
+
+    old_ids, new_ids = set(old['id']), set(new['id'])
+    common = old.set_index('id').join(new.set_index('id'), how='inner', lsuffix='_old')
+
+    def changed(columns):
+        mask = np.zeros(len(common), dtype=bool)
+        for column in columns:
+            old_values, new_values = common[f'{column}_old'], common[column]
+            mask |= (~((old_values == new_values) | (old_values.isna() & new_values.isna()))).values
+        return common.index[mask].tolist()
+
+    return {
+        'added': sorted(new_ids - old_ids),
+        'removed': sorted(old_ids - new_ids),
+        'moved': changed(LOCATION_COLUMNS),
+        'availability': changed(AVAILABILITY_COLUMNS),
+    }
+
+
+class StationFeed:
+    """
+    Keeps the TfL station table up to date from the livecyclehireupdates feed.
+
+    refresh() does one conditional GET (ETag / If-Modified-Since) and, when the document changed,
+    parses it and swaps in a new table; readers only ever see a complete table. start() runs refresh()
+    on a background daemon thread every `interval` seconds. The URL may also be a local file path
+    (or file:// URL), which is handy for fixtures.
+    """
+
+    def __init__(self, url=TFL_FEED_URL, interval=60, timeout=10):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.table = pd.DataFrame(columns=STATION_COLUMNS)
+        self._etag = None
+        self._last_modified = None
+        self._subscribers = []
+        self._lock = threading.Lock()  # serializes refreshes, readers never take it
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_fetch = None       # time of the last successful fetch (including 304s)
+        self.last_change = None      # time the table last changed
+        self.last_parse_sec = None
+        self.fetches = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def subscribe(self, callback):
+        """
+        Register callback(table, diff), called from the refreshing thread after every change and
+        before the new table is published. If a callback raises, the table is not swapped in and
+        refresh() raises.
+        """
+        self._subscribers.append(callback)
+
+    def _fetch(self):
+        """
+        Return the raw document, or None if it has not changed since the last fetch
+        """
+        path = self.url[len('file://'):] if self.url.startswith('file://') else self.url
+        if os.path.exists(path):
+            mtime = os.path.getmtime(path)
+            if mtime == self._last_modified:
+                return None
+            self._last_modified = mtime
+            with open(path, 'rb') as f:
+                return f.read()
+
+        headers = {}
+        if self._etag:
+            headers['If-None-Match'] = self._etag
+        if self._last_modified:
+            headers['If-Modified-Since'] = self._last_modified
+        response = requests.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        self._etag = response.headers.get('ETag')
+        self._last_modified = response.headers.get('Last-Modified')
+        return response.content
+
+    def refresh(self):
+        """
+        Fetch and apply the feed once. Return the diff if the table changed, otherwise None.
+        """
+        with self._lock:
+            try:
+                content = self._fetch()
+            except requests.exceptions.RequestException as e:
+                self.errors += 1
+                logger.warning("Network request failed: %s", e)
+                return None
+            self.fetches += 1
+            self.last_fetch = time.time()
+            if content is None:
+                self.not_modified += 1
+                return None
+
+            start_time = time.perf_counter()
+            try:
+                new_table = parse_station_feed(io.BytesIO(content))
+            except ET.ParseError as e:
+                self.errors += 1
+                logger.warning("XML parsing failed: %s", e)
+                return None
+            self.last_parse_sec = time.perf_counter() - start_time
+
+            diff = diff_stations(self.table, new_table)
+            if not any(diff.values()):
+                return None
+            try:
+                for callback in self._subscribers:
+                    callback(new_table, diff)
+            except Exception:
+                # keep the old table and forget the validators, so the next refresh fetches the
+                # document again and delivers the same diff instead of getting a 304
+                self._etag = None
+                self._last_modified = None
+                raise
+            self.table = new_table
+            self.last_change = self.last_fetch
+            return diff
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                # one bad document or subscriber must not stop the polling
+                self.errors += 1
+                logger.exception("Station feed refresh failed")
+
+    def start(self):
+        """
+        Start polling the feed in the background
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='tfl-feed', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def metrics(self):
+        now = time.time()
+        return {
+            'feed_age_sec': now - self.last_fetch if self.last_fetch else None,
+            'data_age_sec': now - self.last_change if self.last_change else None,
+            'last_parse_sec': self.last_parse_sec,
+            'fetches': self.fetches,
+            'not_modified': self.not_modified,
+            'errors': self.errors,
+            'stations': len(self.table),
+        }